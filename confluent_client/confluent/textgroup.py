@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import difflib
+import hashlib
 import re
 import sys
 
@@ -21,6 +22,11 @@ try:
 except NameError:
     pass
 
+try:
+    intern = sys.intern
+except AttributeError:
+    pass
+
 
 
 numregex = re.compile('([0-9]+)')
@@ -95,31 +101,66 @@ class GroupedData(object):
 
     def __init__(self, confluentconnection=None):
         self.bynode = {}
+        self.bydigest = {}
         self.byoutput = {}
         self.header = {}
         self.client = confluentconnection
         self.detectedpad = None
 
     def generate_byoutput(self):
+        # Nodes are grouped by the digest of their lines as added, so only
+        # one output per distinct digest is assembled
+        bysum = {}
+        for n in self.bydigest:
+            bysum.setdefault(self.bydigest[n].digest(), []).append(n)
         self.byoutput = {}
         thepad = self.detectedpad if self.detectedpad else ''
-        for n in self.bynode:
-            output = ''
-            for ln in self.bynode[n]:
-                output += ln.replace(thepad, '', 1) + '\n'
+        for nodes in bysum.values():
+            output = ''.join([ln.replace(thepad, '', 1) + '\n'
+                              for ln in self.bynode[nodes[0]]])
             if output not in self.byoutput:
-                self.byoutput[output] = set([n])
+                self.byoutput[output] = set(nodes)
             else:
-                self.byoutput[output].add(n)
+                self.byoutput[output].update(nodes)
 
     def add_line(self, node, line):
-        wspc = re.search(r'^\s*', line).group()
-        if self.detectedpad is None or len(wspc) < len(self.detectedpad):
-            self.detectedpad = wspc
+        padlen = len(line) - len(line.lstrip())
+        if self.detectedpad is None or padlen < len(self.detectedpad):
+            self.detectedpad = line[:padlen]
+        line = intern(line)
         if node not in self.bynode:
             self.bynode[node] = [line]
+            self.bydigest[node] = hashlib.sha256()
         else:
             self.bynode[node].append(line)
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8', 'surrogatepass')
+        self.bydigest[node].update(line + b'\n')
+
+    def abbreviate_groups(self, groups):
+        """Look up the noderange text of many groups in one request
+
+        :param groups: Iterable of sets of nodes
+        """
+        if not self.client:
+            return
+        pending = {}
+        for nodes in groups:
+            headerkey = ','.join(sorted(nodes))
+            if headerkey not in self.header:
+                pending[headerkey] = sorted(nodes)
+        if not pending:
+            return
+        headerkeys = list(pending)
+        for reply in self.client.create(
+                '/noderange//abbreviate',
+                {'nodelists': [pending[key] for key in headerkeys]}):
+            if len(reply.get('noderanges', ())) == len(headerkeys):
+                for headerkey, noderange in zip(headerkeys,
+                                                reply['noderanges']):
+                    self.header[headerkey] = noderange
+        # If the server cannot abbreviate in bulk, get_group_text will ask
+        # about each group instead
 
     def get_group_text(self, nodes):
         if self.client:
@@ -138,6 +179,7 @@ class GroupedData(object):
     def print_all(self, output=sys.stdout, skipmodal=False, reverse=False,
                   count=False):
         self.generate_byoutput()
+        self.abbreviate_groups(self.byoutput.values())
 
         if reverse:
             outdatalist = sorted(
@@ -178,6 +220,7 @@ class GroupedData(object):
     def print_deviants(self, output=sys.stdout, skipmodal=False, reverse=False,
                        count=False, basenode=None):
         self.generate_byoutput()
+        self.abbreviate_groups(self.byoutput.values())
         modaloutput = None
         ismodal = True
         revoutput = []
@@ -30,12 +30,17 @@ import sys
 import aiohmi.constants as const
 import aiohmi.exceptions as exc
 import aiohmi.redfish.oem.lookup as oem
+import aiohmi.util.bulk as bulk
 from aiohmi.util.parse import parse_time
 import aiohmi.util.webclient as webclient
 
 
 numregex = re.compile('([0-9]+)')
 
+# Sensor catalogs by BMC model and firmware, shared by every Command to a BMC
+# of that kind and, given a cache directory, persisted across runs
+shared_sensorcatalogs = {}
+
 
 powerstates = {
     'on': 'On',
@@ -178,6 +183,7 @@ class Command(object):
         self._varfwinventory = None
         self._oem = None
         self._gpool = pool
+        self._bulkfetcher = None
         self._bmcv4ip = None
         self._bmcv6ip = None
         self.xauthtoken = None
@@ -204,6 +210,7 @@ class Command(object):
         if 'SessionService' in overview:
             await self._get_session_token(self.wc)
         self._varsensormap = {}
+        self._sensorcachedir = None
         self.powerurl = None
         self.sysurl = None
         self._initsysurl = sysurl
@@ -217,6 +224,21 @@ class Command(object):
                 '#ComputerSystem.Reset', {}).get('target', None)               
         return self
 
+    def set_sensor_cachedir(self, path):
+        """Register use of a directory for the sensor catalog cache.
+
+        The catalog of sensors discovered for a BMC model and firmware is kept
+        there, so it need not be rediscovered member by member run to run.
+
+        :param path:
+        :return:
+        """
+        self._sensorcachedir = path
+
+    def close(self):
+        """Release the connections held open to the BMC"""
+        self.wc.close()
+
     async def _get_session_token(self, wc):
         # specification actually indicates we can skip straight to this url
         username = self.username
@@ -567,13 +589,11 @@ class Command(object):
         return None
 
     async def _do_bulk_requests(self, urls, cache=True):
-        if self._gpool:
-            urls = [(x, None, None, cache) for x in urls]
-            for res in self._gpool.starmap(self._do_web_request_withurl, urls):
-                yield res
-        else:
-            for url in urls:
-                yield await self._do_web_request_withurl(url, cache=cache)
+        if self._bulkfetcher is None:
+            self._bulkfetcher = bulk.BulkFetcher(
+                self._do_web_request_withurl, webclient.MAX_CONNECTIONS)
+        async for res in self._bulkfetcher.fetch(urls, cache):
+            yield res
 
     async def _do_web_request_withurl(self, url, payload=None, method=None,
                                 cache=True):
@@ -729,20 +749,82 @@ class Command(object):
 
     async def _sensormap(self):
         if not self._varsensormap:
+            catalog = await self._get_sensor_catalog()
             sysinfo = await self.sysinfo()
+            chassislist = []
             if sysinfo:
-                for chassis in sysinfo.get('Links', {}).get('Chassis', []):
-                    await self._mapchassissensors(chassis)
+                chassislist = sysinfo.get('Links', {}).get('Chassis', [])
             else:  # no system, but check if this is a singular chassis
                 rootinfo = await self._do_web_request('/redfish/v1/')
                 chassiscol = rootinfo.get('Chassis', {}).get('@odata.id', '')
                 if chassiscol:
-                    chassislist = await self._do_web_request(chassiscol)
-                    if len(chassislist.get('Members', [])) == 1:
-                        await self._mapchassissensors(chassislist['Members'][0])
+                    chassiscoll = await self._do_web_request(chassiscol)
+                    if len(chassiscoll.get('Members', [])) == 1:
+                        chassislist = chassiscoll['Members'][:1]
+            sensorlists = await asyncio.gather(*[
+                self._mapchassissensors(chassis, catalog)
+                for chassis in chassislist])
+            # Applied in the order the chassis were walked, so that a name
+            # shared by two chassis resolves the same way as a serial walk
+            for sensorlist in sensorlists:
+                for sensor in sensorlist:
+                    self._varsensormap[sensor['name']] = sensor
+            if catalog is not None and catalog.get('dirty', False):
+                self._write_sensor_catalog(catalog)
         return self._varsensormap
 
-    async def _mapchassissensors(self, chassis):
+    async def _get_sensor_catalog(self):
+        """Find the sensor catalog shared by BMCs of this model and firmware
+
+        The catalog holds the name and type of each member of a Sensors
+        collection by url, so that the members need not each be fetched to
+        learn what they are.  Returns None if the BMC does not say enough
+        about itself to key the catalog on.
+        """
+        try:
+            bmcinfo = await self._do_web_request(await self.get_bmcurl())
+        except Exception:
+            return None
+        model = bmcinfo.get('Model', None)
+        fwversion = bmcinfo.get('FirmwareVersion', None)
+        if not model or not fwversion:
+            return None
+        cachekey = (model, fwversion)
+        if cachekey in shared_sensorcatalogs:
+            return shared_sensorcatalogs[cachekey]
+        catalog = {'key': cachekey, 'sensors': {}, 'dirty': False}
+        cachefilename = self._sensor_catalog_filename(cachekey)
+        if cachefilename and os.path.isfile(cachefilename):
+            try:
+                with open(cachefilename, 'r') as cfile:
+                    catalog['sensors'] = json.load(cfile)
+            except (OSError, ValueError):
+                catalog['sensors'] = {}
+        shared_sensorcatalogs[cachekey] = catalog
+        return catalog
+
+    def _sensor_catalog_filename(self, cachekey):
+        if not self._sensorcachedir:
+            return None
+        return os.path.join(
+            self._sensorcachedir, 'sensorcache-1.{0}.{1}'.format(
+                *[re.sub('[^A-Za-z0-9_.-]', '_', x) for x in cachekey]))
+
+    def _write_sensor_catalog(self, catalog):
+        catalog['dirty'] = False
+        cachefilename = self._sensor_catalog_filename(catalog['key'])
+        if not cachefilename:
+            return
+        suffix = os.urandom(6).hex()
+        try:
+            with open(cachefilename + '.' + suffix, 'w') as cfile:
+                json.dump(catalog['sensors'], cfile)
+            os.rename(cachefilename + '.' + suffix, cachefilename)
+        except OSError:
+            pass
+
+    async def _mapchassissensors(self, chassis, catalog=None):
+        sensorlist = []
         chassisurl = chassis['@odata.id']
         chassisinfo = await self._do_web_request(chassisurl)
         sensors = None
@@ -751,38 +833,56 @@ class Command(object):
             sensors = chassisinfo.get('Sensors', {}).get('@odata.id', '')
         if sensors:
             sensorinf = await self._do_web_request(sensors)
-            for sensor in sensorinf.get('Members', []):
-                sensedata = await self._do_web_request(sensor['@odata.id'])
+            senseurls = [x['@odata.id'] for x in sensorinf.get('Members', [])]
+            known = {}
+            if catalog is not None:
+                known = catalog['sensors']
+            newurls = [x for x in senseurls if x not in known]
+            fetched = {}
+            async for sensedata, senseurl in self._do_bulk_requests(newurls):
                 if 'Name' in sensedata:
                     sensetype = sensedata.get('ReadingType', 'Unknown')
                     sensetype = _readingtypes.get(sensetype, sensetype)
-                    self._varsensormap[sensedata['Name']] = {
-                        'name': sensedata['Name'], 'type': sensetype,
-                        'url': sensor['@odata.id'], 'generic': True}
+                    fetched[senseurl] = [sensedata['Name'], sensetype]
+                else:
+                    fetched[senseurl] = None
+            if catalog is not None and fetched:
+                known.update(fetched)
+                catalog['dirty'] = True
+            for senseurl in senseurls:
+                senseinfo = fetched.get(senseurl, known.get(senseurl, None))
+                if senseinfo:
+                    sensorlist.append({
+                        'name': senseinfo[0], 'type': senseinfo[1],
+                        'url': senseurl, 'generic': True})
         else:
             powurl = chassisinfo.get('Power', {}).get('@odata.id', '')
             if powurl:
                 powinf = await self._do_web_request(powurl)
                 for voltage in powinf.get('Voltages', []):
                     if 'Name' in voltage:
-                        self._varsensormap[voltage['Name']] = {
+                        sensorlist.append({
                             'name': voltage['Name'], 'url': powurl,
-                            'type': 'Voltage'}
+                            'type': 'Voltage'})
             thermurl = chassisinfo.get('Thermal', {}).get('@odata.id', '')
             if thermurl:
                 therminf = await self._do_web_request(thermurl)
                 for fan in therminf.get('Fans', []):
                     if 'Name' in fan:
-                        self._varsensormap[fan['Name']] = {
+                        sensorlist.append({
                             'name': fan['Name'], 'type': 'Fan',
-                            'url': thermurl}
+                            'url': thermurl})
                 for temp in therminf.get('Temperatures', []):
                     if 'Name' in temp:
-                        self._varsensormap[temp['Name']] = {
+                        sensorlist.append({
                             'name': temp['Name'], 'type': 'Temperature',
-                            'url': thermurl}      
-        for subchassis in chassisinfo.get('Links', {}).get('Contains', []):
-            await self._mapchassissensors(subchassis)
+                            'url': thermurl})
+        subsensors = await asyncio.gather(*[
+            self._mapchassissensors(subchassis, catalog)
+            for subchassis in chassisinfo.get('Links', {}).get('Contains', [])])
+        for subsensorlist in subsensors:
+            sensorlist.extend(subsensorlist)
+        return sensorlist
 
     async def _get_thermals(self, chassis):
         chassisurl = chassis['@odata.id']
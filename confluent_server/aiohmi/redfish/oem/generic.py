@@ -25,6 +25,7 @@ import copy
 import aiohmi.constants as const
 import aiohmi.exceptions as exc
 import aiohmi.media as media
+import aiohmi.util.bulk as bulk
 import aiohmi.util.webclient as webclient
 from aiohmi.util.parse import parse_time
 from datetime import datetime
@@ -227,6 +228,7 @@ class AttrDependencyHandler(object):
 class OEMHandler(object):
     hostnic = None
     usegenericsensors = True
+    _bulkfetcher = None
     def _invalidate_url_cache(self, url):
         if url is None:
             return
@@ -1732,13 +1734,11 @@ class OEMHandler(object):
 
 
     async def _do_bulk_requests(self, urls, cache=True):
-        if self._gpool:
-            urls = [(x, None, None, cache) for x in urls]
-            for res in self._gpool.starmap(self._do_web_request_withurl, urls):
-                yield res
-        else:
-            for url in urls:
-                yield await self._do_web_request_withurl(url, cache=cache)
+        if self._bulkfetcher is None:
+            self._bulkfetcher = bulk.BulkFetcher(
+                self._do_web_request_withurl, webclient.MAX_CONNECTIONS)
+        async for res in self._bulkfetcher.fetch(urls, cache):
+            yield res
 
     async def _do_web_request_withurl(self, url, payload=None, method=None,
                                 cache=True):
@@ -0,0 +1,63 @@
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fan a batch of GET requests against one endpoint out concurrently, the way
+# a green thread pool used to, but bounded so a single BMC is not asked to
+# serve more than a handful of requests at once.
+
+import asyncio
+
+
+class BulkFetcher:
+    """Fetch many urls from one endpoint concurrently
+
+    :param fetch: A coroutine function taking a url and the cache argument and
+                  returning a (result, url) tuple
+    :param limit: How many requests may be outstanding at once
+    """
+
+    def __init__(self, fetch, limit):
+        self._fetch = fetch
+        self._limit = asyncio.Semaphore(limit)
+        self._inflight = {}
+
+    async def _limited_fetch(self, url, cache):
+        async with self._limit:
+            return await self._fetch(url, cache=cache)
+
+    def _retire(self, url, task):
+        if self._inflight.get(url, None) is task:
+            del self._inflight[url]
+        # A consumer that stopped early leaves the outcome unexamined, which
+        # asyncio would otherwise complain about
+        if not task.cancelled():
+            task.exception()
+
+    def _get_task(self, url, cache):
+        # A url already being fetched, whether by this batch or another one
+        # running alongside it, is waited on rather than requested again
+        task = self._inflight.get(url, None)
+        if task is None:
+            task = asyncio.ensure_future(self._limited_fetch(url, cache))
+            self._inflight[url] = task
+            task.add_done_callback(lambda t, url=url: self._retire(url, t))
+        return task
+
+    async def fetch(self, urls, cache=True):
+        """Yield (result, url) for each url, in the order given"""
+        tasks = [self._get_task(url, cache) for url in urls]
+        for task in tasks:
+            # Shielded, as the task may be shared with another batch that
+            # still wants the answer if this one is abandoned
+            yield await asyncio.shield(task)
@@ -18,6 +18,8 @@
 
 import asyncio
 import base64
+import contextlib
+import inspect
 import io
 import json
 import os
@@ -36,6 +38,94 @@ from aiohttp.cookiejar import CookieJar
 # consolidate forms to single memory location to get benefits..
 uploadforms = {}
 
+# A WebConnection and every dupe() of it draw from one pool of connections, so
+# that successive requests to a BMC reuse an established TLS session rather
+# than each paying for a TCP and TLS handshake of its own.
+# Most connections one pool will hold open to its endpoint at a time
+MAX_CONNECTIONS = 4
+# Seconds an idle connection is held for reuse before it is closed
+KEEPALIVE_TIMEOUT = 30
+# Seconds a pool with nothing in flight lingers before shutting down entirely
+POOL_IDLE_EXPIRY = 90
+
+
+class ConnectionPool:
+    def __init__(self, limit=MAX_CONNECTIONS):
+        self.limit = limit
+        self._connector = None
+        self._inflight = 0
+        self._expirytimer = None
+        self._closing = False
+        self._closer = None
+
+    def _get_connector(self):
+        self._cancel_expiry()
+        self._closing = False
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit,
+                keepalive_timeout=KEEPALIVE_TIMEOUT)
+        return self._connector
+
+    @contextlib.asynccontextmanager
+    async def session(self, baseurl, cookies, timeout):
+        # The session itself is cheap and is made per request, so that each
+        # WebConnection keeps its own cookies and timeout, the connector is
+        # what holds the sockets and is shared.
+        connector = self._get_connector()
+        self._inflight += 1
+        try:
+            async with aiohttp.ClientSession(
+                    baseurl, connector=connector, connector_owner=False,
+                    cookie_jar=cookies, timeout=timeout) as session:
+                yield session
+        finally:
+            self._inflight -= 1
+            if not self._inflight:
+                if self._closing:
+                    self._shutdown()
+                else:
+                    self._schedule_expiry()
+
+    def _cancel_expiry(self):
+        if self._expirytimer:
+            self._expirytimer.cancel()
+            self._expirytimer = None
+
+    def _schedule_expiry(self):
+        self._cancel_expiry()
+        self._expirytimer = asyncio.get_running_loop().call_later(
+            POOL_IDLE_EXPIRY, self._expire)
+
+    def _expire(self):
+        self._expirytimer = None
+        if not self._inflight:
+            self._shutdown()
+
+    def _shutdown(self):
+        self._cancel_expiry()
+        self._closing = False
+        connector = self._connector
+        self._connector = None
+        if connector is not None and not connector.closed:
+            # Depending on the aiohttp version this is either a coroutine or
+            # an awaitable wrapping a task it already started
+            closer = connector.close()
+            if inspect.isawaitable(closer):
+                self._closer = asyncio.ensure_future(closer)
+
+    def close(self):
+        """Close every pooled connection
+
+        Requests already in flight are allowed to finish first.  The pool
+        remains usable afterward, a later request simply opens a new connection.
+        """
+        if self._inflight:
+            self._closing = True
+        else:
+            self._shutdown()
+
+
 class CustomVerifier(aiohttp.Fingerprint):
     def __init__(self, verifycallback):
         self._certverify = verifycallback
@@ -280,6 +370,7 @@ class WebConnection:
         if '[' not in host and '%' in host:
             self.stdheaders['Host'] = '[' + host.split('%', 1)[0] + ']'
         self.cookies = CookieJar(quote_cookie=False, unsafe=True)
+        self.pool = ConnectionPool()
 
     def set_timeout(self, timeout):
         if isinstance(timeout, (int, float)):
@@ -296,6 +387,10 @@ class WebConnection:
     def dupe(self, timeout=None):
         newwc = WebConnection(self.host, self.port,
                               verifycallback=self.verifycallback, timeout=timeout or self.timeout)
+        # Share the pool, and the verifier as connections are only reused
+        # between requests that verify the peer with the same object
+        newwc.pool = self.pool
+        newwc.ssl = self.ssl
         newwc.stdheaders = self.stdheaders.copy()
         newwc.cookies = CookieJar(quote_cookie=False, unsafe=True)
         for cookie in self.cookies:
@@ -303,6 +398,17 @@ class WebConnection:
                 {cookie.key: cookie.value}, response_url=URL(f'https://{self.host}:{self.port}/'))
         return newwc
 
+    def _session(self):
+        return self.pool.session(
+            f'https://{self.host}:{self.port}', self.cookies, self.timeout)
+
+    def close(self):
+        """Close the connections held for this endpoint
+
+        This is shared with any dupe() of this connection.
+        """
+        self.pool.close()
+
     async def request(
             self, method, url, body=None, headers=None, referer=None):
         if headers is None:
@@ -318,8 +424,7 @@ class WebConnection:
         if referer:
             headers['referer'] = referer
         method = method.lower()
-        async with aiohttp.ClientSession(
-                f'https://{self.host}:{self.port}', cookie_jar=self.cookies, timeout=self.timeout) as session:
+        async with self._session() as session:
             thefunc = getattr(session, method)
             kwargs = {}
             if isinstance(body, dict):
@@ -369,7 +474,7 @@ class WebConnection:
         method = method.lower()
         if 'Content-Type' in headers and method.lower() in ('get', 'delete'):
             del headers['Content-Type']
-        async with aiohttp.ClientSession(f'https://{self.host}:{self.port}', cookie_jar=self.cookies, timeout=self.timeout) as session:
+        async with self._session() as session:
             thefunc = getattr(session, method)
             kwargs = {}
             if isinstance(data, dict):
@@ -399,7 +504,7 @@ class WebConnection:
         dlheaders = self.stdheaders.copy()
         if 'Accept-Encoding' in dlheaders:
             del dlheaders['Accept-Encoding']
-        async with aiohttp.ClientSession(f'https://{self.host}:{self.port}', cookie_jar=self.cookies, timeout=self.timeout) as session:
+        async with self._session() as session:
             async with session.get(url, headers=dlheaders, ssl=self.ssl) as rsp:
                 if downloader:
                     downloader.contentlen = rsp.headers.get('content-length', None)
@@ -418,7 +523,7 @@ class WebConnection:
             data = uploader.get_buffer()
         else:
             raise Exception("Not implemented without uploader handler")
-        async with aiohttp.ClientSession(f'https://{self.host}:{self.port}', cookie_jar=self.cookies, timeout=self.timeout) as session:
+        async with self._session() as session:
             async with session.post(url, headers=upheaders, ssl=self.ssl, data=data) as rsp:
                 if rsp.status >= 200 and rsp.status < 300:
                     expect_type = rsp.headers.get('Content-Type', '')
@@ -20,6 +20,7 @@
 # time
 
 import asyncio
+import collections
 
 import confluent.exceptions as exc
 import confluent.config.configmanager as configmanager
@@ -27,9 +28,11 @@ import confluent.config.configmanager as configmanager
 from concurrent.futures import ProcessPoolExecutor
 from fnmatch import fnmatch
 import hashlib
+import hmac
 import msgpack
 import os
 import pwd
+import time
 import confluent.tasks as tasks
 import confluent.userutil as userutil
 import confluent.util as util
@@ -41,11 +44,22 @@ except ImportError:
 import yaml
 
 _pamservice = 'confluent'
-_passcache = {}
+# Digests of recently verified passphrases, by user and tenant.  The digest
+# is keyed with a secret of this process, so the cache is no help in
+# recovering a passphrase.  Entries lapse after _passcachettl seconds, and
+# the least recently verified are dropped past _passcachesize users.
+_passcache = collections.OrderedDict()
+_passcachekey = os.urandom(32)
+_passcachettl = 300
+_passcachesize = 1024
+# Events for checks underway, by user and tenant
 _passchecking = {}
 
 authworkers = None
 authcleaner = None
+# PBKDF2 is the bulk of a check, so checks for different users may as well
+# proceed in parallel up to what the processors allow
+_authworkercount = min(4, os.cpu_count() or 1)
 
 _allowedbyrole = {
     'Operator': {
@@ -270,10 +284,9 @@ async def check_user_passphrase(name, passphrase, operation=None, element=None,
     user, tenant = _get_usertenant(name, tenant)
     while (user, tenant) in _passchecking:
         # Want to serialize passphrase checking activity
-        # by a user, which might be malicious
-        # would normally make an event and wait
-        # but here there's no need for that
-        await asyncio.sleep(0.5)
+        # by a user, which might be malicious.  A check of the same
+        # passphrase that was waiting will then be answered from the cache
+        await _passchecking[(user, tenant)].wait()
     cfm = configmanager.ConfigManager(tenant, username=user)
     ucfg = cfm.get_user(user)
     if ucfg is None:
@@ -294,36 +307,28 @@ async def check_user_passphrase(name, passphrase, operation=None, element=None,
         bpassphrase = passphrase
     elif not isinstance(passphrase, dict):
         bpassphrase = passphrase.encode('utf8')
-    if (user, tenant) in _passcache and bpassphrase:
-        if hashlib.sha256(bpassphrase).digest() == _passcache[(user, tenant)]:
-            return authorize(user, element, tenant, operation=operation)
-        else:
-            # In case of someone trying to guess,
-            # while someone is legitimately logged in
-            # invalidate cache and force the slower check
-            del _passcache[(user, tenant)]
+    credential = ucfg.get('cryptpass', None)
+    if bpassphrase and _check_passcache(
+            (user, tenant), bpassphrase, credential):
+        return authorize(user, element, tenant, operation=operation)
     if 'cryptpass' in ucfg and bpassphrase:
-        _passchecking[(user, tenant)] = True
-        # TODO(jbjohnso): WORKERPOOL
-        # PBKDF2 is, by design, cpu intensive
-        # throw it at the worker pool when implemented
-        # maybe a distinct worker pool, wondering about starving out non-auth stuff
-        salt, crypt = ucfg['cryptpass']
-        global authworkers
-        global authcleaner
-        if authworkers is None:
-            authworkers = ProcessPoolExecutor(max_workers=1) # multiprocessing.Pool(processes=1)
-        else:
-            authcleaner.cancel()
-        authcleaner = tasks.spawn_task_after(30, _clean_authworkers)
-        crypted = await _do_pbkdf(passphrase, salt)
-        del _passchecking[(user, tenant)]
-        await asyncio.sleep(
-            0.05)  # either way, we want to stall so that client can't
-        # determine failure because there is a delay, valid response will
-        # delay as well
+        checking = asyncio.Event()
+        _passchecking[(user, tenant)] = checking
+        try:
+            # PBKDF2 is, by design, cpu intensive, so it goes to the
+            # worker pool
+            salt, crypt = ucfg['cryptpass']
+            _get_authworkers()
+            crypted = await _do_pbkdf(passphrase, salt)
+            await asyncio.sleep(
+                0.05)  # either way, we want to stall so that client can't
+            # determine failure because there is a delay, valid response will
+            # delay as well
+        finally:
+            del _passchecking[(user, tenant)]
+            checking.set()
         if crypt == crypted:
-            _passcache[(user, tenant)] = hashlib.sha256(bpassphrase).digest()
+            _cache_passphrase((user, tenant), bpassphrase, credential)
             return authorize(user, element, tenant, operation)
     if pam:
         pwe = None
@@ -336,11 +341,40 @@ async def check_user_passphrase(name, passphrase, operation=None, element=None,
         usergood = await asyncio.get_running_loop().run_in_executor(authworkers, pam_check, pwe, user, passphrase)
         if usergood:
             if bpassphrase:
-                _passcache[(user, tenant)] = hashlib.sha256(bpassphrase).digest()
+                _cache_passphrase((user, tenant), bpassphrase, credential)
             return authorize(user, element, tenant, operation, skipuserobj=False)
     await asyncio.sleep(0.05)  # stall even on test for existence of a username
     return None
 
+def _passdigest(bpassphrase):
+    return hmac.new(_passcachekey, bpassphrase, hashlib.sha256).digest()
+
+
+def _check_passcache(key, bpassphrase, credential):
+    cached = _passcache.get(key, None)
+    if cached is None:
+        return False
+    digest, expiry, cachedcredential = cached
+    if (expiry > time.monotonic() and cachedcredential == credential and
+            hmac.compare_digest(digest, _passdigest(bpassphrase))):
+        _passcache.move_to_end(key)
+        return True
+    # In case of someone trying to guess,
+    # while someone is legitimately logged in
+    # invalidate cache and force the slower check.  Likewise if the cache
+    # entry is stale or predates a change of passphrase
+    del _passcache[key]
+    return False
+
+
+def _cache_passphrase(key, bpassphrase, credential):
+    _passcache.pop(key, None)
+    _passcache[key] = (_passdigest(bpassphrase),
+                       time.monotonic() + _passcachettl, credential)
+    while len(_passcache) > _passcachesize:
+        _passcache.popitem(last=False)
+
+
 def pam_check(pwe, user, passphrase):
     if os.getuid() != 0:
         # confluent is running with reduced privilege, however, pam_unix refuses
@@ -387,9 +421,22 @@ def _apply_pbkdf(passphrase, salt):
     return hashlib.pbkdf2_hmac('sha256', passphrase, salt, 10000, dklen=32)
 
 
+def _get_authworkers():
+    global authworkers
+    global authcleaner
+    if authworkers is None:
+        authworkers = ProcessPoolExecutor(max_workers=_authworkercount)
+    else:
+        authcleaner.cancel()
+    authcleaner = tasks.spawn_task_after(30, _clean_authworkers)
+    return authworkers
+
+
 def _clean_authworkers():
     global authworkers
     global authcleaner
+    if authworkers is not None:
+        authworkers.shutdown(wait=False)
     authworkers = None
     authcleaner = None
 
@@ -0,0 +1,212 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# A persistent connection to each collective member, carrying any number of
+# dispatched requests at once, so forwarding a request does not pay for a new
+# TLS handshake and banner exchange every time.
+#
+# Once the channel is agreed, both sides exchange frames of a request id and a
+# length followed by that many bytes:
+#  - a request id with a payload from the dispatcher starts a request
+#  - a request id with no payload from the dispatcher abandons that request
+#  - a request id with a payload from the member is a response to the request
+#  - a request id with no payload from the member ends the request
+#  - request id 0 with no payload is a ping, and is answered in kind
+
+import asyncio
+import confluent.asynctlvdata as tlvdata
+import confluent.collective.manager as collective
+import confluent.tasks as tasks
+import struct
+import time
+
+HEADER = struct.Struct('!IQ')
+# An idle channel is pinged this often, and dropped if nothing has been heard
+# for PING_TIMEOUT
+PING_INTERVAL = 30
+PING_TIMEOUT = 90
+# How long to use the old style of dispatch with a member that did not accept
+# a channel, before asking it again
+LEGACY_RECHECK = 300
+
+_channels = {}
+_connectlocks = {}
+_legacymembers = {}
+
+
+def frame(reqid, payload=b''):
+    return HEADER.pack(reqid, len(payload)) + payload
+
+
+class ChannelLost(Exception):
+    pass
+
+
+class PeerChannel(object):
+    """A multiplexed dispatch channel to a collective member
+
+    :param name: The name of the collective member
+    :param connection: The connection, after the channel has been agreed
+    """
+
+    def __init__(self, name, connection):
+        self.name = name
+        self.connection = connection
+        self.closed = False
+        self.lastrecv = time.monotonic()
+        self._streams = {}
+        self._nextid = 0
+        # Only one task may wait on drain at a time before python 3.10
+        self._xmitlock = asyncio.Lock()
+        self._reader = tasks.spawn_task(self._read())
+        self._pinger = tasks.spawn_task(self._ping())
+
+    def _allocate_id(self):
+        while True:
+            self._nextid = (self._nextid % 0xffffffff) + 1
+            if self._nextid not in self._streams:
+                return self._nextid
+
+    async def _read(self):
+        reader = self.connection[0]
+        try:
+            while True:
+                reqid, length = HEADER.unpack(
+                    await reader.readexactly(HEADER.size))
+                payload = b''
+                if length:
+                    payload = await reader.readexactly(length)
+                self.lastrecv = time.monotonic()
+                stream = self._streams.get(reqid, None)
+                if stream is None:
+                    # A ping answered, or the tail of an abandoned request
+                    continue
+                if not payload:
+                    del self._streams[reqid]
+                    stream.put_nowait(None)
+                else:
+                    stream.put_nowait(payload)
+        except Exception:
+            pass
+        finally:
+            self.close()
+
+    async def _ping(self):
+        while not self.closed:
+            await asyncio.sleep(PING_INTERVAL)
+            idle = time.monotonic() - self.lastrecv
+            if idle > PING_TIMEOUT:
+                self.close()
+                return
+            if idle >= PING_INTERVAL:
+                await self._send_or_close(frame(0))
+
+    async def _send(self, data):
+        async with self._xmitlock:
+            self.connection[1].write(data)
+            await self.connection[1].drain()
+
+    async def _send_or_close(self, data):
+        try:
+            await self._send(data)
+        except Exception:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if _channels.get(self.name, None) is self:
+            del _channels[self.name]
+        streams = self._streams
+        self._streams = {}
+        for stream in streams.values():
+            stream.put_nowait(ChannelLost(self.name))
+        self._pinger.cancel()
+        self._reader.cancel()
+        self.connection[1].close()
+
+    async def request(self, dreq):
+        """Send a dispatch request and yield each response payload
+
+        Raises ChannelLost if the channel fails before the request completes.
+        """
+        if self.closed:
+            raise ChannelLost(self.name)
+        reqid = self._allocate_id()
+        stream = asyncio.Queue()
+        self._streams[reqid] = stream
+        finished = False
+        try:
+            try:
+                await self._send(frame(reqid, dreq))
+            except Exception:
+                self.close()
+                raise ChannelLost(self.name)
+            while True:
+                rsp = await stream.get()
+                if rsp is None:
+                    finished = True
+                    return
+                if isinstance(rsp, Exception):
+                    finished = True
+                    raise rsp
+                yield rsp
+        finally:
+            if not finished and not self.closed:
+                # Abandoned part way, so have the member stop working on it.
+                # This may be running as the request is cancelled, so the
+                # frame is sent from a task of its own
+                self._streams.pop(reqid, None)
+                tasks.spawn(self._send_or_close(frame(reqid)))
+
+
+async def get_channel(member):
+    """Get the dispatch channel to a collective member, connecting if needed
+
+    :param member: The collective member, as from get_collective_member
+    :returns: A PeerChannel, or None if the member does not support them
+    """
+    name = member['name']
+    chan = _channels.get(name, None)
+    if chan is not None and not chan.closed:
+        return chan
+    if _legacymembers.get(name, 0) > time.monotonic():
+        return None
+    if name not in _connectlocks:
+        _connectlocks[name] = asyncio.Lock()
+    async with _connectlocks[name]:
+        chan = _channels.get(name, None)
+        if chan is not None and not chan.closed:
+            return chan
+        remote = await collective.connect_to_collective(
+            member['fingerprint'], member['address'])
+        try:
+            await tlvdata.recv(remote)  # banner
+            await tlvdata.recv(remote)  # authpassed
+            await tlvdata.send(remote, {'dispatchchannel': {
+                'name': collective.get_myname()}})
+            accepted = await tlvdata.recv(remote)
+        except Exception:
+            accepted = None
+        if not isinstance(accepted, dict) or 'dispatchchannel' not in accepted:
+            # A member predating channels drops the connection instead
+            await tlvdata.close(remote)
+            _legacymembers[name] = time.monotonic() + LEGACY_RECHECK
+            return None
+        chan = PeerChannel(name, remote)
+        _channels[name] = chan
+        return chan
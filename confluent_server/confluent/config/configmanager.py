@@ -62,6 +62,7 @@ if __name__ == '__main__':
         sys.path.append(path)
 import confluent.config.attributes as allattributes
 import confluent.config.conf as conf
+import confluent.config.journal as cfgjournal
 import confluent.noderange as noderange
 import confluent.util
 import confluent.tasks as tasks
@@ -267,6 +268,51 @@ async def _do_notifier(cfg, watcher, callback):
         logException()
 
 
+# Attribute change notifications waiting to be delivered, by watcher.  Changes
+# for a watcher are merged while they wait, so it hears about a transaction,
+# or a burst of them inside its debounce window, as one changeset.
+_pendingnotifs = {}
+_notiftimers = {}
+
+
+def _queue_notification(cfg, notifierid, nodeattrs, callback):
+    delay = ConfigManager._notifierids.get(notifierid, {}).get('debounce', 0)
+    pending = _pendingnotifs.get(notifierid, None)
+    if pending is None:
+        pending = {'nodeattrs': {}, 'callback': callback, 'delay': delay}
+        _pendingnotifs[notifierid] = pending
+    pending['cfg'] = cfg
+    for node in nodeattrs:
+        currattrs = pending['nodeattrs'].setdefault(node, [])
+        for attrname in nodeattrs[node]:
+            if attrname not in currattrs:
+                currattrs.append(attrname)
+    if delay not in _notiftimers:
+        _notiftimers[delay] = asyncio.get_running_loop().call_later(
+            delay, _flush_notifications, delay)
+
+
+def _flush_notifications(delay):
+    del _notiftimers[delay]
+    batch = []
+    for notifierid in list(_pendingnotifs):
+        pending = _pendingnotifs[notifierid]
+        if pending['delay'] != delay:
+            continue
+        del _pendingnotifs[notifierid]
+        if notifierid not in ConfigManager._notifierids:
+            continue  # removed while the notification waited
+        batch.append(pending)
+    if batch:
+        tasks.spawn(_deliver_notifications(batch))
+
+
+async def _deliver_notifications(batch):
+    await asyncio.gather(*[
+        _do_notifier(pending['cfg'], pending, pending['callback'])
+        for pending in batch])
+
+
 
 async def _rpc_master_del_usergroup(tenant, name):
     await ConfigManager(tenant).del_usergroup(name)
@@ -911,6 +957,7 @@ def rollback_clear():
     global _oldtxcount
     _txcount = _oldtxcount
     _cfgstore = _oldcfgstore
+    _bump_generation()
     _oldtxcount = 0
     _oldcfgstore = None
     ConfigManager.wait_for_sync(True)
@@ -928,6 +975,7 @@ async def clear_configuration():
     _oldcfgstore = _cfgstore
     _oldtxcount = _txcount
     _cfgstore = {}
+    _bump_generation()
     _txcount = 0
 
 def commit_clear():
@@ -1127,6 +1175,10 @@ async def get_collective_member_by_address(address):
 
 def _mark_dirtykey(category, key, tenant=None):
     key = confluent.util.stringify(key)
+    if category == 'nodes':
+        _invalidate_attribute_index(tenant, (key,))
+    if category in ('nodes', 'nodegroups'):
+        _bump_generation()
     with _dirtylock:
         if 'dirtykeys' not in _cfgstore:
             _cfgstore['dirtykeys'] = {}
@@ -1137,6 +1189,89 @@ def _mark_dirtykey(category, key, tenant=None):
         _cfgstore['dirtykeys'][tenant][category].add(key)
 
 
+class _AttributeIndex(object):
+    """Map attribute values back to the nodes that hold them
+
+    Built against one nodes dictionary, and kept current by marking nodes
+    stale as they change, each stale node being reindexed on the next lookup.
+    Only string values are indexed, being the only values an attribute
+    filter expression can match.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.byattr = {}
+        self.bynode = {}
+        self.stale = set(nodes)
+
+    def refresh(self):
+        while self.stale:
+            self._reindex(self.stale.pop())
+
+    def _reindex(self, node):
+        for attr, val in self.bynode.pop(node, {}).items():
+            holders = self.byattr[attr][val]
+            holders.discard(node)
+            if not holders:
+                del self.byattr[attr][val]
+                if not self.byattr[attr]:
+                    del self.byattr[attr]
+        nodecfg = self.nodes.get(node, None)
+        if not nodecfg:
+            return
+        indexed = {}
+        for attr in nodecfg:
+            if attr.startswith('_') or not isinstance(nodecfg[attr], dict):
+                continue
+            val = nodecfg[attr].get('value', None)
+            if not isinstance(val, str):
+                continue
+            indexed[attr] = val
+            self.byattr.setdefault(attr, {}).setdefault(val, set()).add(node)
+        if indexed:
+            self.bynode[node] = indexed
+
+    def match_attribute(self, attribute):
+        if attribute in self.byattr:
+            return [attribute]
+        return fnmatch.filter(self.byattr, attribute)
+
+    def equals(self, attribute, match):
+        found = set()
+        for attr in self.match_attribute(attribute):
+            found.update(self.byattr[attr].get(match, ()))
+        return found
+
+    def search(self, attribute, exmatch):
+        found = set()
+        for attr in self.match_attribute(attribute):
+            for val in self.byattr[attr]:
+                if exmatch.search(val):
+                    found.update(self.byattr[attr][val])
+        return found
+
+
+_attribindexes = {}
+
+
+def _invalidate_attribute_index(tenant, nodes):
+    index = _attribindexes.get(tenant, None)
+    if index is not None:
+        index.stale.update(nodes)
+
+
+# A count that moves on whenever a node or group changes, so that anything
+# derived from the node and group configuration can tell it is stale.
+# Attribute watchers are told of changes asynchronously, this is current as
+# soon as a change is made.
+_generation = 0
+
+
+def _bump_generation():
+    global _generation
+    _generation += 1
+
+
 def _generate_new_id():
     # generate a random id outside the usual ranges used for normal users in
     # /etc/passwd.  Leave an equivalent amount of space near the end disused,
@@ -1391,6 +1526,8 @@ class ConfigManager(object):
     else:
         _cfgdir = "/etc/confluent/cfg"
     _cfgwriter = None
+    _journal = None
+    _usejournal = None
     _writepending = False
     _syncrunning = False
     _syncstate = threading.RLock()
@@ -1501,6 +1638,24 @@ class ConfigManager(object):
         if attribute_name_is_invalid(attribute):
             raise ValueError(
                 '{0} is not a valid attribute name'.format(attribute))
+        # An unset attribute is treated as an empty string, so a positive
+        # match that an empty string would satisfy can hold for nodes that are
+        # absent from the index, and only then do all nodes need checking
+        if yieldmatches and ((exmatch and not exmatch.search(''))
+                             or (not exmatch and match != '')):
+            index = self._get_attribute_index()
+            if exmatch:
+                matched = index.search(attribute, exmatch)
+            else:
+                matched = index.equals(attribute, match)
+            if nodes is self._cfgstore['nodes']:
+                for node in list(matched):
+                    yield node
+            else:
+                for node in nodes:
+                    if node in matched:
+                        yield node
+            return
         for node in nodes:
             try:
                 currvals = [self._cfgstore['nodes'][node][attribute]['value']]
@@ -1530,6 +1685,27 @@ class ConfigManager(object):
                             yield node
                             break
 
+    def get_generation(self):
+        """Return a value that changes whenever nodes or groups change
+
+        :returns: A hashable value, equal to a previously returned one only if
+                  no node or group has changed in between
+        """
+        # The identity of the nodes dictionary catches the configuration being
+        # replaced wholesale by a path that does not count as a change
+        return id(self._cfgstore['nodes']), _generation
+
+    def _get_attribute_index(self):
+        nodes = self._cfgstore['nodes']
+        index = _attribindexes.get(self.tenant, None)
+        if index is None or index.nodes is not nodes:
+            # Either never built, or the configuration was replaced wholesale
+            # by a load, a clear or a restore
+            index = _AttributeIndex(nodes)
+            _attribindexes[self.tenant] = index
+        index.refresh()
+        return index
+
     def filter_nodenames(self, expression, nodes=None):
         """Filter nodenames by regular expression
 
@@ -1543,15 +1719,20 @@ class ConfigManager(object):
             if expression.search(node):
                 yield node
 
-    def watch_attributes(self, nodes, attributes, callback):
+    def watch_attributes(self, nodes, attributes, callback, debounce=0):
         """
         Watch a list of attributes for changes on a list of nodes.  The
         attributes may be literal, or a filename style wildcard like
         'net*.switch'
 
+        Changes are delivered as one changeset per transaction.  With a
+        debounce, every change made within that many seconds of the first is
+        merged into a single notification.
+
         :param nodes: An iterable of node names to be watching
         :param attributes: An iterable of attribute names to be notified about
         :param callback: A callback to process a notification
+        :param debounce: Seconds to wait for further changes before notifying
 
         Returns an identifier that can be used to unsubscribe from these
         notifications using remove_watcher
@@ -1559,7 +1740,8 @@ class ConfigManager(object):
         notifierid = random.randint(0, sys.maxsize)
         while notifierid in self._notifierids:
             notifierid = random.randint(0, sys.maxsize)
-        self._notifierids[notifierid] = {'attriblist': []}
+        self._notifierids[notifierid] = {'attriblist': [],
+                                         'debounce': debounce}
         if self.tenant not in self._attribwatchers:
             self._attribwatchers[self.tenant] = {}
         attribwatchers = self._attribwatchers[self.tenant]
@@ -2240,6 +2422,10 @@ class ConfigManager(object):
                                           changeset=changeset)
 
     def _notif_attribwatchers(self, nodeattrs):
+        # Some changes, such as a recalculated expression, are only ever
+        # recorded in the changeset
+        _invalidate_attribute_index(self.tenant, nodeattrs)
+        _bump_generation()
         if self.tenant not in self._attribwatchers:
             return
         if self.inrestore:
@@ -2288,10 +2474,10 @@ class ConfigManager(object):
                             'nodeattrs': {node: [attrname]},
                             'callback': attribwatcher[watchkey][notifierid]
                         }
-        for watcher in notifdata:
-            watcher = notifdata[watcher]
-            callback = watcher['callback']
-            tasks.spawn(_do_notifier(self, watcher, callback))
+        for notifierid in notifdata:
+            watcher = notifdata[notifierid]
+            _queue_notification(self, notifierid, watcher['nodeattrs'],
+                                watcher['callback'])
 
     async def del_nodes(self, nodes):
         if isinstance(nodes, set):
@@ -2867,6 +3053,7 @@ class ConfigManager(object):
         global _cfgstore
         global _txcount
         _cfgstore = {}
+        _bump_generation()
         rootpath = cls._cfgdir
         try:
             with open(os.path.join(rootpath, 'transactioncount'), 'rb') as f:
@@ -2875,6 +3062,11 @@ class ConfigManager(object):
                     _txcount = struct.unpack('!Q', txbytes)[0]
         except IOError:
             pass
+        journal = cls._get_journal()
+        if journal is not None and journal.exists():
+            _cfgstore, jtxcount = journal.load()
+            _txcount = max(_txcount, jtxcount)
+            return
         _load_dict_from_dbm(['collective'], os.path.join(rootpath,
                                                          "collective"))
         _load_dict_from_dbm(['globals'], os.path.join(rootpath, "globals"))
@@ -2888,6 +3080,9 @@ class ConfigManager(object):
                         os.path.join(rootpath, tenant, confarea))
         except OSError:
             pass
+        if journal is not None:
+            # Carry a configuration stored by dbm over into the journal
+            journal.needsnapshot = True
 
     @classmethod
     def wait_for_sync(cls, fullsync=False):
@@ -2940,67 +3135,161 @@ class ConfigManager(object):
             _mkpath(cls._cfgdir)
             with open(os.path.join(cls._cfgdir, 'transactioncount'), 'wb') as f:
                 f.write(struct.pack('!Q', _txcount))
-            if (fullsync or 'dirtyglobals' in _cfgstore and
-                    'globals' in _cfgstore):
-                if fullsync:  # globals is not a given to be set..
-                    dirtyglobals = _cfgstore['globals']
-                else:
-                    with _dirtylock:
-                        dirtyglobals = copy.deepcopy(_cfgstore['dirtyglobals'])
-                        del _cfgstore['dirtyglobals']
+            journal = cls._get_journal()
+            if journal is not None:
+                cls._sync_to_journal(journal, fullsync)
+            else:
+                cls._sync_to_dbm(fullsync)
+        willrun = False
+        with cls._syncstate:
+            if cls._writepending:
+                cls._writepending = False
+                willrun = True
+            else:
+                cls._syncrunning = False
+        if willrun:
+            return cls._sync_to_file()
+
+    @classmethod
+    def _get_journal(cls):
+        """Return the journal store, if it is in use rather than dbm"""
+        if cls._usejournal is None:
+            store = conf.get_option('globals', 'configstore') or 'dbm'
+            cls._usejournal = store.lower() == 'journal'
+        if cls._usejournal and cls._journal is None:
+            cls._journal = cfgjournal.ConfigJournal(cls._cfgdir)
+        return cls._journal
+
+    @classmethod
+    def _sync_to_journal(cls, journal, fullsync=False):
+        with _dirtylock:
+            dirtyglobals = _cfgstore.pop('dirtyglobals', ())
+            dirtycollective = _cfgstore.pop('collectivedirty', ())
+            dirtykeys = _cfgstore.pop('dirtykeys', {})
+        # The configuration may change under the writer, which would show as
+        # a dictionary changing size during iteration, try again if so
+        for attempt in range(5):
+            try:
+                if fullsync or journal.needsnapshot:
+                    journal.write_snapshot(
+                        dict((area, _cfgstore[area]) for area in
+                             ('globals', 'collective', 'main', 'tenant')
+                             if area in _cfgstore), _txcount)
+                    return
+                records = []
+                for globalkey in dirtyglobals:
+                    records.append(cfgjournal.make_record(
+                        None, 'globals', globalkey,
+                        _cfgstore.get('globals', {})))
+                for coll in dirtycollective:
+                    records.append(cfgjournal.make_record(
+                        None, 'collective', coll,
+                        _cfgstore.get('collective', {})))
+                for tenant in dirtykeys:
+                    if tenant is None:
+                        currdict = _cfgstore['main']
+                    else:
+                        currdict = _cfgstore['tenant'][tenant]
+                    for category in dirtykeys[tenant]:
+                        for ck in dirtykeys[tenant][category]:
+                            records.append(cfgjournal.make_record(
+                                tenant, category, ck,
+                                currdict.get(category, {})))
+                journal.append(records, _txcount)
+                return
+            except RuntimeError:
+                if attempt == 4:
+                    raise
+
+    @classmethod
+    def _sync_to_dbm(cls, fullsync=False):
+        if (fullsync or 'dirtyglobals' in _cfgstore and
+                'globals' in _cfgstore):
+            if fullsync:  # globals is not a given to be set..
+                dirtyglobals = _cfgstore['globals']
+            else:
+                with _dirtylock:
+                    dirtyglobals = copy.deepcopy(_cfgstore['dirtyglobals'])
+                    del _cfgstore['dirtyglobals']
+            try:
+                globalf = dbm.open(os.path.join(cls._cfgdir, "globals"), 'c', 384)  # 0600
+            except dbm.error:
+                if not fullsync:
+                    raise
+                os.remove(os.path.join(cls._cfgdir, "globals"))
+                globalf = dbm.open(os.path.join(cls._cfgdir, "globals"), 'c', 384)  # 0600
+            try:
+                for globalkey in dirtyglobals:
+                    if globalkey in _cfgstore['globals']:
+                        globalf[globalkey] = \
+                            cPickle.dumps(_cfgstore['globals'][globalkey], protocol=cPickle.HIGHEST_PROTOCOL)
+                    else:
+                        if globalkey in globalf:
+                            del globalf[globalkey]
+            finally:
+                globalf.close()
+        if fullsync or 'collectivedirty' in _cfgstore:
+            if len(_cfgstore.get('collective', ())) > 1:
                 try:
-                    globalf = dbm.open(os.path.join(cls._cfgdir, "globals"), 'c', 384)  # 0600
+                    collectivef = dbm.open(os.path.join(cls._cfgdir, 'collective'),
+                                        'c', 384)
                 except dbm.error:
                     if not fullsync:
                         raise
-                    os.remove(os.path.join(cls._cfgdir, "globals"))
-                    globalf = dbm.open(os.path.join(cls._cfgdir, "globals"), 'c', 384)  # 0600
+                    os.remove(os.path.join(cls._cfgdir, 'collective'))
+                    collectivef = dbm.open(os.path.join(cls._cfgdir, 'collective'),
+                                        'c', 384)
                 try:
-                    for globalkey in dirtyglobals:
-                        if globalkey in _cfgstore['globals']:
-                            globalf[globalkey] = \
-                                cPickle.dumps(_cfgstore['globals'][globalkey], protocol=cPickle.HIGHEST_PROTOCOL)
+                    if fullsync:
+                        colls = _cfgstore['collective']
+                    else:
+                        with _dirtylock:
+                            colls = copy.deepcopy(_cfgstore['collectivedirty'])
+                            del _cfgstore['collectivedirty']
+                    for coll in colls:
+                        if coll in _cfgstore['collective']:
+                            collectivef[coll] = cPickle.dumps(
+                                _cfgstore['collective'][coll], protocol=cPickle.HIGHEST_PROTOCOL)
                         else:
-                            if globalkey in globalf:
-                                del globalf[globalkey]
+                            if coll in collectivef:
+                                del collectivef[coll]
                 finally:
-                    globalf.close()
-            if fullsync or 'collectivedirty' in _cfgstore:
-                if len(_cfgstore.get('collective', ())) > 1:
-                    try:
-                        collectivef = dbm.open(os.path.join(cls._cfgdir, 'collective'),
-                                            'c', 384)
-                    except dbm.error:
-                        if not fullsync:
-                            raise
-                        os.remove(os.path.join(cls._cfgdir, 'collective'))
-                        collectivef = dbm.open(os.path.join(cls._cfgdir, 'collective'),
-                                            'c', 384)
-                    try:
-                        if fullsync:
-                            colls = _cfgstore['collective']
-                        else:
-                            with _dirtylock:
-                                colls = copy.deepcopy(_cfgstore['collectivedirty'])
-                                del _cfgstore['collectivedirty']
-                        for coll in colls:
-                            if coll in _cfgstore['collective']:
-                                collectivef[coll] = cPickle.dumps(
-                                    _cfgstore['collective'][coll], protocol=cPickle.HIGHEST_PROTOCOL)
-                            else:
-                                if coll in collectivef:
-                                    del collectivef[coll]
-                    finally:
-                        collectivef.close()
+                    collectivef.close()
+            else:
+                try:
+                    os.remove(os.path.join(cls._cfgdir, "collective"))
+                except OSError:
+                    pass
+        if fullsync:
+            pathname = cls._cfgdir
+            currdict = _cfgstore['main']
+            for category in currdict:
+                _mkpath(pathname)
+                try:
+                    dbf = dbm.open(os.path.join(pathname, category), 'c', 384)  # 0600
+                except dbm.error:
+                    if not fullsync:
+                        raise
+                    os.remove(os.path.join(pathname, category))
+                    dbf = dbm.open(os.path.join(pathname, category), 'c', 384)  # 0600
+                try:
+                    for ck in currdict[category]:
+                        dbf[ck] = cPickle.dumps(currdict[category][ck], protocol=cPickle.HIGHEST_PROTOCOL)
+                finally:
+                    dbf.close()
+        elif 'dirtykeys' in _cfgstore:
+            with _dirtylock:
+                currdirt = copy.deepcopy(_cfgstore['dirtykeys'])
+                del _cfgstore['dirtykeys']
+            for tenant in currdirt:
+                dkdict = currdirt[tenant]
+                if tenant is None:
+                    pathname = cls._cfgdir
+                    currdict = _cfgstore['main']
                 else:
-                    try:
-                        os.remove(os.path.join(cls._cfgdir, "collective"))
-                    except OSError:
-                        pass
-            if fullsync:
-                pathname = cls._cfgdir
-                currdict = _cfgstore['main']
-                for category in currdict:
+                    pathname = os.path.join(cls._cfgdir, 'tenants', tenant)
+                    currdict = _cfgstore['tenant'][tenant]
+                for category in dkdict:
                     _mkpath(pathname)
                     try:
                         dbf = dbm.open(os.path.join(pathname, category), 'c', 384)  # 0600
@@ -3010,49 +3299,14 @@ class ConfigManager(object):
                         os.remove(os.path.join(pathname, category))
                         dbf = dbm.open(os.path.join(pathname, category), 'c', 384)  # 0600
                     try:
-                        for ck in currdict[category]:
-                            dbf[ck] = cPickle.dumps(currdict[category][ck], protocol=cPickle.HIGHEST_PROTOCOL)
+                        for ck in dkdict[category]:
+                            if ck not in currdict[category]:
+                                if ck in dbf:
+                                    del dbf[ck]
+                            else:
+                                dbf[ck] = cPickle.dumps(currdict[category][ck], protocol=cPickle.HIGHEST_PROTOCOL)
                     finally:
                         dbf.close()
-            elif 'dirtykeys' in _cfgstore:
-                with _dirtylock:
-                    currdirt = copy.deepcopy(_cfgstore['dirtykeys'])
-                    del _cfgstore['dirtykeys']
-                for tenant in currdirt:
-                    dkdict = currdirt[tenant]
-                    if tenant is None:
-                        pathname = cls._cfgdir
-                        currdict = _cfgstore['main']
-                    else:
-                        pathname = os.path.join(cls._cfgdir, 'tenants', tenant)
-                        currdict = _cfgstore['tenant'][tenant]
-                    for category in dkdict:
-                        _mkpath(pathname)
-                        try:
-                            dbf = dbm.open(os.path.join(pathname, category), 'c', 384)  # 0600
-                        except dbm.error:
-                            if not fullsync:
-                                raise
-                            os.remove(os.path.join(pathname, category))
-                            dbf = dbm.open(os.path.join(pathname, category), 'c', 384)  # 0600
-                        try:
-                            for ck in dkdict[category]:
-                                if ck not in currdict[category]:
-                                    if ck in dbf:
-                                        del dbf[ck]
-                                else:
-                                    dbf[ck] = cPickle.dumps(currdict[category][ck], protocol=cPickle.HIGHEST_PROTOCOL)
-                        finally:
-                            dbf.close()
-        willrun = False
-        with cls._syncstate:
-            if cls._writepending:
-                cls._writepending = False
-                willrun = True
-            else:
-                cls._syncrunning = False
-        if willrun:
-            return cls._sync_to_file()
 
     def _recalculate_expressions(self, cfgobj, formatter, node, changeset):
         for key in cfgobj:
@@ -3396,11 +3650,13 @@ def init(stateless=False, cfgdir=None):
         ConfigManager._cfgdir = cfgdir
     if stateless:
         _cfgstore = {}
+        _bump_generation()
         return
     try:
         ConfigManager._read_from_path()
     except IOError:
         _cfgstore = {}
+        _bump_generation()
     members = list(list_collective())
     if len(members) < 2:
         _init_indexes()
@@ -0,0 +1,215 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# An append only store for the configuration, as an alternative to a dbm
+# file per category.  Each sync appends one batch of change records to a
+# journal, and every so often the whole configuration is written out as a
+# snapshot and a fresh journal started.  Loading reads the snapshot and then
+# replays the journal that follows it.
+#
+# The snapshot names the generation of the journal that continues it, so a
+# journal left over from before the snapshot is never replayed on top of it.
+# A batch is framed with its length and a crc, and a torn batch at the end of
+# the journal, as left by a crash during a write, is discarded.
+
+import os
+try:
+    import cPickle
+except ModuleNotFoundError:
+    import pickle as cPickle
+import struct
+import zlib
+
+import msgpack
+
+# The journal is compacted into a new snapshot once it grows past this
+COMPACT_THRESHOLD = 32 * 1048576
+
+_framehdr = struct.Struct('!II')
+
+
+def _encode_ext(obj):
+    if isinstance(obj, (set, frozenset)):
+        return msgpack.ExtType(1, packb(list(obj)))
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(2, packb(list(obj)))
+    # Anything else is kept the way the dbm store keeps everything.  It is a
+    # local self-owned file and thus not a significant security risk
+    return msgpack.ExtType(3, cPickle.dumps(
+        obj, protocol=cPickle.HIGHEST_PROTOCOL))
+
+
+def _decode_ext(code, data):
+    if code == 1:
+        return set(unpackb(data))
+    if code == 2:
+        return tuple(unpackb(data))
+    if code == 3:
+        return cPickle.loads(data)  # nosec
+    return msgpack.ExtType(code, data)
+
+
+def packb(obj):
+    # strict_types, so that a tuple reaches _encode_ext rather than being
+    # quietly stored as a list
+    return msgpack.packb(obj, default=_encode_ext, use_bin_type=True,
+                         strict_types=True)
+
+
+def unpackb(data):
+    return msgpack.unpackb(data, ext_hook=_decode_ext, raw=False,
+                           strict_map_key=False)
+
+
+def _frame(payload):
+    return _framehdr.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class ConfigJournal(object):
+    """Persist configuration changes to a journal and periodic snapshots
+
+    :param cfgdir: The directory to keep the snapshot and journal in
+    """
+
+    def __init__(self, cfgdir):
+        self.cfgdir = cfgdir
+        self.generation = 0
+        self.needsnapshot = False
+
+    @property
+    def snapshotname(self):
+        return os.path.join(self.cfgdir, 'snapshot')
+
+    def journalname(self, generation=None):
+        if generation is None:
+            generation = self.generation
+        return os.path.join(self.cfgdir, 'journal.{0}'.format(generation))
+
+    def exists(self):
+        return os.path.exists(self.snapshotname)
+
+    def load(self):
+        """Read the snapshot and replay the journal after it
+
+        :returns: A tuple of the configuration and the transaction count
+        """
+        with open(self.snapshotname, 'rb') as snapf:
+            snapshot = unpackb(snapf.read())
+        self.generation = snapshot['generation']
+        cfgstore = snapshot['config']
+        txcount = snapshot['txcount']
+        goodlen = 0
+        try:
+            with open(self.journalname(), 'rb') as journalf:
+                data = journalf.read()
+        except IOError:
+            data = b''
+        while len(data) - goodlen >= _framehdr.size:
+            size, crc = _framehdr.unpack_from(data, goodlen)
+            start = goodlen + _framehdr.size
+            payload = data[start:start + size]
+            if len(payload) != size or zlib.crc32(payload) != crc:
+                break
+            batchtx, records = unpackb(payload)
+            for record in records:
+                apply_record(cfgstore, record)
+            txcount = max(txcount, batchtx)
+            goodlen = start + size
+        if goodlen != len(data):
+            # Torn by a crash mid write, drop the remnant so later batches
+            # are not appended after it
+            with open(self.journalname(), 'r+b') as journalf:
+                journalf.truncate(goodlen)
+        return cfgstore, txcount
+
+    def append(self, records, txcount):
+        """Append a batch of change records in a single write
+
+        :param records: List of records as made by make_record
+        :param txcount: The transaction count as of these changes
+        """
+        if not records:
+            return
+        payload = _frame(packb([txcount, records]))
+        fd = os.open(self.journalname(), os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                     0o600)
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > COMPACT_THRESHOLD:
+            self.needsnapshot = True
+
+    def write_snapshot(self, cfgstore, txcount):
+        """Write out the whole configuration and start a new journal
+
+        :param cfgstore: The configuration, with only the areas to persist
+        :param txcount: The transaction count as of this configuration
+        """
+        oldgeneration = self.generation
+        newgeneration = oldgeneration + 1
+        payload = packb({'generation': newgeneration, 'txcount': txcount,
+                         'config': cfgstore})
+        tmpname = self.snapshotname + '.new'
+        fd = os.open(tmpname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.rename(tmpname, self.snapshotname)
+        self.generation = newgeneration
+        self.needsnapshot = False
+        for stale in (oldgeneration, newgeneration):
+            # The new generation is cleared too, in case a previous attempt
+            # got as far as starting it before being interrupted
+            try:
+                os.remove(self.journalname(stale))
+            except OSError:
+                pass
+
+
+def make_record(tenant, category, key, container):
+    """Describe the current state of one key for the journal
+
+    :param tenant: The tenant, or None for globals, collective or main
+    :param category: 'globals', 'collective', or a configuration area
+    :param key: The key within the category
+    :param container: The dictionary the key lives in
+    """
+    if key in container:
+        return [tenant, category, key, True, container[key]]
+    return [tenant, category, key, False, None]
+
+
+def _record_container(cfgstore, tenant, category):
+    if category in ('globals', 'collective'):
+        return cfgstore.setdefault(category, {})
+    if tenant is None:
+        return cfgstore.setdefault('main', {}).setdefault(category, {})
+    return cfgstore.setdefault('tenant', {}).setdefault(
+        tenant, {}).setdefault(category, {})
+
+
+def apply_record(cfgstore, record):
+    tenant, category, key, present, value = record
+    container = _record_container(cfgstore, tenant, category)
+    if present:
+        container[key] = value
+    else:
+        container.pop(key, None)
@@ -43,6 +43,20 @@ _handled_consoles = {}
 
 _tracelog = None
 _bufferdaemon = None
+_bufferchannel = None
+_bufferchannellock = None
+# Set when the running buffer daemon predates the shared channel
+_bufferlegacy = False
+# Seconds to gather attribute changes before reconnecting a console, so that
+# a run of edits to a node only restarts its console once
+_attribdebounce = 0.5
+# Console output is gathered for this many seconds, or until there is
+# OUTPUTBATCH of it, and then buffered, logged and sent to viewers at once
+OUTPUTWINDOW = 0.01
+OUTPUTBATCH = 65536
+# How far a viewer may fall behind before its backlog is discarded and it is
+# sent the current screen instead
+SESSIONBACKLOG = 262144
 
 
 def chunk_output(output, n):
@@ -85,14 +99,179 @@ async def _ensure_buffer_daemon():
                 continue
         raise storedexception if storedexception is not None else Exception("Failed to connect to buffer daemon")
 
+# Commands understood by the buffer daemon, carried in the top three bits of
+# a frame header with the length of the payload in the rest
+VT_READBUFF = 0
+VT_SETNODE = 1
+VT_WRITE = 2
+VT_NODEWRITE = 4
+VT_HELLO = 5
+# How much output for one node may be waiting on the buffer daemon before
+# that console has to wait for it to catch up
+NODEBACKLOG = 262144
+
+
+def _vtframe(cmd, payload=b''):
+    return struct.pack('I', len(payload) | (cmd << 29)) + payload
+
+
+class BufferChannel(object):
+    """A single connection to the buffer daemon, shared by all consoles
+
+    Output for every node is interleaved on the one connection and written
+    out in batches.  Buffer replays are answered in the order requested.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+        # Bytes per node not yet taken by the buffer daemon
+        self.backlog = {}
+        self._frames = []
+        self._framesizes = {}
+        self._flusher = None
+        self._progress = asyncio.Event()
+        self._replies = collections.deque()
+        self._replyreader = tasks.spawn_task(self._read_replies())
+
+    async def _read_replies(self):
+        pending = bytearray()
+        try:
+            while True:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    break
+                pending.extend(chunk)
+                idx = pending.find(b'\x00')
+                while idx >= 0:
+                    reply = self._replies.popleft()
+                    if not reply.done():
+                        reply.set_result(bytes(pending[:idx]))
+                    del pending[:idx + 1]
+                    idx = pending.find(b'\x00')
+        except Exception:
+            pass
+        finally:
+            self.close()
+
+    def _queue(self, nodename, frame):
+        self._frames.append(frame)
+        self._framesizes[nodename] = self._framesizes.get(
+            nodename, 0) + len(frame)
+        self.backlog[nodename] = self.backlog.get(nodename, 0) + len(frame)
+        if self._flusher is None:
+            self._flusher = tasks.spawn_task(self._flush())
+
+    async def _flush(self):
+        try:
+            while self._frames and not self.closed:
+                frames = self._frames
+                sizes = self._framesizes
+                self._frames = []
+                self._framesizes = {}
+                self.writer.write(b''.join(frames))
+                await self.writer.drain()
+                for nodename in sizes:
+                    remaining = self.backlog.get(nodename, 0) - sizes[nodename]
+                    if remaining > 0:
+                        self.backlog[nodename] = remaining
+                    else:
+                        self.backlog.pop(nodename, None)
+                progress = self._progress
+                self._progress = asyncio.Event()
+                progress.set()
+        except Exception:
+            self.close()
+        finally:
+            self._flusher = None
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._progress.set()
+        while self._replies:
+            reply = self._replies.popleft()
+            if not reply.done():
+                reply.set_exception(Exception("bad read"))
+        self._replyreader.cancel()
+        self.writer.close()
+
+    async def write(self, nodename, output):
+        while self.backlog.get(nodename, 0) > NODEBACKLOG and not self.closed:
+            await self._progress.wait()
+        if self.closed:
+            return
+        name = bytes([len(nodename)]) + nodename
+        for chunk in chunk_output(output, 8192):
+            self._queue(nodename, _vtframe(VT_NODEWRITE, name + chunk))
+
+    async def read_buffer(self, nodename):
+        if self.closed:
+            raise Exception("bad read")
+        reply = asyncio.get_running_loop().create_future()
+        self._replies.append(reply)
+        self._queue(nodename, _vtframe(VT_READBUFF, nodename))
+        return await reply
+
+
+async def get_buffer_channel():
+    """Get the shared channel to the buffer daemon, connecting if needed
+
+    :returns: A BufferChannel, or None if the buffer daemon is too old to
+              support one
+    """
+    global _bufferchannel
+    global _bufferchannellock
+    global _bufferlegacy
+    if _bufferchannel is not None and not _bufferchannel.closed:
+        return _bufferchannel
+    if _bufferlegacy:
+        return None
+    if _bufferchannellock is None:
+        _bufferchannellock = asyncio.Lock()
+    async with _bufferchannellock:
+        if _bufferchannel is not None and not _bufferchannel.closed:
+            return _bufferchannel
+        out = await _ensure_buffer_daemon()
+        rdr, writer = await asyncio.open_unix_connection(sock=out)
+        # An older daemon ignores the hello and only answers the empty read
+        writer.write(_vtframe(VT_HELLO) + _vtframe(VT_READBUFF))
+        await writer.drain()
+        try:
+            hello = await rdr.readexactly(1)
+            if hello != b'\x00':
+                await rdr.readexactly(1)
+        except Exception:
+            writer.close()
+            raise
+        if hello == b'\x00':
+            writer.close()
+            _bufferlegacy = True
+            return None
+        _bufferchannel = BufferChannel(rdr, writer)
+        return _bufferchannel
+
+
 async def get_buffer_output(nodename):
     try:
-        out = await _ensure_buffer_daemon()
+        chan = await get_buffer_channel()
     except Exception:
         return b''
-    rdr, writer = await asyncio.open_unix_connection(sock=out)
     if not isinstance(nodename, bytes):
         nodename = nodename.encode('utf8')
+    if chan is None:
+        return await _get_buffer_output_conn(nodename)
+    return await chan.read_buffer(nodename)
+
+
+async def _get_buffer_output_conn(nodename):
+    try:
+        out = await _ensure_buffer_daemon()
+    except Exception:
+        return b''
+    rdr, writer = await asyncio.open_unix_connection(sock=out)
     outdata = bytearray()
     writer.write(struct.pack('I', len(nodename)))
     writer.write(nodename)
@@ -109,11 +288,21 @@ async def get_buffer_output(nodename):
 
 async def send_output(nodename, output):
     try:
-        out = await _ensure_buffer_daemon()
+        chan = await get_buffer_channel()
     except Exception:
         return
     if not isinstance(nodename, bytes):
         nodename = nodename.encode('utf8')
+    if chan is None:
+        return await _send_output_conn(nodename, output)
+    await chan.write(nodename, output)
+
+
+async def _send_output_conn(nodename, output):
+    try:
+        out = await _ensure_buffer_daemon()
+    except Exception:
+        return
     rdr, writer = await asyncio.open_unix_connection(sock=out)
     hdr = struct.pack('I', len(nodename) | (1 << 29))
     writer.write(hdr)
@@ -125,6 +314,82 @@ async def send_output(nodename, output):
     writer.close()
     await writer.wait_closed()
 
+class _Resync(object):
+    pass
+
+
+class SessionFeed(object):
+    """Deliver console output to one attached session at its own pace
+
+    A session too slow to keep up has its backlog replaced by a redraw of the
+    screen, rather than holding up the console or the other sessions.
+
+    :param handler: The console handler the session is attached to
+    :param session: The session to deliver to
+    """
+
+    def __init__(self, handler, session):
+        self.handler = handler
+        self.session = session
+        self.closed = False
+        self.backlog = 0
+        self._items = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._task = tasks.spawn_task(self._run())
+
+    def put(self, data):
+        if isinstance(data, (bytes, str)):
+            if self.backlog + len(data) > SESSIONBACKLOG:
+                # This output is already in the buffer, so the redraw covers
+                # it along with all that is being discarded
+                self._items.clear()
+                self.backlog = 0
+                data = _Resync()
+            else:
+                self.backlog += len(data)
+        self._items.append(data)
+        self._wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self._wakeup.set()
+        if asyncio.current_task() is not self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while not self.closed:
+            if not self._items:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            data = self._items.popleft()
+            if isinstance(data, (bytes, str)):
+                self.backlog -= len(data)
+                while self._items and type(self._items[0]) is type(data):
+                    more = self._items.popleft()
+                    self.backlog -= len(more)
+                    data += more
+            try:
+                if isinstance(data, _Resync):
+                    # Output queued since is in the buffer as well, only
+                    # status updates are kept
+                    self._items = collections.deque(
+                        x for x in self._items
+                        if not isinstance(x, (bytes, str, _Resync)))
+                    self.backlog = 0
+                    for recdata in await self.handler.get_recent():
+                        if recdata:
+                            await self.session.data_handler(recdata)
+                else:
+                    await self.session.data_handler(data)
+            except exc.Disconnect:
+                await self.session.destroy()
+                return
+            except Exception:
+                _tracelog.log(traceback.format_exc(), ltype=log.DataTypes.event,
+                              event=log.Events.stacktrace)
+
+
 def _utf8_normalize(data, decoder):
     # first we give the stateful decoder a crack at the byte stream,
     # we may come up empty in the event of a partial multibyte
@@ -172,8 +437,11 @@ class ConsoleHandler(object):
         #self.termstream = pyte.ByteStream()
         #self.termstream.attach(self.buffer)
         self.livesessions = set([])
+        self._feeds = {}
+        self._pendingoutput = bytearray()
+        self._flushpending = False
+        self._outputlock = asyncio.Lock()
         self.utf8decoder = codecs.getincrementaldecoder('utf-8')()
-        self.pendingbytes = None
         if self._logtobuffer:
             self.logger = log.Logger(node, console=True,
                                      tenant=configmanager.tenant)
@@ -197,7 +465,8 @@ class ConsoleHandler(object):
         self.send_break = None
         if self._genwatchattribs:
             self._attribwatcher = self.cfgmgr.watch_attributes(
-                (self.node,), self._genwatchattribs, self._attribschanged)
+                (self.node,), self._genwatchattribs, self._attribschanged,
+                debounce=_attribdebounce)
         tasks.spawn(self.ondemand_init())
 
     async def ondemand_init(self):
@@ -223,16 +492,11 @@ class ConsoleHandler(object):
     async def feedbuffer(self, data):
         if not isinstance(data, bytes):
             data = data.encode('utf-8')
-        if self.pendingbytes is not None:
-            self.pendingbytes += data
-        self.pendingbytes = b''
         nodeid = self.termprefix + self.node
         try:
+            # Output is queued in order on the shared buffer channel, waiting
+            # only if this node is too far ahead of the buffer daemon
             await send_output(nodeid, data)
-            data = self.pendingbytes
-            self.pendingbytes = None
-            if data:
-                await send_output(nodeid, data)
         except Exception:
             _tracelog.log(traceback.format_exc(), ltype=log.DataTypes.event,
                           event=log.Events.stacktrace)
@@ -420,7 +684,8 @@ class ConsoleHandler(object):
             attribstowatch = self._genwatchattribs
         if self._genwatchattribs:
             self._attribwatcher = self.cfgmgr.watch_attributes(
-                (self.node,), attribstowatch, self._attribschanged)
+                (self.node,), attribstowatch, self._attribschanged,
+                debounce=_attribdebounce)
         try:
             self.resize(width=self.initsize[0], height=self.initsize[1])
             await self._console.connect(self.get_console_output)
@@ -503,6 +768,8 @@ class ConsoleHandler(object):
                 # indicate that user has multiple connections
                 edata = 2
         self.livesessions.add(session)
+        if session not in self._feeds:
+            self._feeds[session] = SessionFeed(self, session)
         self.log(
             logdata=session.username, ltype=log.DataTypes.event,
             event=log.Events.clientconnect, eventdata=edata)
@@ -522,6 +789,9 @@ class ConsoleHandler(object):
     async def detachsession(self, session):
         edata = 0
         self.livesessions.discard(session)
+        feed = self._feeds.pop(session, None)
+        if feed:
+            feed.close()
         for currsession in self.livesessions:
             if currsession.username == session.username:
                 edata += 1
@@ -541,6 +811,7 @@ class ConsoleHandler(object):
     async def _handle_console_output(self, data):
         if type(data) == int:
             if data == conapi.ConsoleEvent.Disconnect:
+                await self._flush_output()
                 await self._got_disconnected()
             return
         elif data in (b'', u''):
@@ -548,31 +819,41 @@ class ConsoleHandler(object):
             return
         if not isinstance(data, bytes):
             data = data.encode('utf-8')
-        eventdata = 0
-        # TODO: analyze buffer for registered events, examples:
-        #   panics
-        #   certificate signing request
-        if self.clearpending or self.clearerror:
-            self.clearpending = False
-            self.clearerror = False
-            await self.feedbuffer(b'\x1bc\x1b[2J\x1b[1;1H')
-            await self._send_rcpts(b'\x1bc\x1b[2J\x1b[1;1H')
-        await self._send_rcpts(_utf8_normalize(data, self.utf8decoder))
-        self.log(data, eventdata=eventdata)
-        self.lasttime = util.monotonic_time()
-        await self.feedbuffer(data)
-
+        self._pendingoutput.extend(data)
+        if len(self._pendingoutput) >= OUTPUTBATCH:
+            await self._flush_output()
+        elif not self._flushpending:
+            self._flushpending = True
+            tasks.spawn_task_after(OUTPUTWINDOW, self._flush_output)
+
+    async def _flush_output(self):
+        self._flushpending = False
+        async with self._outputlock:
+            if not self._pendingoutput:
+                return
+            data = bytes(self._pendingoutput)
+            self._pendingoutput.clear()
+            eventdata = 0
+            # TODO: analyze buffer for registered events, examples:
+            #   panics
+            #   certificate signing request
+            clear = b''
+            if self.clearpending or self.clearerror:
+                self.clearpending = False
+                self.clearerror = False
+                clear = b'\x1bc\x1b[2J\x1b[1;1H'
+            # The buffer is fed first, so that a session resynchronizing
+            # from it will see everything it was sent before
+            await self.feedbuffer(clear + data)
+            self.log(data, eventdata=eventdata)
+            self.lasttime = util.monotonic_time()
+            if clear:
+                await self._send_rcpts(clear)
+            await self._send_rcpts(_utf8_normalize(data, self.utf8decoder))
 
     async def _send_rcpts(self, data):
-        for rcpt in list(self.livesessions):
-            try:
-                await rcpt.data_handler(data)
-            except exc.Disconnect:
-                await rcpt.destroy()
-            except Exception as e:  # No matter the reason, advance to next recipient
-                print(repr(e))
-                _tracelog.log(traceback.format_exc(), ltype=log.DataTypes.event,
-                          event=log.Events.stacktrace)
+        for feed in list(self._feeds.values()):
+            feed.put(data)
 
     async def get_recent(self):
         """Retrieve 'recent' data
@@ -639,12 +920,15 @@ running = True
 
 async def run_buffer_daemon():
     global _bufferdaemon
+    global _bufferlegacy
     if _bufferdaemon is not None:
         return
     _bufferdaemon = True
     try:
         while running:
             minrestarttime = time.time() + 30
+            # The daemon may have been updated since it was last started
+            _bufferlegacy = False
             _bufferdaemon = await asyncio.subprocess.create_subprocess_exec(
                 '/opt/confluent/bin/vtbufferd', 'confluent-vtbuffer')
             await _bufferdaemon.wait()
@@ -40,6 +40,7 @@ import confluent.log as log
 import confluent.asynctlvdata as tlvdata
 import confluent.config.attributes as attrscheme
 import confluent.config.configmanager as cfm
+import confluent.collective.channel as collchannel
 import confluent.collective.manager as collective
 import confluent.discovery.core as disco
 import confluent.interface.console as console
@@ -570,6 +571,7 @@ def _init_core():
             },
         },
         'layout': PluginRoute({'handler': 'layout'}),
+        'ping': PluginRoute({'handler': 'ping'}),
         'media': {
             'uploads': PluginCollection({
                 'pluginattrs': ['hardwaremanagement.method'],
@@ -931,6 +933,14 @@ class BadCollective(object):
 def abbreviate_noderange(configmanager, inputdata, operation):
     if operation != 'create':
         raise exc.InvalidArgumentException('Must be a create with nodes in list')
+    if 'nodelists' in inputdata:
+        # Abbreviate several sets of nodes in one request
+        if not isinstance(inputdata['nodelists'], list) or not all(
+                isinstance(nodes, list) for nodes in inputdata['nodelists']):
+            raise exc.InvalidArgumentException('nodelists must be a list of lists of nodes')
+        return (msg.KeyValueData({'noderanges': [
+            noderange.ReverseNodeRange(nodes, configmanager).noderange
+            for nodes in inputdata['nodelists']]}),)
     if 'nodes' not in inputdata:
         raise exc.InvalidArgumentException('Must be given list of nodes under key named nodes')
     if isinstance(inputdata['nodes'], str) or isinstance(inputdata['nodes'], unicode):
@@ -958,7 +968,71 @@ async def handle_dispatch(connection, cert, dispatch, peername):
         return
     xmitlock = asyncio.Lock()
     keepalive = tasks.spawn_task(_keepalivefn(connection, xmitlock))
-    dispatch = msgpack.unpackb(dispatch[2:], raw=False)
+
+    async def forward(res):
+        async with xmitlock:
+            await _forward_rsp(connection, res)
+    await _run_dispatch(msgpack.unpackb(dispatch[2:], raw=False), forward)
+    keepalive.cancel()
+    connection[1].write(b'\x00\x00\x00\x00\x00\x00\x00\x00')
+    await connection[1].drain()
+    connection[1].close()
+    await connection[1].wait_closed()
+
+
+async def handle_dispatch_channel(connection, cert, peername):
+    member = cfm.get_collective_member(peername)
+    if not member or not util.cert_matches(member['fingerprint'], cert):
+        return
+    await tlvdata.send(connection, {'dispatchchannel': 1})
+    running = {}
+    # Only one task may wait on drain at a time before python 3.10
+    xmitlock = asyncio.Lock()
+    reader, writer = connection
+    try:
+        while True:
+            reqid, length = collchannel.HEADER.unpack(
+                await reader.readexactly(collchannel.HEADER.size))
+            dispatch = b''
+            if length:
+                dispatch = await reader.readexactly(length)
+            if not reqid:
+                writer.write(collchannel.frame(0))
+                continue
+            if not dispatch:
+                if reqid in running:
+                    running.pop(reqid).cancel()
+                continue
+            if dispatch[0:2] != b'\x01\x03':
+                return
+            running[reqid] = tasks.spawn_task(
+                _channel_dispatch(writer, xmitlock, reqid, dispatch,
+                                  running))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        for task in list(running.values()):
+            task.cancel()
+        writer.close()
+
+
+async def _channel_dispatch(writer, xmitlock, reqid, dispatch, running):
+    async def forward(res):
+        r = _serialize_rsp(res)
+        if r:
+            async with xmitlock:
+                writer.write(collchannel.frame(reqid, r))
+                await writer.drain()
+    try:
+        await _run_dispatch(msgpack.unpackb(dispatch[2:], raw=False), forward)
+    finally:
+        if running.get(reqid, None) is asyncio.current_task():
+            del running[reqid]
+        if not writer.is_closing():
+            writer.write(collchannel.frame(reqid))
+
+
+async def _run_dispatch(dispatch, forward):
     configmanager = cfm.ConfigManager(dispatch['tenant'])
     nodes = dispatch['nodes']
     inputdata = dispatch['inputdata']
@@ -970,13 +1044,7 @@ async def handle_dispatch(connection, cert, dispatch, peername):
             pathcomponents, operation, inputdata, nodes, dispatch['isnoderange'],
             configmanager)
     except Exception as res:
-        async with xmitlock:
-            await _forward_rsp(connection, res)
-        keepalive.cancel()
-        connection[1].write('\x00\x00\x00\x00\x00\x00\x00\x00')
-        await connection[1].drain()
-        connection[1].close()
-        await connection[1].wait_closed()
+        await forward(res)
         return
     plugroute = routespec.routeinfo
     nodesbyhandler = {}
@@ -1010,20 +1078,13 @@ async def handle_dispatch(connection, cert, dispatch, peername):
                 'configmanager': configmanager,
                 'inputdata': inputdata}))
         async for res in iterate_queue(numworkers, passvalues):
-            async with xmitlock:
-                await _forward_rsp(connection, res)
+            await forward(res)
     except Exception as res:
         print("oh noes, " + repr(res))
-        async with xmitlock:
-            await _forward_rsp(connection, res)
-    keepalive.cancel()
-    connection[1].write(b'\x00\x00\x00\x00\x00\x00\x00\x00')
-    await connection[1].drain()
-    connection[1].close()
-    await connection[1].wait_closed()
+        await forward(res)
 
 
-async def _forward_rsp(connection, res):
+def _serialize_rsp(res):
     try:
         r = res.serialize()
     except AttributeError:
@@ -1038,6 +1099,11 @@ async def _forward_rsp(connection, res):
             ['Exception',
              'Unable to serialize response ' + repr(res) + ' due to ' + str(e)],
             use_bin_type=False)
+    return r
+
+
+async def _forward_rsp(connection, res):
+    r = _serialize_rsp(res)
     rlen = len(r)
     if not rlen:
         return
@@ -1266,7 +1332,7 @@ async def dispatch_request(nodes, manager, element, configmanager, inputdata,
                      operation, isnoderange):
     a = configmanager.get_collective_member(manager)
     try:
-        remote = await collective.connect_to_collective(a['fingerprint'], a['address'])
+        chan = await collchannel.get_channel(a)
     except Exception as e:
         raise
         for node in nodes:
@@ -1281,6 +1347,44 @@ async def dispatch_request(nodes, manager, element, configmanager, inputdata,
                         manager))
 
         return
+    myname = collective.get_myname()
+    dreq =  b'\x01\x03' + msgpack.packb(
+        {'name': myname, 'nodes': list(nodes),
+        'path': element,'tenant': configmanager.tenant,
+        'operation': operation, 'inputdata': inputdata, 'isnoderange': isnoderange}, use_bin_type=False)
+    if chan is None:
+        async for rsp in _dispatch_legacy(a, nodes, myname, dreq):
+            yield rsp
+        return
+    try:
+        async for rsp in chan.request(dreq):
+            rsp = _decode_dispatched(rsp)
+            if rsp is not None:
+                yield rsp
+    except collchannel.ChannelLost:
+        for node in nodes:
+            yield msg.ConfluentResourceUnavailable(
+                node, 'Collective member {0} went unreachable'.format(
+                    a['name']))
+
+
+def _decode_dispatched(rsp):
+    if rsp == b'\x00':
+        return None
+    try:
+        rsp = msg.msg_deserialize(rsp)
+    except Exception:
+        rsp = exc.deserialize_exc(rsp)
+    if isinstance(rsp, Exception):
+        raise rsp
+    if not rsp:
+        raise Exception('Error in cross-collective serialize/deserialize, see remote logs')
+    return rsp
+
+
+async def _dispatch_legacy(a, nodes, myname, dreq):
+    # A connection per request, for members that do not take a channel
+    remote = await collective.connect_to_collective(a['fingerprint'], a['address'])
     banner = await tlvdata.recv(remote)
     vers = banner.split()[2]
     if vers == b'v0':
@@ -1290,11 +1394,6 @@ async def dispatch_request(nodes, manager, element, configmanager, inputdata,
     if sys.version_info[0] < 3:
         pvers = 2
     await tlvdata.recv(remote)
-    myname = collective.get_myname()
-    dreq =  b'\x01\x03' + msgpack.packb(
-        {'name': myname, 'nodes': list(nodes),
-        'path': element,'tenant': configmanager.tenant,
-        'operation': operation, 'inputdata': inputdata, 'isnoderange': isnoderange}, use_bin_type=False)
     await tlvdata.send(remote, {'dispatch': {'name': myname, 'length': len(dreq)}})
     remote[1].write(dreq)
     await remote[1].drain()
@@ -1342,17 +1441,9 @@ async def dispatch_request(nodes, manager, element, configmanager, inputdata,
                             a['name']))
                 return
             rsp += nrsp
-        if rsp == b'\x00':
-            continue
-        try:
-            rsp = msg.msg_deserialize(rsp)
-        except Exception:
-            rsp = exc.deserialize_exc(rsp)
-        if isinstance(rsp, Exception):
-            raise rsp
-        if not rsp:
-            raise Exception('Error in cross-collective serialize/deserialize, see remote logs')
-        yield rsp
+        rsp = _decode_dispatched(rsp)
+        if rsp is not None:
+            yield rsp
 
 
 def handle_discovery(pathcomponents, operation, configmanager, inputdata):
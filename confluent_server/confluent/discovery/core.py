@@ -63,6 +63,7 @@
 
 import asyncio
 import base64
+import bisect
 import confluent.config.configmanager as cfm
 import confluent.collective.manager as collective
 import confluent.discovery.protocols.pxe as pxe
@@ -86,6 +87,7 @@ import confluent.networking.macmap as macmap
 import confluent.noderange as noderange
 import confluent.tasks as tasks
 import confluent.util as util
+import fnmatch
 import inspect
 import json
 import traceback
@@ -204,6 +206,26 @@ known_info = {}
 known_services = {}
 known_serials = {}
 known_uuids = nesteddict()
+# For each listing selector, the macs in known_info having each value, so a
+# query need not examine every detected endpoint.  _indexedkeys remembers
+# what each mac was indexed under, to find the entries to update later
+_indexfields = (
+    ('by-model', 'modelnumber'),
+    ('by-node', 'nodename'),
+    ('by-serial', 'serialnumber'),
+    ('by-state', 'discostatus'),
+    ('by-uuid', 'uuid'),
+)
+_infoindex = {
+    'by-model': {},
+    'by-node': {},
+    'by-serial': {},
+    'by-state': {},
+    'by-type': {},
+    'by-uuid': {},
+}
+_indexedkeys = {}
+_sortedmacs = []
 known_nodes = nesteddict()
 unknown_info = {}
 pending_nodes = {}
@@ -228,6 +250,7 @@ def enrich_pxe_info(info):
             info['modelnumber'] = known_uuids[uuid][mac]['modelnumber']
         if nodename is None and 'nodename' in known_uuids[uuid][mac]:
             info['nodename'] = known_uuids[uuid][mac]['nodename']
+    _index_info(info)
 
 
 
@@ -317,44 +340,122 @@ def _info_matches(info, criteria):
     return True
 
 
+def _index_keys(info):
+    keys = []
+    for selector, field in _indexfields:
+        value = info.get(field, None)
+        if value:
+            keys.append((selector, value))
+    for service in info.get('services', ()):
+        keys.append(('by-type', service))
+    return keys
+
+
+def _index_info(info):
+    # Bring the indexes up to date with info, if it is still the current
+    # information for its mac
+    mac = info.get('hwaddr', None)
+    if mac is None or known_info.get(mac, None) is not info:
+        return
+    keys = _index_keys(info)
+    oldkeys = _indexedkeys.get(mac, None)
+    if oldkeys == keys:
+        return
+    if oldkeys is None:
+        bisect.insort(_sortedmacs, mac)
+    else:
+        _unindex_keys(mac, oldkeys)
+    for selector, value in keys:
+        _infoindex[selector].setdefault(value, set([])).add(mac)
+    _indexedkeys[mac] = keys
+
+
+def _unindex_keys(mac, keys):
+    for selector, value in keys:
+        macs = _infoindex[selector].get(value, None)
+        if macs is None:
+            continue
+        macs.discard(mac)
+        if not macs:
+            del _infoindex[selector][value]
+
+
+def _forget_info(mac):
+    del known_info[mac]
+    keys = _indexedkeys.pop(mac, None)
+    if keys is None:
+        return
+    _unindex_keys(mac, keys)
+    idx = bisect.bisect_left(_sortedmacs, mac)
+    if idx < len(_sortedmacs) and _sortedmacs[idx] == mac:
+        del _sortedmacs[idx]
+
+
+def _set_discostatus(info, status):
+    info['discostatus'] = status
+    _index_info(info)
+
+
+def _matching_macs(criteria):
+    """Find the macs of known_info matching the criteria
+
+    :returns: A set of macs, or None if there are no criteria to apply
+    """
+    candidates = []
+    for selector in _infoindex:
+        if selector in criteria:
+            candidates.append(_infoindex[selector].get(criteria[selector], ()))
+    if not candidates:
+        return None
+    candidates.sort(key=len)
+    matched = set(candidates[0])
+    for macs in candidates[1:]:
+        matched &= macs
+    # Confirm against the data itself, so anything that changed underneath
+    # the index is not misreported
+    return set(mac for mac in matched
+               if _info_matches(known_info[mac], criteria))
+
+
 def list_matching_nodes(criteria):
+    matched = _matching_macs(criteria)
     retnodes = []
     for node in known_nodes:
         for mac in known_nodes[node]:
             if mac not in known_info:
                 continue
-            info = known_info[mac]
-            if _info_matches(info, criteria):
+            if matched is None or mac in matched:
                 retnodes.append(node)
                 break
     retnodes.sort(key=noderange.humanify_nodename)
-    return [msg.ChildCollection(node + '/') for node in retnodes]
+    return [node + '/' for node in retnodes]
 
 
 def list_matching_serials(criteria):
-    for serial in sorted(list(known_serials)):
-        info = known_serials[serial]
-        if _info_matches(info, criteria):
-            yield msg.ChildCollection(serial + '/')
+    matched = _matching_macs(criteria)
+    serials = _infoindex['by-serial']
+    return [serial + '/' for serial in sorted(serials)
+            if matched is None or not serials[serial].isdisjoint(matched)]
+
 
 def list_matching_uuids(criteria):
-    for uuid in sorted(list(known_uuids)):
-        for mac in known_uuids[uuid]:
-            info = known_uuids[uuid][mac]
-            if _info_matches(info, criteria):
-                yield msg.ChildCollection(uuid + '/')
-                break
+    matched = _matching_macs(criteria)
+    uuids = _infoindex['by-uuid']
+    return [uuid + '/' for uuid in sorted(uuids) if uuid_is_valid(uuid) and (
+        matched is None or not uuids[uuid].isdisjoint(matched))]
 
 
 def list_matching_states(criteria):
-    return [msg.ChildCollection(x) for x in ('discovered/', 'identified/',
-                                             'unidentified/')]
+    return ['discovered/', 'identified/', 'unidentified/']
+
 
 def list_matching_macs(criteria):
-    for mac in sorted(list(known_info)):
-        info = known_info[mac]
-        if _info_matches(info, criteria):
-            yield msg.ChildCollection(mac.replace(':', '-'))
+    matched = _matching_macs(criteria)
+    if matched is None:
+        macs = _sortedmacs
+    else:
+        macs = sorted(matched)
+    return [mac.replace(':', '-') for mac in macs]
 
 
 def list_matching_types(criteria):
@@ -364,15 +465,34 @@ def list_matching_types(criteria):
         if ('by-model' not in criteria or
                 criteria['by-model'] in known_services[infotype]):
             rettypes.append(typename)
-    return [msg.ChildCollection(typename + '/')
-            for typename in sorted(rettypes)]
+    return [typename + '/' for typename in sorted(rettypes)]
 
 
 def list_matching_models(criteria):
-    for model in sorted(list(detected_models())):
-        if ('by-type' not in criteria or
-                model in known_services[criteria['by-type']]):
-            yield msg.ChildCollection(model + '/')
+    return [model + '/' for model in sorted(list(detected_models()))
+            if ('by-type' not in criteria or
+                model in known_services[criteria['by-type']])]
+
+
+def _page_listing(names, inputdata):
+    # offset and limit select a page of a listing, for a client walking
+    # through a large number of detected endpoints
+    if not inputdata:
+        return names
+    try:
+        offset = int(inputdata.get('offset', 0))
+        limit = inputdata.get('limit', None)
+        if limit is not None:
+            limit = int(limit)
+    except (TypeError, ValueError):
+        raise exc.InvalidArgumentException(
+            'offset and limit must be integers')
+    if offset < 0 or (limit is not None and limit < 0):
+        raise exc.InvalidArgumentException(
+            'offset and limit may not be negative')
+    if limit is None:
+        return names[offset:]
+    return names[offset:offset + limit]
 
 
 def show_info(mac):
@@ -571,7 +691,7 @@ async def handle_api_request(configmanager, inputdata, operation, pathcomponents
         currsubs = get_subscriptions()
         return [msg.ChildCollection(x) for x in currsubs]
     elif operation == 'retrieve':
-        return handle_read_api_request(pathcomponents)
+        return handle_read_api_request(pathcomponents, inputdata)
     elif (operation in ('update', 'create') and
             pathcomponents == ['discovery', 'rescan']):
         if inputdata != {'rescan': 'start'}:
@@ -623,7 +743,7 @@ async def handle_api_request(configmanager, inputdata, operation, pathcomponents
             if mac in known_nodes[node]:
                 del known_nodes[node][mac]
         if mac in known_info:
-            del known_info[mac]
+            _forget_info(mac)
         return [msg.DeletedResource(mac)]
     raise exc.NotImplementedException(
         'Unable to {0} to {1}'.format(operation, '/'.join(pathcomponents)))
@@ -639,7 +759,7 @@ def _get_mac_from_query(pathcomponents):
     return mac
 
 
-def handle_read_api_request(pathcomponents):
+def handle_read_api_request(pathcomponents, inputdata=None):
     # TODO(jjohnson2): This should be more generalized...
     #  odd indexes into components are 'by-'*, even indexes
     # starting at 2 are parameters to previous index
@@ -661,7 +781,8 @@ def handle_read_api_request(pathcomponents):
         return [msg.ChildCollection(x + '/') for x in sorted(list(subcats))]
     if indexof not in list_info:
         raise exc.NotFoundException('{0} is not found'.format(indexof))
-    return list_info[indexof](queryparms)
+    return [msg.ChildCollection(x) for x in _page_listing(
+        list_info[indexof](queryparms), inputdata)]
 
 
 def detected_services():
@@ -678,18 +799,111 @@ def detected_models():
             yield info['modelnumber']
 
 
+def _merge_rechecks(queued, nodeattribs):
+    # An empty nodeattribs asks for everything to be rechecked
+    if queued is None:
+        return nodeattribs
+    if not queued or not nodeattribs:
+        return ()
+    merged = dict(queued)
+    for node in nodeattribs:
+        merged[node] = list(set(merged.get(node, ())) |
+                            set(nodeattribs[node]))
+    return merged
+
+
 async def _recheck_nodes(nodeattribs, configmanager):
     if not cfm.config_is_ready():
         return
     global rechecklock
+    global queuedrecheck
     if rechecklock is None:
         rechecklock = asyncio.Lock()
     if rechecklock.locked():
-        # if already in progress, don't run again
-        # it may make sense to schedule a repeat, but will try the easier and less redundant way first
+        # if already in progress, leave a single recheck to follow it,
+        # covering this request along with any already waiting
+        queuedrecheck = _merge_rechecks(queuedrecheck, nodeattribs)
         return
     async with rechecklock:
-        return await _recheck_nodes_backend(nodeattribs, configmanager)
+        await _recheck_nodes_backend(nodeattribs, configmanager)
+        while queuedrecheck is not None:
+            nodeattribs = queuedrecheck
+            queuedrecheck = None
+            await _recheck_nodes_backend(nodeattribs, configmanager)
+
+
+def _recheck_candidates(nodeattribs, configmanager):
+    """Pick out the unknown endpoints a change to nodeattribs could identify
+
+    An endpoint is identified by its own uuid or that of its enclosure, by
+    certificate fingerprint or by where its mac address is seen on the
+    switches, so only a change to one of those can make a difference.  A
+    change to hardwaremanagement.manager may alter how an enclosure manager
+    is reached, so every endpoint is reconsidered for it.
+    """
+    uuidnodes = set()
+    switchnodes = set()
+    fprintchanged = False
+    for node in nodeattribs:
+        for attrname in nodeattribs[node]:
+            if attrname == 'hardwaremanagement.manager':
+                return list(unknown_info)
+            elif attrname == 'id.uuid':
+                uuidnodes.add(node)
+            elif fnmatch.fnmatch(attrname, 'net*.switch*'):
+                switchnodes.add(node)
+            elif attrname == 'pubkeys.tls_hardwaremanager':
+                fprintchanged = True
+    uuids = set()
+    for node, attrs in configmanager.get_node_attributes(
+            uuidnodes, 'id.uuid').items():
+        uuid = attrs.get('id.uuid', {}).get('value', None)
+        if uuid_is_valid(uuid):
+            uuids.add(uuid.lower())
+    switches = set()
+    for attrs in configmanager.get_node_attributes(
+            switchnodes, 'net*.switch').values():
+        for attrname in attrs:
+            switch = attrs[attrname].get('value', None)
+            if switch:
+                switches.add(switch)
+    candidates = []
+    for mac in list(unknown_info):
+        info = unknown_info[mac]
+        handler = info.get('handler', None)
+        if fprintchanged and handler is not None and handler != pxeh:
+            candidates.append(mac)
+        elif uuids and (info.get('uuid', None) or '').lower() in uuids:
+            candidates.append(mac)
+        elif uuids and _enclosure_uuid(info) in uuids:
+            # a blade, identified through its enclosure
+            candidates.append(mac)
+        elif switchnodes and (
+                mac not in macmap._macmap or
+                any(ent[0] in switches for ent in macmap._macmap[mac])):
+            # Not seen anywhere yet could mean anywhere
+            candidates.append(mac)
+    return candidates
+
+
+def _enclosure_uuid(info):
+    cuuid = info.get('enclosure.uuid', None)
+    if not cuuid:
+        cuuid = info.get('attributes', {}).get('chassis-uuid', [None])[0]
+    return (cuuid or '').lower()
+
+
+async def _recheck_unknowns(configmanager, macs):
+    limit = asyncio.Semaphore(recheckconcurrency)
+
+    async def recheck(mac):
+        async with limit:
+            try:
+                await _recheck_single_unknown(configmanager, mac)
+            except Exception:
+                traceback.print_exc()
+    await asyncio.gather(*[recheck(mac) for mac in macs])
+
 
 async def _recheck_nodes_backend(nodeattribs, configmanager):
     global rechecker
@@ -697,20 +911,20 @@ async def _recheck_nodes_backend(nodeattribs, configmanager):
     # for the nodes whose attributes have changed, consider them as potential
     # strangers
     if nodeattribs:
-        macmap.vintage = 0  # expire current mac map data, in case
-        # the attributes changed impacted the result
+        # reconsider the switch topology, and walk again any switch whose
+        # own attributes changed, in case that impacted the result
+        macmap.expire(nodeattribs)
+        macs = _recheck_candidates(nodeattribs, configmanager)
+    else:
+        macs = list(unknown_info)
     for node in nodeattribs:
         if node in known_nodes:
             for somemac in known_nodes[node]:
                 unknown_info[somemac] = known_nodes[node][somemac]
-                unknown_info[somemac]['discostatus'] = 'unidentified'
+                _set_discostatus(unknown_info[somemac], 'unidentified')
+                macs.append(somemac)
     # Now we go through ones we did not find earlier
-    for mac in list(unknown_info):
-        try:
-            await _recheck_single_unknown(configmanager, mac)
-        except Exception:
-            traceback.print_exc()
-            continue
+    await _recheck_unknowns(configmanager, dict.fromkeys(macs))
     # now we go through ones that were identified, but could not pass
     # policy or hadn't been able to verify key
     for nodename in pending_nodes:
@@ -777,7 +991,7 @@ async def _recheck_single_unknown_info(configmanager, info):
             if util.cert_matches(lastfp, await handler.get_https_cert()):
                 info['nodename'] = nodename
                 known_nodes[nodename][info['hwaddr']] = info
-                info['discostatus'] = 'discovered'
+                _set_discostatus(info, 'discovered')
                 return  # already known, no need for more
         tasks.spawn(eval_node(configmanager, handler, info, nodename))
 
@@ -872,6 +1086,7 @@ async def detected(info):
     uuid = info.get('uuid', None)
     if uuid_is_valid(uuid):
         known_uuids[uuid][info['hwaddr']] = info
+    _index_info(info)
     info['otheraddresses'] = set([])
     for i4addr in info.get('attributes', {}).get('ipv4-address', []):
         info['otheraddresses'].add(i4addr)
@@ -898,7 +1113,7 @@ async def detected(info):
             rechecktime = util.monotonic_time() + 300
             rechecker = tasks.spawn_task_after(300, _periodic_recheck, cfg)
         unknown_info[info['hwaddr']] = info
-        info['discostatus'] = 'unidentified'
+        _set_discostatus(info, 'unidentified')
         #TODO, spawn after to recheck sooner, or somehow else
         # influence periodic recheck to shorten delay?
         return
@@ -912,7 +1127,7 @@ async def detected(info):
         if util.cert_matches(lastfp, await handler.get_https_cert()):
             info['nodename'] = nodename
             known_nodes[nodename][info['hwaddr']] = info
-            info['discostatus'] = 'discovered'
+            _set_discostatus(info, 'discovered')
             uuid = info.get('uuid', None)
             if uuid:
                 storeuuid = dp.get('id.uuid', {}).get('value', None)
@@ -936,7 +1151,7 @@ async def detected(info):
         #             'address {2}'.format(
         #                handler.devname, info['hwaddr'], handler.ipaddr
         #              )})
-        info['discostatus'] = 'unidentified'
+        _set_discostatus(info, 'unidentified')
         unknown_info[info['hwaddr']] = info
 
 
@@ -1260,7 +1475,7 @@ async def eval_node(cfg, handler, info, nodename, manual=False):
         await handler.preconfig(nodename)
     except Exception:
         unknown_info[info['hwaddr']] = info
-        info['discostatus'] = 'unidentified'
+        _set_discostatus(info, 'unidentified')
         errorstr = 'An error occurred during discovery, check the ' \
                    'trace and stderr logs, mac was {0} and ip was {1}' \
                    ', the node or the containing enclosure was {2}' \
@@ -1275,7 +1490,7 @@ async def eval_node(cfg, handler, info, nodename, manual=False):
     # the node directly.  switch is ambiguous and we should leave it alone
     if 'enclosure.bay' in info and handler.is_enclosure:
         unknown_info[info['hwaddr']] = info
-        info['discostatus'] = 'unidentified'
+        _set_discostatus(info, 'unidentified')
         log.log({'error': 'Something that is an enclosure reported a bay, '
                           'not possible'})
         if manual:
@@ -1296,7 +1511,7 @@ async def eval_node(cfg, handler, info, nodename, manual=False):
                 return
         if 'enclosure.bay' not in info:
             unknown_info[info['hwaddr']] = info
-            info['discostatus'] = 'unidentified'
+            _set_discostatus(info, 'unidentified')
             errorstr = '{2} with mac {0} is in {1}, but unable to ' \
                        'determine bay number'.format(info['hwaddr'],
                                                      nodename,
@@ -1362,7 +1577,7 @@ async def eval_node(cfg, handler, info, nodename, manual=False):
                 raise exc.InvalidArgumentException(errorstr)
             log.log({'error': errorstr})
             unknown_info[info['hwaddr']] = info
-            info['discostatus'] = 'unidentified'
+            _set_discostatus(info, 'unidentified')
             return
         nodename = nl[0]
         if not await discover_node(cfg, handler, info, nodename, manual):
@@ -1420,7 +1635,7 @@ async def discover_node(cfg, handler, info, nodename, manual):
     known_nodes[nodename][info['hwaddr']] = info
     if info['hwaddr'] in unknown_info:
         del unknown_info[info['hwaddr']]
-    info['discostatus'] = 'identified'
+    _set_discostatus(info, 'identified')
     dp = cfg.get_node_attributes(
         [nodename], ('discovery.policy', 'id.uuid',
                      'pubkeys.tls_hardwaremanager'))
@@ -1457,6 +1672,7 @@ async def discover_node(cfg, handler, info, nodename, manual):
                          'first'.format(nodename)})
                 return False
         info['nodename'] = nodename
+        _index_info(info)
         if info['handler'] == pxeh:
             return await do_pxe_discovery(cfg, handler, info, manual, nodename, policies)
         elif manual or not util.cert_matches(lastfp, await handler.get_https_cert()):
@@ -1521,7 +1737,7 @@ async def discover_node(cfg, handler, info, nodename, manual):
             if verification and handler.current_cert_self_signed():
                 await handler.autosign_certificate()
 
-        info['discostatus'] = 'discovered'
+        _set_discostatus(info, 'discovered')
         for i in pending_by_uuid.get(curruuid, []):
             tasks.spawn(_recheck_single_unknown_info(cfg, i))
         try:
@@ -1608,7 +1824,7 @@ needaddhandled = False
 async def _handle_nodelist_change(configmanager):
     global needaddhandled
     global nodeaddhandler
-    macmap.vintage = 0  # the current mac map is probably inaccurate
+    macmap.expire()  # the current switch topology is probably inaccurate
     await _recheck_nodes((), configmanager)
     if needaddhandled:
         needaddhandled = False
@@ -1627,7 +1843,7 @@ async def newnodes(added, deleting, renamed, configmanager):
             continue
         for mac in known_nodes[node]:
             if mac in known_info:
-                del known_info[mac]
+                _forget_info(mac)
         del known_nodes[node]
     _map_unique_ids()
     configmanager.remove_watcher(attribwatcher)
@@ -1647,6 +1863,9 @@ async def newnodes(added, deleting, renamed, configmanager):
 rechecker = None
 rechecktime = None
 rechecklock = None
+queuedrecheck = None
+# How many unknown endpoints to look at again at once
+recheckconcurrency = 32
 
 async def _periodic_recheck(configmanager):
     global rechecker
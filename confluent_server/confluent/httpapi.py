@@ -425,6 +425,8 @@ def _pick_mimetype(req):
         return 'application/json; charset=utf-8', '.json'
     elif req.rel_url.path.endswith('.html'):
         return 'text/html', '.html'
+    elif 'Accept' in req.headers and 'application/x-ndjson' in req.headers['Accept']:
+        return 'application/x-ndjson; charset=utf-8', ''
     elif 'Accept' in req.headers and 'application/json' in req.headers['Accept']:
         return 'application/json; charset=utf-8', ''
     else:
@@ -1081,19 +1083,18 @@ async def resourcehandler_backend(req, make_response):
                 rsp = await make_response('text/plain', 202, cookies=cookies)
                 await rsp.write(b'Request queued')
                 return rsp
-            pagecontent = ""
             if mimetype == 'text/html':
+                pagecontent = ""
                 for datum in _assemble_html(hdlr, resource, lquerydict, url,
                                             extension):
                     pagecontent += datum
-            else:
-                async for datum in _assemble_json(hdlr, resource, url, extension):
-                    pagecontent += datum
-            rsp = await make_response(mimetype, 200, cookies=cookies)
-            if not isinstance(pagecontent, bytes):
-                pagecontent = pagecontent.encode('utf-8')
-            await rsp.write(pagecontent)
-            return rsp
+                rsp = await make_response(mimetype, 200, cookies=cookies)
+                await rsp.write(pagecontent.encode('utf-8'))
+                return rsp
+            return await _stream_response(
+                _assemble_json(hdlr, resource, url, extension,
+                               _pick_jsonformat(req, mimetype)),
+                make_response(mimetype, 200, cookies=cookies))
         except exc.ConfluentException as e:
             if ((not isinstance(e, exc.LockedCredentials)) and
                     e.apierrorcode == 500):
@@ -1161,12 +1162,67 @@ def _assemble_html(responses, resource, querydict, url, extension):
                '</form></body></html>')
 
 
-async def _assemble_json(responses, resource=None, url=None, extension=None):
-    #NOTE(jbjohnso) I'm considering giving up on yielding bit by bit
-    #in json case over http.  Notably, duplicate key values from plugin
-    #overwrite, but we'd want to preserve them into an array instead.
-    #the downside is that http would just always blurt it ll out at
-    #once and hold on to all the data in memory
+async def _stream_response(chunks, start_response):
+    """Write a response as it is produced
+
+    The response is only started with the first chunk, so an error before
+    then can still be reported with a suitable status.  Once started, an
+    error can only cut the response short.
+
+    :param chunks: Async iterable of str to send
+    :param start_response: Awaitable to start the response
+    """
+    rsp = None
+    try:
+        async for chunk in chunks:
+            if rsp is None:
+                rsp = await start_response
+            await rsp.write(chunk.encode('utf-8'))
+    except Exception:
+        if rsp is None:
+            start_response.close()
+            raise
+        tracelog.log(traceback.format_exc(), ltype=log.DataTypes.event,
+                     event=log.Events.stacktrace)
+    if rsp is None:
+        rsp = await start_response
+    return rsp
+
+
+def _pick_jsonformat(req, mimetype):
+    """Determine how a JSON response should be laid out
+
+    'ndjson' gives a line per message, 'compact' a document without
+    whitespace, and otherwise the document is indented for reading.
+    """
+    if mimetype.startswith('application/x-ndjson'):
+        return 'ndjson'
+    if req.headers.get('ConfluentJsonFormat', None) == 'compact':
+        return 'compact'
+    return 'pretty'
+
+
+def _json_value(value, jsonformat, depth):
+    if jsonformat == 'pretty':
+        return json.dumps(value, sort_keys=True, indent=4,
+                          ensure_ascii=False).replace('\n', '\n' + '    ' * depth)
+    return json.dumps(value, sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=False)
+
+
+def _json_unicode(value):
+    if isinstance(value, dict):
+        tlvdata.unicode_dictvalues(value)
+    elif isinstance(value, list):
+        tlvdata.unicode_dictvalues({'': value})
+    return util.stringify(value) if isinstance(value, bytes) else value
+
+
+async def _assemble_json(responses, resource=None, url=None, extension=None,
+                         jsonformat='pretty'):
+    # databynode entries are written out as they arrive, everything else is
+    # merged as it always has been and follows at the end.  Notably,
+    # duplicate keys from plugins are preserved into an array.
     links = {}
     if resource is not None:
         links['self'] = {"href": resource + extension}
@@ -1176,7 +1232,12 @@ async def _assemble_json(responses, resource=None, url=None, extension=None):
             links['collection'] = {"href": "../" + extension}
         else:
             links['collection'] = {"href": "./" + extension}
+    if jsonformat == 'pretty':
+        entrysep, entrystart, keysep = ',\n        ', '\n        ', ': '
+    else:
+        entrysep, entrystart, keysep = ',', '', ':'
     rspdata = {}
+    streamed = False
     async for rsp in pluginapi.iterate_responses(responses):
         if isinstance(rsp, confluent.messages.LinkRelation):
             haldata = rsp.raw()
@@ -1194,29 +1255,53 @@ async def _assemble_json(responses, resource=None, url=None, extension=None):
                     links[hk] = [haldata[hk],]
                 else:
                     links[hk] = haldata[hk]
-        else:
-            rsp = rsp.raw()
-            for dk in rsp:
-                if dk in rspdata:
-                    if isinstance(rspdata[dk], list):
-                        if isinstance(rsp[dk], list):
-                            rspdata[dk].extend(rsp[dk])
-                        else:
-                            rspdata[dk].append(rsp[dk])
+            continue
+        rsp = rsp.raw()
+        if jsonformat == 'ndjson':
+            yield _json_value(_json_unicode(rsp), jsonformat, 0) + '\n'
+            continue
+        for dk in rsp:
+            if dk == 'databynode':
+                # a quirk, databynode suggests noderange
+                # multi response.  This should *always* be a list,
+                # even if it will be length 1
+                entries = rsp[dk]
+                if not isinstance(entries, list):
+                    entries = [entries]
+                for entry in entries:
+                    entry = _json_value(_json_unicode(entry), jsonformat, 2)
+                    if streamed:
+                        yield entrysep + entry
                     else:
-                        rspdata[dk] = [rspdata[dk], rsp[dk]]
-                else:
-                    if dk == 'databynode' or dk == 'asyncresponse':
-                        # a quirk, databynode suggests noderange
-                        # multi response.  This should *always* be a list,
-                        # even if it will be length 1
-                        rspdata[dk] = [rsp[dk]]
+                        streamed = True
+                        yield '{' + entrystart[:-4] + '"databynode"' + \
+                            keysep + '[' + entrystart + entry
+            elif dk in rspdata:
+                if isinstance(rspdata[dk], list):
+                    if isinstance(rsp[dk], list):
+                        rspdata[dk].extend(rsp[dk])
                     else:
-                        rspdata[dk] = rsp[dk]
+                        rspdata[dk].append(rsp[dk])
+                else:
+                    rspdata[dk] = [rspdata[dk], rsp[dk]]
+            else:
+                if dk == 'asyncresponse':
+                    rspdata[dk] = [rsp[dk]]
+                else:
+                    rspdata[dk] = rsp[dk]
+    if jsonformat == 'ndjson':
+        yield _json_value({'_links': links}, jsonformat, 0) + '\n'
+        return
     rspdata["_links"] = links
     tlvdata.unicode_dictvalues(rspdata)
-    yield util.stringify(json.dumps(
-        rspdata, sort_keys=True, indent=4, ensure_ascii=False).encode('utf-8'))
+    if not streamed:
+        yield _json_value(rspdata, jsonformat, 0)
+        return
+    tail = [entrystart[:-4] + ']']
+    for dk in sorted(rspdata):
+        tail.append(entrystart[:-4] + json.dumps(dk, ensure_ascii=False) +
+                    keysep + _json_value(rspdata[dk], jsonformat, 1))
+    yield ','.join(tail) + entrystart[:-8] + '}'
 
 
 async def serve(bind_host, bind_port, bind_group, bind_perms):
@@ -63,6 +63,7 @@
 #    (a future extended version might include suport for Forward Secure Sealing
 #    or other fields)
 
+import bisect
 import collections
 import confluent.config.configmanager
 import confluent.config.conf as conf
@@ -70,10 +71,12 @@ import confluent.exceptions as exc
 import confluent.tasks as tasks
 import glob
 import json
+import mmap
 import os
 import re
 import stat
 import struct
+import threading
 import time
 import traceback
 try:
@@ -112,6 +115,22 @@ except ImportError:
 
 MIDNIGHT = 24 * 60 * 60
 _loggers = {}
+# The 16 byte record of the binary half of a log, as described above
+_binrecord = struct.Struct('>BBIHIBBH')
+_bintstamp = struct.Struct('>I')
+# Every INDEX_STRIDE records of a binary log, the latest timestamp so far is
+# kept in an index, so a time can be found without decoding every record
+INDEX_STRIDE = 256
+_timeindexes = collections.OrderedDict()
+_maxtimeindexes = 512
+# Records are decoded this many at a time
+_readchunk = 4096
+# The batched writer, if [log] writer = thread is configured
+_groupwriter = None
+try:
+    _iovmax = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _iovmax = 1024
 
 
 class Events(object):
@@ -523,6 +542,258 @@ class TimedAndSizeRotatingFileHandler(BaseRotatingHandler):
             return self._timeRoll()
 
 
+class LogReader(object):
+    """Read one text log and its binary half
+
+    Both files are mapped into memory as they stand when opened, and records
+    are decoded a chunk at a time rather than with a seek and read apiece.
+
+    :param textpath: The path to the text log
+    :param binpath: The path to the binary (.cbl) log
+    """
+
+    def __init__(self, textpath, binpath):
+        self.textpath = textpath
+        self.binpath = binpath
+        self.binmap = None
+        self.textmap = None
+        self.numrecords = 0
+        self.fileid = None
+        # The binary half is mapped first, text being written ahead of the
+        # record referring to it, so every record mapped has its text
+        with open(binpath, 'rb') as binfile:
+            binstat = os.fstat(binfile.fileno())
+            self.fileid = (binstat.st_dev, binstat.st_ino)
+            self.numrecords = binstat.st_size // _binrecord.size
+            if self.numrecords:
+                self.binmap = mmap.mmap(
+                    binfile.fileno(), self.numrecords * _binrecord.size,
+                    access=mmap.ACCESS_READ)
+        try:
+            with open(textpath, 'rb') as textfile:
+                flock(textfile, LOCK_SH)
+                try:
+                    if os.fstat(textfile.fileno()).st_size:
+                        self.textmap = mmap.mmap(textfile.fileno(), 0,
+                                                 access=mmap.ACCESS_READ)
+                finally:
+                    flock(textfile, LOCK_UN)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.binmap is not None:
+            self.binmap.close()
+            self.binmap = None
+        if self.textmap is not None:
+            self.textmap.close()
+            self.textmap = None
+
+    def records(self, first=0, last=None):
+        """Yield the decoded records from first up to last, in order"""
+        if last is None:
+            last = self.numrecords
+        while first < last:
+            chunkend = min(last, first + _readchunk)
+            for record in _binrecord.iter_unpack(
+                    self.binmap[first * _binrecord.size:
+                                chunkend * _binrecord.size]):
+                yield record
+            first = chunkend
+
+    def reversed_records(self):
+        """Yield the decoded records, newest first"""
+        last = self.numrecords
+        while last > 0:
+            first = max(0, last - _readchunk)
+            chunk = list(_binrecord.iter_unpack(
+                self.binmap[first * _binrecord.size:last * _binrecord.size]))
+            for record in reversed(chunk):
+                yield record
+            last = first
+
+    def text(self, offset, length):
+        if self.textmap is None:
+            return b''
+        return self.textmap[offset:offset + length]
+
+    def timestamp(self, recordnum):
+        return _bintstamp.unpack_from(
+            self.binmap, recordnum * _binrecord.size + 8)[0]
+
+    def time_index(self):
+        """Get the latest timestamp as of every INDEX_STRIDE'th record
+
+        The index is kept across readers, and extended as the log grows.
+        """
+        indexed, index = _timeindexes.get(self.fileid, (0, []))
+        if indexed > self.numrecords:  # the file was truncated, start over
+            indexed, index = 0, []
+        if indexed < self.numrecords:
+            index = list(index)
+            latest = index[-1] if index else 0
+            for recordnum in range(len(index) * INDEX_STRIDE,
+                                   self.numrecords, INDEX_STRIDE):
+                latest = max(latest, self.timestamp(recordnum))
+                index.append(latest)
+            _timeindexes[self.fileid] = (self.numrecords, index)
+        _timeindexes.move_to_end(self.fileid)
+        while len(_timeindexes) > _maxtimeindexes:
+            _timeindexes.popitem(last=False)
+        return index
+
+    def find_time(self, tstamp):
+        """Find the first record at or after a time
+
+        :returns: The record number, or numrecords if there is none
+        """
+        if not self.numrecords:
+            return 0
+        pos = bisect.bisect_left(self.time_index(), tstamp)
+        recordnum = max(0, pos - 1) * INDEX_STRIDE
+        while recordnum < self.numrecords:
+            if self.timestamp(recordnum) >= tstamp:
+                break
+            recordnum += 1
+        return recordnum
+
+    def rolled_from(self):
+        """Get the text and binary paths of the log this one followed
+
+        :returns: (textpath, binpath), or None if it did not follow one
+        """
+        if not self.numrecords:
+            return None
+        _, ltype, offset, datalen, _, evtdata, _, _ = next(self.records(0, 1))
+        if ltype != DataTypes.event or evtdata != Events.logrollover:
+            return None
+        return _parse_rollover(self.text(offset, datalen))
+
+
+def _parse_rollover(rolldata):
+    textpath = json.loads(rolldata)['previouslogfile']
+    dir_name, base_name = os.path.split(textpath)
+    temp = base_name.split('.')
+    temp.insert(1, 'cbl')
+    # find the recent bin file
+    binpath = os.path.join(dir_name, ".".join(temp))
+    return textpath, binpath
+
+
+def _writev(fd, chunks):
+    for idx in range(0, len(chunks), _iovmax):
+        batch = chunks[idx:idx + _iovmax]
+        written = os.writev(fd, batch)
+        if written < sum(len(chunk) for chunk in batch):
+            remainder = b''.join(batch)[written:]
+            while remainder:
+                remainder = remainder[os.write(fd, remainder):]
+
+
+class GroupWriter(object):
+    """Write the entries of buffered loggers in batches, on a thread
+
+    Loggers with entries waiting are gathered for interval seconds, then
+    each has everything it has queued written in one go.
+
+    :param interval: Seconds to gather entries before writing them
+    """
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        self.pending = {}
+        self.lastwrite = {}
+        self.cond = threading.Condition()
+        self.batches = 0
+        self.records = 0
+        self.lastbatchtime = 0.0
+        self.lastlatency = 0.0
+        self.maxlatency = 0.0
+        self.thread = threading.Thread(target=self._run, name='logwriter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def schedule(self, logger):
+        with self.cond:
+            if logger not in self.pending:
+                self.pending[logger] = time.monotonic()
+                self.cond.notify()
+
+    def get_stats(self):
+        with self.cond:
+            pending = list(self.pending)
+        return {
+            'pendingloggers': len(pending),
+            'pendingentries': sum(len(lg.logentries) for lg in pending),
+            'batches': self.batches,
+            'records': self.records,
+            'lastbatchtime': self.lastbatchtime,
+            'lastlatency': self.lastlatency,
+            'maxlatency': self.maxlatency,
+        }
+
+    def _close_idle(self, now):
+        for logger in list(self.lastwrite):
+            if now - self.lastwrite[logger] > 15:
+                del self.lastwrite[logger]
+                with logger.writelock:
+                    logger.handler.close()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait(15)
+                    self._close_idle(time.monotonic())
+                batch = self.pending
+                self.pending = {}
+            start = time.monotonic()
+            records = 0
+            for logger in batch:
+                try:
+                    with logger.writelock:
+                        records += logger.write_entries()
+                except Exception:
+                    # Not much to be done about a log that can not be
+                    # written, but the other logs should carry on
+                    traceback.print_exc()
+            done = time.monotonic()
+            for logger in batch:
+                self.lastwrite[logger] = done
+            self.batches += 1
+            self.records += records
+            self.lastbatchtime = done - start
+            self.lastlatency = done - min(batch.values())
+            self.maxlatency = max(self.maxlatency, self.lastlatency)
+            self._close_idle(done)
+            time.sleep(self.interval)
+
+
+def get_writer_stats():
+    """Report on the batched log writer
+
+    :returns: A dict of queue depth and write latency figures, or None if
+              the batched writer is not in use
+    """
+    if _groupwriter is None:
+        return None
+    return _groupwriter.get_stats()
+
+
+def _get_groupwriter():
+    global _groupwriter
+    if _groupwriter is None and conf.get_option('log', 'writer') == 'thread':
+        _groupwriter = GroupWriter()
+    return _groupwriter
+
+
 class Logger(object):
     """
     :param console:  If true, [] will be used to denote non-text events.  If
@@ -566,8 +837,113 @@ class Logger(object):
         self.lockfile = None
         self.logname = logname
         self.logentries = collections.deque()
+        # writelock is held while writing, entrylock while changing entries
+        self.writelock = threading.Lock()
+        self.entrylock = threading.Lock()
+        self.groupwriter = _get_groupwriter() if buffered else None
+
+    def _format_entry(self, ltype, tstamp, data, evtdata):
+        textdate = ''
+        if self.isconsole and ltype != 2:
+            textdate = time.strftime(
+                '[%m/%d %H:%M:%S ', time.localtime(tstamp))
+            if ltype == DataTypes.event and evtdata in Events.logstr:
+                textdate += Events.logstr[evtdata]
+        elif not self.isconsole:
+            textdate = time.strftime(
+                '%b %d %H:%M:%S ', time.localtime(tstamp))
+        suffix = b''
+        if self.isconsole:
+            if ltype != 2:
+                suffix = b']'
+        elif not (data.endswith('\n') if isinstance(data, unicode)
+                  else data.endswith(b'\n')):
+            suffix = b'\n'
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        return textdate.encode('utf-8'), data, suffix
+
+    def write_entries(self):
+        """Write out everything queued, a file lock and a write per batch
+
+        Used by the batched writer, with writelock held.
+
+        :returns: The number of records written
+        """
+        global logfull
+        written = 0
+        while self.logentries:
+            textfile, binfile = self.handler.open()
+            textchunks = []
+            binrecords = bytearray()
+            rolling_type = RollingTypes.no_rolling
+            flock(textfile, LOCK_EX)
+            try:
+                textsize = os.fstat(textfile.fileno()).st_size
+                binsize = os.fstat(binfile.fileno()).st_size
+                while True:
+                    with self.entrylock:
+                        if not self.logentries:
+                            break
+                        entry = self.logentries.popleft()
+                    ltype, tstamp, data, evtdata, eventaux = entry
+                    textdate, data, suffix = self._format_entry(
+                        ltype, tstamp, data, evtdata)
+                    if len(data) > 65535:
+                        # our max log entry is 65k, take only the first 65k
+                        # and put rest back on as a continuation
+                        self.logentries.appendleft(
+                            [ltype, tstamp, data[65535:], evtdata, eventaux])
+                        data = data[:65535]
+                        entry = [ltype, tstamp, data, evtdata, eventaux]
+                    textlen = len(textdate) + len(data) + len(suffix)
+                    if int(time.time()) >= self.handler.rolloverAt:
+                        rolling_type = RollingTypes.time_rolling
+                    elif self.handler.maxBytes > 0 and (
+                            textsize + textlen >= self.handler.maxBytes or
+                            binsize + _binrecord.size >=
+                            self.handler.maxBytes):
+                        rolling_type = RollingTypes.size_rolling
+                    if rolling_type:
+                        self.logentries.appendleft(entry)
+                        break
+                    binrecords += _binrecord.pack(
+                        16, ltype, textsize + len(textdate), len(data),
+                        tstamp, evtdata, eventaux or 0, 0)
+                    textchunks.extend((textdate, data, suffix))
+                    textsize += textlen
+                    binsize += _binrecord.size
+                    written += 1
+                # text before the records referring to it, so a reader
+                # never finds a record without its text
+                if textchunks:
+                    _writev(textfile.fileno(), textchunks)
+                    _writev(binfile.fileno(), [bytes(binrecords)])
+            except (IOError, OSError):
+                if not daemonized:
+                    raise
+                logfull = True
+                return written
+            finally:
+                try:
+                    flock(textfile, LOCK_UN)
+                except Exception:
+                    pass
+            if rolling_type:
+                _, to_tfile = self.handler.doRollover(rolling_type)
+                # Log the rolling event at first, then log the last data
+                # which cause the rolling event.
+                roll_data = json.dumps({'previouslogfile': to_tfile})
+                self.logentries.appendleft(
+                    [DataTypes.event, self.logentries[0][1], roll_data,
+                     Events.logrollover, None])
+        return written
 
     def writedata(self):
+        if self.groupwriter is not None:
+            with self.writelock:
+                self.write_entries()
+            return
         while self.logentries:
             textfile, binfile = self.handler.open()
             entry = self.logentries.popleft()
@@ -636,111 +1012,103 @@ class Logger(object):
             self.closer = tasks.spawn_task_after(15, self.closelog)
         self.writer = None
 
-    def read_recent_text(self, size):
-
-        def parse_last_rolling_files(textfile, offset, datalen):
-            textfile.seek(offset, 0)
-            textpath = json.loads(textfile.read(datalen))['previouslogfile']
-            dir_name, base_name = os.path.split(textpath)
-            temp = base_name.split('.')
-            temp.insert(1,'cbl')
-            # find the recent bin file
-            binpath = os.path.join(dir_name, ".".join(temp))
-            return textpath, binpath
+    def _open_reader(self, textpath, binpath):
+        try:
+            return LogReader(textpath, binpath)
+        except (IOError, OSError, ValueError):
+            return None
 
+    def read_recent_text(self, size):
         textpath = self.handler.textpath
         binpath = self.handler.binpath
-        try:
-            textfile = open(textpath, mode='r')
-            binfile = open(binpath, mode='r')
-        except IOError:
+        reader = self._open_reader(textpath, binpath)
+        if reader is None:
             return '', 0, 0
-        flock(binfile, LOCK_SH)
-        binfile.seek(0, 2)
-        binidx = binfile.tell()
         currsize = 0
-        offsets = []
+        chunks = []
         termstate = None
         recenttimestamp = 0
-        flock(textfile, LOCK_SH)
-        while binidx > 0 and currsize < size:
-            binidx -= 16
-            binfile.seek(binidx, 0)
-            recbytes = binfile.read(16)
-            (_, ltype, offset, datalen, tstamp, evtdata, eventaux, _) = \
-                struct.unpack(">BBIHIBBH", recbytes)
-            # rolling events found.
-            if ltype == DataTypes.event and evtdata == Events.logrollover:
-                txtpath, bpath = parse_last_rolling_files(textfile, offset,
-                                                          datalen)
-                if txtpath == textpath:
-                    break
-                if bpath == binpath:
-                    break
-                textpath = txtpath
-                binpath = bpath
-                # Rolling event detected, close the current bin file, then open
-                # the renamed bin file.
-                flock(binfile, LOCK_UN)
-                flock(textfile, LOCK_UN)
-                binfile.close()
-                textfile.close()
-                try:
-                    binfile = open(binpath, mode='r')
-                    textfile = open(textpath, mode='r')
-                except IOError:
-                    binfile = None
-                    textfile = None
-                    break
-                flock(binfile, LOCK_SH)
-                flock(textfile, LOCK_SH)
-                binfile.seek(0, 2)
-                binidx = binfile.tell()
-                # things have been set up for next iteration to dig to
-                # previous log file, go to next iteration
-                continue
-            elif ltype != 2:
-                continue
-            if tstamp > recenttimestamp:
-                recenttimestamp = tstamp
-            currsize += datalen
-            offsets.append((offset, datalen, textpath))
-            if termstate is None:
-                termstate = eventaux
-        try:
-            flock(binfile, LOCK_UN)
-            binfile.close()
-        except:
-            pass
-        textdata = ''
-        while offsets:
-            (offset, length, textpath) = offsets.pop()
-            if textfile is None:
-                textfile = open(textpath, mode='r')
-                flock(textfile, LOCK_SH)
-            if textfile.name != textpath:
-                try:
-                    flock(textfile, LOCK_UN)
-                    textfile.close()
-                    textfile = open(textpath, mode='r')
-                    flock(textfile, LOCK_SH)
-                except (ValueError, IOError):
+        while reader is not None and currsize < size:
+            rolledfrom = None
+            with reader:
+                for (_, ltype, offset, datalen, tstamp, evtdata, eventaux,
+                     _) in reader.reversed_records():
+                    # rolling events found.
+                    if (ltype == DataTypes.event and
+                            evtdata == Events.logrollover):
+                        rolledfrom = _parse_rollover(
+                            reader.text(offset, datalen))
+                        break
+                    elif ltype != 2:
+                        continue
+                    if tstamp > recenttimestamp:
+                        recenttimestamp = tstamp
+                    currsize += datalen
+                    chunks.append(reader.text(offset, datalen))
+                    if termstate is None:
+                        termstate = eventaux
+                    if currsize >= size:
+                        break
+            reader = None
+            if rolledfrom and currsize < size:
+                # dig into the log this one was rolled over from
+                txtpath, bpath = rolledfrom
+                if txtpath == textpath or bpath == binpath:
                     break
-            try:
-                textfile.seek(offset, 0)
-            except ValueError:
-                # file was closed, settle with what we have and continue
-                break
-            textdata += textfile.read(length)
-        try:
-            flock(textfile, LOCK_UN)
-            textfile.close()
-        except:
-            pass
+                textpath, binpath = rolledfrom
+                reader = self._open_reader(textpath, binpath)
+        chunks.reverse()
+        textdata = b''.join(chunks).decode('utf-8', 'replace')
         if termstate is None:
             termstate = 0
         return textdata, termstate, recenttimestamp
 
+    def read_range(self, start, end=None, ltypes=None):
+        """Read the records logged between two times
+
+        Rolled over logs are followed back as far as needed.
+
+        :param start: Time of the earliest record, in seconds since epoch
+        :param end: Time of the latest record, or None for no limit
+        :param ltypes: Iterable of DataTypes to include, or None for all
+        :returns: List of (timestamp, ltype, data, event, eventdata) tuples,
+                  oldest first
+        """
+        if ltypes is not None:
+            ltypes = frozenset(ltypes)
+        readers = []
+        seen = set()
+        paths = (self.handler.textpath, self.handler.binpath)
+        try:
+            while paths and paths not in seen:
+                seen.add(paths)
+                reader = self._open_reader(*paths)
+                if reader is None:
+                    break
+                readers.append(reader)
+                if reader.numrecords and reader.timestamp(0) < start:
+                    break  # anything older predates start
+                paths = reader.rolled_from()
+            results = []
+            for reader in reversed(readers):
+                first = reader.find_time(start)
+                for (_, ltype, offset, datalen, tstamp, evtdata, eventaux,
+                     _) in reader.records(first):
+                    if end is not None and tstamp > end:
+                        break
+                    if ltype == DataTypes.event and (
+                            evtdata == Events.logrollover):
+                        continue
+                    if ltypes is not None and ltype not in ltypes:
+                        continue
+                    data = reader.text(offset, datalen).decode(
+                        'utf-8', 'replace')
+                    results.append((tstamp, ltype, data, evtdata, eventaux))
+            return results
+        finally:
+            for reader in readers:
+                reader.close()
+
     def write(self, data):
         """Write plain text to log
 
@@ -771,16 +1139,20 @@ class Logger(object):
             self.closer.cancel()
             self.closer = None
         timestamp = int(time.time())
-        if (len(self.logentries) > 0 and ltype == 2 and
-                event == 0 and self.logentries[-1][0] == 2 and
-                self.logentries[-1][1] == timestamp):
-            self.logentries[-1][2] += logdata
-            if eventdata is not None:
-                self.logentries[-1][4] = eventdata
-        else:
-            self.logentries.append(
-                [ltype, timestamp, logdata, event, eventdata])
-        if self.buffered:
+        with self.entrylock:
+            if (len(self.logentries) > 0 and ltype == 2 and
+                    event == 0 and self.logentries[-1][0] == 2 and
+                    self.logentries[-1][1] == timestamp and
+                    type(self.logentries[-1][2]) == type(logdata)):
+                self.logentries[-1][2] += logdata
+                if eventdata is not None:
+                    self.logentries[-1][4] = eventdata
+            else:
+                self.logentries.append(
+                    [ltype, timestamp, logdata, event, eventdata])
+        if self.groupwriter is not None:
+            self.groupwriter.schedule(self)
+        elif self.buffered:
             if self.writer is None:
                 self.writer = tasks.spawn_task_after(2, self.writedata)
         else:
@@ -504,7 +504,8 @@ def get_input_message(path, operation, inputdata, nodes=None, multinode=False,
     elif (path in (['power', 'reseat'], ['_enclosure', 'reseat_bay']) and
             operation != 'retrieve'):
         return InputReseatMessage(path, nodes, inputdata)
-    elif path == ['attributes', 'expression']:
+    elif path == ['attributes', 'expression'] or (
+            path == ['ping'] and operation != 'retrieve'):
         return InputExpression(path, inputdata, nodes)
     elif path == ['attributes', 'rename']:
         return InputConfigChangeSet(path, inputdata, nodes, configmanager)
@@ -19,6 +19,7 @@
 import asyncio
 import confluent.exceptions as exc
 import codecs
+import errno
 try:
     import psutil
 except ImportError:
@@ -769,48 +770,162 @@ async def get_addresses_by_serverip(serverip):
 
 nlhdrsz = struct.calcsize('IHHII')
 ifaddrsz = struct.calcsize('BBBBI')
+# Multicast groups announcing address changes
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
 
-async def get_my_addresses(idx=0, family=0, matchlla=None):
-    # RTM_GETADDR = 22
-    # nlmsghdr struct: u32 len, u16 type, u16 flags, u32 seq, u32 pid
-    nlhdr = struct.pack('IHHII', nlhdrsz + ifaddrsz, 22, 0x301, 0, 0)
-    # ifaddrmsg struct: u8 family, u8 prefixlen, u8 flags, u8 scope, u32 index
-    ifaddrmsg = struct.pack('BBBBI', family, 0, 0, 0, idx)
-    s = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
-    s.bind((0, 0))
-    s.setblocking(False)
-    await asyncio.get_running_loop().sock_sendall(s, nlhdr + ifaddrmsg)
-    addrs = []
-    while True:
-        pdata = await asyncio.get_running_loop().sock_recv(s, 65536)
-        v = memoryview(pdata)
-        if struct.unpack('H', v[4:6])[0] == 3:  # netlink done message
-            break
-        while len(v):
-            length, typ = struct.unpack('IH', v[:6])
-            if typ == 20:
-                fam, plen, _, scope, ridx = struct.unpack('BBBBI', v[nlhdrsz:nlhdrsz+ifaddrsz])
-                if matchlla:
-                    if scope == 253:
-                        rta = v[nlhdrsz+ifaddrsz:length]
-                        while len(rta):
-                            rtalen, rtatyp = struct.unpack('HH', rta[:4])
-                            if rtalen < 4:
-                                break
-                            if rta[4:rtalen].tobytes() == matchlla:
-                                return await get_my_addresses(idx=ridx)
-                            rta = rta[msg_align(rtalen):]
-                elif (ridx == idx or not idx) and scope == 0:
-                    rta = v[nlhdrsz+ifaddrsz:length]
-                    while len(rta):
-                        rtalen, rtatyp = struct.unpack('HH', rta[:4])
-                        if rtalen < 4:
-                            break
-                        if rtatyp == 1:
-                            addrs.append((fam, rta[4:rtalen].tobytes(), plen, ridx))
-                        rta = rta[msg_align(rtalen):]
+
+class AddressTable(object):
+    """The addresses of this system, kept current by netlink
+
+    One netlink socket subscribes to address changes and takes a dump of the
+    addresses as of subscribing, so lookups are answered from memory rather
+    than asking the kernel each time.
+    """
+
+    def __init__(self):
+        self.addrs = {}
+        # The table being built by a dump in progress, swapped in when done
+        self.dumpaddrs = None
+        self.dumpseq = 0
+        # Set when the kernel refused a dump while another was running
+        self.busydump = False
+        self.redump = False
+        self.sock = None
+        self.ready = asyncio.Event()
+        self.reader = None
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  socket.NETLINK_ROUTE)
+        # Plenty of room, so a burst of changes does not overrun the socket
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1048576)
+        self.sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        self.sock.setblocking(False)
+        self.reader = tasks.spawn_task(self._run())
+
+    async def _request_dump(self):
+        # The current table stays until the new dump completes
+        self.ready.clear()
+        self.redump = False
+        self.dumpseq += 1
+        self.dumpaddrs = {}
+        # RTM_GETADDR = 22
+        # nlmsghdr struct: u32 len, u16 type, u16 flags, u32 seq, u32 pid
+        nlhdr = struct.pack('IHHII', nlhdrsz + ifaddrsz, 22, 0x301,
+                            self.dumpseq, 0)
+        # ifaddrmsg struct: u8 family, u8 prefixlen, u8 flags, u8 scope, u32 index
+        ifaddrmsg = struct.pack('BBBBI', 0, 0, 0, 0, 0)
+        await asyncio.get_running_loop().sock_sendall(self.sock,
+                                                      nlhdr + ifaddrmsg)
+
+    async def _run(self):
+        global _addresstable
+        cloop = asyncio.get_running_loop()
+        try:
+            await self._request_dump()
+            while True:
+                try:
+                    pdata = await cloop.sock_recv(self.sock, 65536)
+                except OSError as e:
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                    # Changes were lost, start over from a fresh dump
+                    await self._request_dump()
+                    continue
+                self._process(memoryview(pdata))
+                if self.redump:
+                    await self._request_dump()
+        finally:
+            self.sock.close()
+            self.ready.set()
+            # Have the next lookup start a new subscription
+            if _addresstable is self:
+                _addresstable = None
+
+    def _process(self, v):
+        while len(v) >= nlhdrsz:
+            length, typ, _, seq, _ = struct.unpack('IHHII', v[:nlhdrsz])
+            if length < nlhdrsz:
+                break
+            if typ == 2 and length >= nlhdrsz + 4:  # netlink error message
+                err = -struct.unpack('i', v[nlhdrsz:nlhdrsz + 4])[0]
+                if err == errno.EBUSY:
+                    # An earlier dump is still running, ask again once it
+                    # is finished
+                    self.dumpaddrs = None
+                    self.busydump = True
+                elif err and seq == self.dumpseq:
+                    # The dump failed, carry on with the table as it was
+                    self.dumpaddrs = None
+                    self.ready.set()
+            elif typ == 3:  # netlink done message, a dump is complete
+                if seq == self.dumpseq and self.dumpaddrs is not None:
+                    self.addrs = self.dumpaddrs
+                    self.dumpaddrs = None
+                    self.ready.set()
+                elif self.busydump:
+                    # An earlier dump that blocked the latest request, whose
+                    # contents may predate lost changes
+                    self.busydump = False
+                    self.redump = True
+            elif typ in (20, 21):  # RTM_NEWADDR, RTM_DELADDR
+                fam, plen, _, scope, ridx = struct.unpack(
+                    'BBBBI', v[nlhdrsz:nlhdrsz+ifaddrsz])
+                rta = v[nlhdrsz+ifaddrsz:length]
+                while len(rta):
+                    rtalen, rtatyp = struct.unpack('HH', rta[:4])
+                    if rtalen < 4:
+                        break
+                    if rtatyp == 1:
+                        addr = rta[4:rtalen].tobytes()
+                        if not seq:
+                            # a change, which may predate the dump's view
+                            tables = [self.addrs, self.dumpaddrs]
+                        elif seq == self.dumpseq:
+                            tables = [self.dumpaddrs]
+                        else:
+                            tables = []
+                        for table in tables:
+                            if table is None:
+                                continue
+                            if typ == 20:
+                                table[(ridx, addr)] = (fam, addr, plen, ridx,
+                                                       scope)
+                            else:
+                                table.pop((ridx, addr), None)
+                    rta = rta[msg_align(rtalen):]
             v = v[msg_align(length):]
-    return addrs
+
+    def get_addresses(self, idx=0, family=0, matchlla=None):
+        if matchlla:
+            for fam, addr, plen, ridx, scope in list(self.addrs.values()):
+                if scope == 253 and addr == matchlla:
+                    return self.get_addresses(idx=ridx)
+            return []
+        addrs = []
+        for fam, addr, plen, ridx, scope in list(self.addrs.values()):
+            if family and fam != family:
+                continue
+            if (ridx == idx or not idx) and scope == 0:
+                addrs.append((fam, addr, plen, ridx))
+        # In the order the kernel would list them, by family and interface
+        addrs.sort(key=lambda x: (x[0], x[3]))
+        return addrs
+
+
+_addresstable = None
+
+
+async def get_my_addresses(idx=0, family=0, matchlla=None):
+    global _addresstable
+    if _addresstable is None:
+        table = AddressTable()
+        table.start()
+        _addresstable = table
+    table = _addresstable
+    await table.ready.wait()
+    return table.get_addresses(idx, family, matchlla)
 
 
 async def get_prefix_len_for_ip(ip):
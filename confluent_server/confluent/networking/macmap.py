@@ -43,6 +43,7 @@ if __name__ == '__main__':
     import confluent.snmputil as snmp
 
 import asyncio
+import time
 from confluent.networking.lldp import detect_backend, _handle_neighbor_query, get_fingerprint
 from confluent.networking.netutil import get_switchcreds, list_switches, get_portnamemap
 
@@ -66,13 +67,23 @@ import aiohmi.util.webclient as webclient
 noaffluent = set([])
 
 _macmap = {}
-_apimacmap = {}
 _macsbyswitch = {}
 _nodesbymac = {}
 _switchportmap = {}
 _offloadevts = {}
 _offloader = None
-vintage = None
+# Each switch is walked on its own schedule, _switchvintage has when each was
+# last walked and _switchbackoff how long to wait before walking it again
+_switchvintage = {}
+_switchbackoff = {}
+_switchupdates = {}
+# The switches to walk and their port assignments, as derived from node
+# attributes, with when that was last done
+_topology = None
+_topologyvintage = None
+_cachefile = '/var/cache/confluent/macmap'
+_cacheloaded = False
+_cachesaver = None
 
 
 _whitelistnames = (
@@ -123,7 +134,8 @@ def _namesmatch(switchdesc, userdesc):
 
 async def _map_switch(args):
     try:
-        return await _map_switch_backend(args)
+        await _map_switch_backend(args)
+        return True
     except (UnicodeError, socket.gaierror):
         log.log({'error': "Cannot resolve switch '{0}' to an address".format(
             args[0])})
@@ -166,15 +178,13 @@ async def _srlinux_map_switch(switch, password, user, cfgm):
     cli = srlinux.SRLinuxClient(switch, user, password, cfgm)
     await cli.login()
     mt = await cli.get_mac_table()
-    _macsbyswitch[switch] = mt
-    _fast_backend_fixup(mt, switch)
+    _update_switch_macs(switch, mt)
 
 async def _nxapi_map_switch(switch, password, user, cfgm):
         cli = nxapi.NxApiClient(switch, user, password, cfgm)
         await cli.login()
         mt = await cli.get_mac_table()
-        _macsbyswitch[switch] = mt
-        _fast_backend_fixup(mt, switch)
+        _update_switch_macs(switch, mt)
 
 
 
@@ -188,36 +198,75 @@ async def _affluent_map_switch(switch, password, user, cfgm, macs):
         macs, retcode = await wc.grab_json_response_with_status('/affluent/macs/by-port')
         if retcode != 200:
             raise Exception("No affluent detected")
-    _macsbyswitch[switch] = macs
-    _fast_backend_fixup(macs, switch)
+    _update_switch_macs(switch, macs)
+
+
+def _update_switch_macs(switch, macs):
+    """Replace the mac table of one switch, updating only what changed
 
-def _fast_backend_fixup(macs, switch):
+    :param switch: The switch the table was read from
+    :param macs: Dictionary of interface names to lists of mac addresses
+    """
+    oldmacs = _macsbyswitch.get(switch, {})
+    oldlocs = set([])
+    for iface in oldmacs:
+        nummacs = len(oldmacs[iface])
+        for mac in oldmacs[iface]:
+            oldlocs.add((mac, iface, nummacs))
+    newlocs = set([])
     for iface in macs:
         nummacs = len(macs[iface])
         for mac in macs[iface]:
-            if mac in _macmap:
-                _macmap[mac].append((switch, iface, nummacs))
-            else:
-                _macmap[mac] = [(switch, iface, nummacs)]
+            newlocs.add((mac, iface, nummacs))
+    changed = set([])
+    for mac, iface, nummacs in oldlocs - newlocs:
+        locations = _macmap.get(mac, [])
+        try:
+            locations.remove((switch, iface, nummacs))
+        except ValueError:
+            pass
+        if not locations:
+            _macmap.pop(mac, None)
+        changed.add(mac)
+    for mac, iface, nummacs in newlocs - oldlocs:
+        if mac in _macmap:
+            _macmap[mac].append((switch, iface, nummacs))
+        else:
+            _macmap[mac] = [(switch, iface, nummacs)]
+        changed.add(mac)
+    if macs:
+        _macsbyswitch[switch] = macs
+    else:
+        _macsbyswitch.pop(switch, None)
+    _update_nodesbymac(changed)
+    if changed:
+        _schedule_save()
+
+
+def _update_nodesbymac(macs):
+    """Reevaluate which node each of the given mac addresses belongs to"""
+    for mac in macs:
+        nodes = {}
+        for switch, iface, nummacs in _macmap.get(mac, ()):
             nodename = _nodelookup(switch, iface)
-            if nodename is not None:
-                if mac in _nodesbymac and _nodesbymac[mac][0] != nodename:
-                    # For example, listed on both a real edge port
-                    # and by accident a trunk port
-                    onummacs = _nodesbymac[mac][1]
-                    onode = _nodesbymac[mac][0]
-                    if onode:
-                        errstr = 'Mac address {2} may match either {0} or {1} according to net.*switch* attributes.'.format(nodename, onode, mac)
-                        if onummacs > 2 or nummacs > 2:
-                            errstr += ' ({0} may match a switch trunk)'.format(nodename if nummacs > onummacs else onode)
-                    else:
-                        errstr = 'Mac address {1} may match either {0} or a node previously reported as ambiguous according to net.*switch* attributes.'.format(nodename, mac)
-                        if nummacs > 2:
-                            errstr += ' ({0} may match a switch trunk)'.format(nodename)
-                    log.log({'error': errstr})
-                    _nodesbymac[mac] = (None, None)
-                else:
-                    _nodesbymac[mac] = (nodename, nummacs)
+            if nodename is not None and nodename not in nodes:
+                nodes[nodename] = nummacs
+        if not nodes:
+            _nodesbymac.pop(mac, None)
+        elif len(nodes) == 1:
+            _nodesbymac[mac] = list(nodes.items())[0]
+        else:
+            # For example, listed on both a real edge port
+            # and by accident a trunk port
+            if _nodesbymac.get(mac, None) != (None, None):
+                names = sorted(nodes)
+                errstr = 'Mac address {1} may match either {0} according to net.*switch* attributes.'.format(' or '.join(names), mac)
+                busiest = max(names, key=nodes.get)
+                if nodes[busiest] > 2:
+                    errstr += ' ({0} may match a link between switches)'.format(busiest)
+                log.log({'error': errstr})
+            _nodesbymac[mac] = (None, None)
+
 
 startuplock = None
 async def _offload_map_switch(switch, password, user, privprotocol=None):
@@ -300,7 +349,6 @@ async def _map_switch_backend(args):
     #  .1.3.6.1.2.1.2.2.1.2 - ifDescr, usually useless, but a
     #   fallback if ifName is empty
     #
-    global _macmap
     switch = args[0] if len(args) > 0 else None
     password = args[1] if len(args) > 1 else None
     user = args[2] if len(args) > 2 else None
@@ -319,18 +367,11 @@ async def _map_switch_backend(args):
             pass
     mactobridge, ifnamemap, bridgetoifmap = await _offload_map_switch(
         switch, password, user, privprotocol)
-    maccounts = {}
     bridgetoifvalid = False
     for mac in mactobridge:
-        try:
-            ifname = ifnamemap[bridgetoifmap[mactobridge[mac]]]
+        if mactobridge[mac] in bridgetoifmap and bridgetoifmap[mactobridge[mac]] in ifnamemap:
             bridgetoifvalid = True
-        except KeyError:
-            continue
-        if ifname not in maccounts:
-            maccounts[ifname] = 1
-        else:
-            maccounts[ifname] += 1
+            break
     if not bridgetoifvalid:
         bridgetoifmap = {}
     # Not a single mac address resolved to an interface index, chances are
@@ -338,15 +379,8 @@ async def _map_switch_backend(args):
     # instead of bridge port index
     # try again, skipping the bridgetoifmap lookup
         for mac in mactobridge:
-            try:
-                ifname = ifnamemap[mactobridge[mac]]
+            if mactobridge[mac] in ifnamemap:
                 bridgetoifmap[mactobridge[mac]] = mactobridge[mac]
-            except KeyError:
-                continue
-            if ifname not in maccounts:
-                maccounts[ifname] = 1
-            else:
-                maccounts[ifname] += 1
     newmacs = {}
     noaffluent.add(switch)
     for mac in mactobridge:
@@ -356,36 +390,11 @@ async def _map_switch_backend(args):
             ifname = ifnamemap[bridgetoifmap[mactobridge[mac]]]
         except KeyError:
             continue
-        if mac in _macmap:
-            _macmap[mac].append((switch, ifname, maccounts[ifname]))
-        else:
-            _macmap[mac] = [(switch, ifname, maccounts[ifname])]
         if ifname in newmacs:
             newmacs[ifname].append(mac)
         else:
             newmacs[ifname] = [mac]
-        nodename = _nodelookup(switch, ifname)
-        if nodename is not None:
-            if mac in _nodesbymac and _nodesbymac[mac][0] != nodename:
-                # For example, listed on both a real edge port
-                # and by accident a trunk port
-                nummacs = maccounts[ifname]
-                onummacs = _nodesbymac[mac][1]
-                onode = _nodesbymac[mac][0]
-                if onode:
-                    errstr = 'Mac address {2} may match either {0} or {1} according to net.*switch* attributes.'.format(nodename, onode, mac)
-                    if onummacs > 2 or nummacs > 2:
-                        errstr += ' ({0} may match a link between switches)'.format(nodename if nummacs > onummacs else onode)
-                else:
-                    errstr = 'Mac address {1} may match either {0} or a node previously reported as ambiguous according to net.*switch* attributes.'.format(nodename, mac)
-                    if nummacs > 2:
-                        errstr += ' ({0} may match a link between switches)'.format(nodename)
-                log.log({'error': errstr})
-                
-                _nodesbymac[mac] = (None, None)
-            else:
-                _nodesbymac[mac] = (nodename, maccounts[ifname])
-    _macsbyswitch[switch] = newmacs
+    _update_switch_macs(switch, newmacs)
 
 async def _snmp_map_switch_relay(rqid, switch, password, user, privprotocol=None):
     try:
@@ -452,37 +461,66 @@ async def _snmp_map_switch(switch, password, user, privprotocol=None):
     if not vlanstocheck:
         vlanstocheck.add(None)
     bridgetoifmap = {}
-    for vlan in vlanstocheck:
-        if vlan:
-            if user:
-                conn = snmp.Session(switch, password, user, 'vlan-{}'.format(vlan))
-            else:
-                if not isinstance(password, str):
-                    password = password.decode('utf8')
-                conn = snmp.Session(switch, '{}@{}'.format(password, vlan))
-        async for vb in conn.walk('1.3.6.1.2.1.17.1.4.1.2'):
-            bridgeport, ifidx = vb
-            bridgeport = int(str(bridgeport).rsplit('.', 1)[1])
-            try:
-                bridgetoifmap[bridgeport] = int(ifidx)
-            except ValueError:
-                # ifidx might be '', skip in such a case
-                continue
+    vlanlimit = asyncio.Semaphore(vlanconcurrency)
+
+    async def map_bridge_ports(vlan):
+        # Each VLAN is viewed through the same engine and transport, rather
+        # than setting up anew for each of possibly hundreds of them
+        vconn = conn.get_vlan_session(vlan) if vlan else conn
+        async with vlanlimit:
+            async for vb in vconn.walk('1.3.6.1.2.1.17.1.4.1.2'):
+                bridgeport, ifidx = vb
+                bridgeport = int(str(bridgeport).rsplit('.', 1)[1])
+                try:
+                    bridgetoifmap[bridgeport] = int(ifidx)
+                except ValueError:
+                    # ifidx might be '', skip in such a case
+                    continue
+    await asyncio.gather(*[map_bridge_ports(vlan) for vlan in vlanstocheck])
     #OFFLOAD: end of need to offload?
     return mactobridge,ifnamemap,bridgetoifmap
 
 
+# How many VLANs of one switch are walked at once
+vlanconcurrency = 4
+# How many switches are walked at once
+walkconcurrency = 64
+_walklimit = None
+# How long the most recent walk of each switch took
+_walktimes = {}
+# The least time to wait between walks of a switch
 switchbackoff = 30
+# How old the data from a switch may be to answer a lookup without a new walk
+MACMAP_FRESH = 90
+# How long the switch topology derived from node attributes is trusted
+TOPOLOGY_FRESH = 30
+
+
+def _fresh_nodeinfo(mac, now):
+    if mac not in _nodesbymac:
+        return False
+    for location in _macmap.get(mac, ()):
+        switchvintage = _switchvintage.get(location[0], None)
+        if switchvintage is None or now - switchvintage >= MACMAP_FRESH:
+            return False
+    return True
 
 
 async def find_nodeinfo_by_mac(mac, configmanager):
     now = util.monotonic_time()
-    if vintage and (now - vintage) < 90 and mac in _nodesbymac:
+    if _fresh_nodeinfo(mac, now):
         return _nodesbymac[mac][0], {'maccount': _nodesbymac[mac][1]}
-    # do not actually sweep switches more than once every 30 seconds
+    # A mac already seen is first looked for where it was seen, before
+    # considering every other switch
+    seenon = set([location[0] for location in _macmap.get(mac, ())])
+    if seenon:
+        async for _ in update_macmap(configmanager, True, seenon):
+            pass
+        if mac in _nodesbymac:
+            return _nodesbymac[mac][0], {'maccount': _nodesbymac[mac][1]}
+    # do not actually walk a switch more than once every 30 seconds
     # however, if there is an update in progress, wait on it
-    async for _ in update_macmap(configmanager,
-                           vintage and (now - vintage) < switchbackoff):
+    async for _ in update_macmap(configmanager, True):
         if mac in _nodesbymac:
             return _nodesbymac[mac][0], {'maccount': _nodesbymac[mac][1]}
     # If update_mac bailed out, still check one last time
@@ -491,133 +529,219 @@ async def find_nodeinfo_by_mac(mac, configmanager):
     return None, {'maccount': 0}
 
 
-mapupdating = None
+def expire(switches=()):
+    """Have the mac map reconsider node attributes before the next lookup
+
+    :param switches: Names of switches to walk again regardless of how
+                     recently they were walked
+    """
+    global _topologyvintage
+    _topologyvintage = None
+    for switch in switches:
+        _switchvintage.pop(switch, None)
 
 
-async def update_macmap(configmanager, impatient=False):
+async def update_macmap(configmanager, impatient=False, switches=None):
     """Interrogate switches to build/update mac table
 
-    Begin a rebuild process.  This process is a generator that will yield
+    Begin an update process.  This process is a generator that will yield
     as each switch interrogation completes, allowing a caller to
     recheck the cache as results become possible, rather
     than having to wait for the process to complete to interrogate.
+
+    :param impatient: Skip switches walked too recently to walk again,
+                      though still waiting on those being walked already
+    :param switches: Only update the named switches, rather than all
     """
-    global mapupdating
-    if mapupdating is None:
-        mapupdating = asyncio.Lock()
-    if mapupdating.locked():
-        while mapupdating.locked():
-            await asyncio.sleep(1)
-            yield None
-        return
-    if impatient:
-        return
-    completions = _full_updatemacmap(configmanager)
-    async for completion in completions:
-        try:
-            yield completion
-        except GeneratorExit:
-            # the calling function has stopped caring, but we want to finish
-            # the sweep, background it
-            tasks.spawn(_finish_update(completions))
-            raise
+    if configmanager.tenant is not None:
+        raise exc.ForbiddenRequest(
+            'Network topology not available to tenants')
+    _load_cache()
+    switchauth = _get_topology(configmanager)
+    if switches is None:
+        switches = list(switchauth)
+    now = util.monotonic_time()
+    pending = []
+    for switch in switches:
+        if switch not in switchauth:
+            continue
+        walk = _switchupdates.get(switch, None)
+        if walk is None:
+            switchvintage = _switchvintage.get(switch, None)
+            if impatient and switchvintage is not None and (
+                    now - switchvintage < _switchbackoff.get(
+                        switch, switchbackoff)):
+                continue
+            # The walk is its own task, so it finishes and is recorded even
+            # if the caller stops caring partway through
+            walk = tasks.spawn_task(_walk_switch(switchauth[switch]))
+            _switchupdates[switch] = walk
+        pending.append(walk)
+    for walk in asyncio.as_completed(pending):
+        await walk
+        yield None
+
+
+async def _walk_switch(args):
+    global _walklimit
+    switch = args[0]
+    if _walklimit is None:
+        _walklimit = asyncio.Semaphore(walkconcurrency)
+    try:
+        async with _walklimit:
+            start = util.monotonic_time()
+            try:
+                if not await _map_switch(args):
+                    # Whatever was known from this switch can no longer be
+                    # vouched for
+                    _update_switch_macs(switch, {})
+            finally:
+                now = util.monotonic_time()
+                _switchvintage[switch] = now
+                _walktimes[switch] = now - start
+                # wait 15 times as long as it takes to walk, to avoid
+                # spending a large portion of the time hitting switches with
+                # snmp requests
+                _switchbackoff[switch] = max(switchbackoff, (now - start) * 15)
+    finally:
+        del _switchupdates[switch]
 
 
-async def _finish_update(completions):
-    async for _ in completions:
-        pass
+def get_walk_times():
+    """Get how long the most recent walk of each switch took, in seconds"""
+    return dict(_walktimes)
 
 
-async def _full_updatemacmap(configmanager):
-    global vintage
-    global _apimacmap
-    global _macmap
-    global _nodesbymac
+def _get_topology(configmanager):
+    """Get the switches to walk, updating the switch port assignments
+
+    :returns: Dictionary of switch names to the arguments to walk them
+    """
     global _switchportmap
-    global _macsbyswitch
-    global switchbackoff
-    start = util.monotonic_time()
-    global mapupdating
-    if mapupdating is None:
-        mapupdating = asyncio.Lock()
-    async with mapupdating:
-        vintage = util.monotonic_time()
-        # Clear all existing entries
-        _macmap = {}
-        _nodesbymac = {}
-        _switchportmap = {}
-        if configmanager.tenant is not None:
-            raise exc.ForbiddenRequest(
-                'Network topology not available to tenants')
-        # here's a list of switches... need to add nodes that are switches
-        nodelocations = configmanager.get_node_attributes(
-            configmanager.list_nodes(), ('type', 'collective.managercandidates', 'net*.switch', 'net*.switchport'))
-        switches = set([])
-        incollective = collective.in_collective()
+    global _topology
+    global _topologyvintage
+    now = util.monotonic_time()
+    if (_topology is not None and _topologyvintage is not None and
+            now - _topologyvintage < TOPOLOGY_FRESH):
+        return _topology
+    _topologyvintage = now
+    switchportmap = {}
+    # here's a list of switches... need to add nodes that are switches
+    nodelocations = configmanager.get_node_attributes(
+        configmanager.list_nodes(), ('type', 'collective.managercandidates', 'net*.switch', 'net*.switchport'))
+    switches = set([])
+    incollective = collective.in_collective()
+    if incollective:
+        mycollectivename = collective.get_myname()
+    for node in nodelocations:
+        cfg = nodelocations[node]
         if incollective:
-            mycollectivename = collective.get_myname()
-        for node in nodelocations:
-            cfg = nodelocations[node]
-            if incollective:
-                candmgrs = cfg.get('collective.managercandidates', {}).get('value', None)
-                if candmgrs:
-                    try:
-                        candmgrs = noderange.NodeRange(candmgrs, configmanager).nodes
-                    except Exception:
-                        candmgrs = noderange.NodeRange(candmgrs).nodes
-                    if mycollectivename not in candmgrs:
-                        # do not think about trying to find nodes that we aren't possibly
-                        # supposed to be a manager for in a collective
-                        continue
-            if cfg.get('type', {}).get('value', None) == 'switch':
-                switches.add(node)
-            for attr in cfg:
-                if not attr.endswith('.switch') or 'value' not in cfg[attr]:
+            candmgrs = cfg.get('collective.managercandidates', {}).get('value', None)
+            if candmgrs:
+                try:
+                    candmgrs = noderange.NodeRange(candmgrs, configmanager).nodes
+                except Exception:
+                    candmgrs = noderange.NodeRange(candmgrs).nodes
+                if mycollectivename not in candmgrs:
+                    # do not think about trying to find nodes that we aren't possibly
+                    # supposed to be a manager for in a collective
                     continue
-                curswitch = cfg[attr].get('value', None)
-                if not curswitch:
+        if cfg.get('type', {}).get('value', None) == 'switch':
+            switches.add(node)
+        for attr in cfg:
+            if not attr.endswith('.switch') or 'value' not in cfg[attr]:
+                continue
+            curswitch = cfg[attr].get('value', None)
+            if not curswitch:
+                continue
+            switches.add(curswitch)
+            switchportattr = attr + 'port'
+            if switchportattr in cfg:
+                portname = cfg[switchportattr].get('value', '')
+                if not portname:
                     continue
-                switches.add(curswitch)
-                switchportattr = attr + 'port'
-                if switchportattr in cfg:
-                    portname = cfg[switchportattr].get('value', '')
-                    if not portname:
-                        continue
-                    if curswitch not in _switchportmap:
-                        _switchportmap[curswitch] = {}
-                    if (portname in _switchportmap[curswitch] and
-                            _switchportmap[curswitch][portname] != node):
-                        if _switchportmap[curswitch][portname] is None:
-                            errstr = ('Duplicate switch attributes for {0} and '
-                                      'a previously logged duplicate'.format(
-                                         node))
-                        else:
-                            errstr = ('Duplicate switch topology config '
-                                      'for {0} and {1}'.format(
-                                                node,
-                                            _switchportmap[curswitch][
-                                                portname]))
-                        log.log({'error': errstr})
-                        _switchportmap[curswitch][portname] = None
+                if curswitch not in switchportmap:
+                    switchportmap[curswitch] = {}
+                if (portname in switchportmap[curswitch] and
+                        switchportmap[curswitch][portname] != node):
+                    if switchportmap[curswitch][portname] is None:
+                        errstr = ('Duplicate switch attributes for {0} and '
+                                  'a previously logged duplicate'.format(
+                                     node))
                     else:
-                        _switchportmap[curswitch][portname] = node
-        for switch in list(_macsbyswitch):
-            if switch not in switches:
-                del _macsbyswitch[switch]
-        switchauth = get_switchcreds(configmanager, switches)
-        tsks = []
-        for sa in switchauth:
-            tsks.append(_map_switch(sa))
-        for tsk in asyncio.as_completed(tsks):
-            yield await tsk
-    _apimacmap = _macmap
-    endtime = util.monotonic_time()
-    duration = endtime - start
-    duration = duration * 15  # wait 15 times as long as it takes to walk
-    # avoid spending a large portion of the time hitting switches with snmp
-    # requests
-    if duration > switchbackoff:
-        switchbackoff = duration
+                        errstr = ('Duplicate switch topology config '
+                                  'for {0} and {1}'.format(
+                                            node,
+                                        switchportmap[curswitch][
+                                            portname]))
+                    log.log({'error': errstr})
+                    switchportmap[curswitch][portname] = None
+                else:
+                    switchportmap[curswitch][portname] = node
+    for switch in list(_macsbyswitch):
+        if switch not in switches:
+            _update_switch_macs(switch, {})
+            _switchvintage.pop(switch, None)
+    if switchportmap != _switchportmap:
+        _switchportmap = switchportmap
+        _update_nodesbymac(list(_macmap))
+    _topology = dict((sa[0], sa) for sa in get_switchcreds(configmanager, switches))
+    return _topology
+
+
+def _load_cache():
+    # Take up the mac tables as of the last run, so a restart does not have
+    # to walk every switch again before answering
+    global _cacheloaded
+    if _cacheloaded:
+        return
+    _cacheloaded = True
+    try:
+        with open(_cachefile, 'rb') as cachein:
+            cached = msgpack.unpackb(cachein.read(), raw=False)
+    except FileNotFoundError:
+        return
+    except Exception:
+        log.logtrace()
+        return
+    now = util.monotonic_time()
+    walltime = time.time()
+    for switch in cached.get('switches', {}):
+        if switch in _macsbyswitch:
+            continue
+        switchdata = cached['switches'][switch]
+        _update_switch_macs(switch, switchdata['macs'])
+        _switchvintage[switch] = now - (walltime - switchdata['time'])
+        _switchbackoff[switch] = switchdata.get('backoff', switchbackoff)
+
+
+def _schedule_save():
+    global _cachesaver
+    if _cachesaver is None:
+        _cachesaver = asyncio.get_running_loop().call_later(10, _save_cache)
+
+
+def _save_cache():
+    global _cachesaver
+    _cachesaver = None
+    now = util.monotonic_time()
+    walltime = time.time()
+    switchdata = {}
+    for switch in _macsbyswitch:
+        switchdata[switch] = {
+            'time': walltime - (now - _switchvintage.get(switch, now)),
+            'backoff': _switchbackoff.get(switch, switchbackoff),
+            'macs': _macsbyswitch[switch]}
+    try:
+        cachedir = os.path.dirname(_cachefile)
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir)
+        with open(_cachefile + '.new', 'wb') as cacheout:
+            cacheout.write(msgpack.packb({'switches': switchdata},
+                                         use_bin_type=True))
+        os.rename(_cachefile + '.new', _cachefile)
+    except Exception:
+        log.logtrace()
 
 
 def _dump_locations(info, macaddr, nodename=None):
@@ -688,11 +812,11 @@ async def handle_read_api_request(pathcomponents, configmanager):
             macaddr = pathcomponents[-1].replace('-', ':')
             return dump_macinfo(macaddr)
     elif pathcomponents[2] == 'alldata':
-        return [msg.KeyValueData(_apimacmap)]
+        return [msg.KeyValueData(_macmap)]
     elif pathcomponents[2] == 'by-mac':
         if len(pathcomponents) == 3:
             return [msg.ChildCollection(x.replace(':', '-'))
-                    for x in sorted(list(_apimacmap))]
+                    for x in sorted(list(_macmap))]
         elif len(pathcomponents) == 4:
             return dump_macinfo(pathcomponents[-1])
     elif pathcomponents[2] == 'by-switch':
@@ -738,10 +862,7 @@ async def handle_read_api_request(pathcomponents, configmanager):
         if len(pathcomponents) == 8:
             return dump_macinfo(pathcomponents[-1])
     elif pathcomponents[2] == 'rescan':
-        global mapupdating
-        if mapupdating is None:
-            mapupdating = asyncio.Lock()
-        return [msg.KeyValueData({'scanning': mapupdating.locked()})]
+        return [msg.KeyValueData({'scanning': bool(_switchupdates)})]
     raise exc.NotFoundException('Unrecognized path {0}'.format(
         '/'.join(pathcomponents)))
 
@@ -796,6 +917,8 @@ async def test_main():
         print(repr(_macmap))
         print("switch to fdb lookup table: -------------------")
         print(repr(_macsbyswitch))
+        print("switch walk times: -------------------")
+        print(repr(get_walk_times()))
 
 if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == '-o':
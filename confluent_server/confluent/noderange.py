@@ -20,10 +20,13 @@
 # the middle of strings and use of @ for anything is not in their syntax
 
 
+import collections
 import copy
+import functools
 import itertools
 import pyparsing as pp
 import re
+import sys
 
 try:
     range = xrange
@@ -46,6 +49,23 @@ numregex = re.compile('([0-9]+)')
 
 lastnoderange = None
 
+# Expanded noderanges by tenant and noderange string, each with the config
+# generation it was expanded against.  The nodes are held as a tuple, which
+# costs a fraction of the memory of a set of the same names.
+_expansioncache = collections.OrderedDict()
+_expansioncachesize = 256
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_noderange(noderange):
+    # The parse tree is only ever read, so one may be shared by every
+    # evaluation of the same string
+    try:
+        return _parser.parseString(
+            "(" + noderange + ")", parseAll=True).asList()[0]
+    except pp.ParseException:
+        raise Exception("Invalid syntax")
+
 def humanify_nodename(nodename):
     """Analyzes nodename in a human way to enable natural sort
 
@@ -277,16 +297,31 @@ class NodeRange(object):
         self.endpage = None
         self.cfm = config
         self.purenumeric = purenumeric
-        try:
-            elements = _parser.parseString("(" + noderange + ")", parseAll=True).asList()[0]
-        except pp.ParseException:
-            raise Exception("Invalid syntax")
+        cachekey = None
+        if config is not None:
+            cachekey = (config.tenant, noderange, purenumeric)
+            generation = config.get_generation()
+            cached = _expansioncache.get(cachekey, None)
+            if cached and cached[0] == generation:
+                _expansioncache.move_to_end(cachekey)
+                _, nodes, self.beginpage, self.endpage = cached
+                self._noderange = set(nodes)
+                lastnoderange = {noderange: set(self._noderange)}
+                return
+        elements = _parse_noderange(noderange)
         if noderange[0] in ('<', '>'):
             # pagination across all nodes
             self._evaluate(elements)
             self._noderange = set(self.cfm.list_nodes())
         else:
             self._noderange = self._evaluate(elements)
+        if cachekey is not None:
+            _expansioncache[cachekey] = (
+                generation, tuple(sys.intern(x) for x in self._noderange),
+                self.beginpage, self.endpage)
+            _expansioncache.move_to_end(cachekey)
+            while len(_expansioncache) > _expansioncachesize:
+                _expansioncache.popitem(last=False)
         lastnoderange = {noderange: set(self._noderange)}
 
     @property
@@ -1,19 +1,26 @@
 #!/usr/bin/python
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import fcntl
 from fnmatch import fnmatch
 import glob
 import logging
 logging.getLogger('libarchive').addHandler(logging.NullHandler())
 import libarchive
 import hashlib
+import json
+import msgpack
 import os
 try:
     from io import BytesIO
     import pycdlib
 except ImportError:
     pycdlib = None
+import queue
 import shutil
 import sys
+import tempfile
+import threading
 import time
 import yaml
 if __name__ == '__main__':
@@ -47,13 +54,20 @@ HASHPRINTS = {
     '69d5f1c5e4474d70b0fb5374bfcb29bf57ba828ff00a55237cd757e61ed71048': {'name': 'cumulus-broadcom-amd64-4.0.0', 'method': COPY},
 }
 
-from ctypes import byref, c_longlong, c_size_t, c_void_p
+from ctypes import create_string_buffer
 
 from libarchive.ffi import (
-    write_header,
-    read_data_block, write_data_block, write_finish_entry, ARCHIVE_EOF
+    c_archive_entry_p, entry_free, ffi, write_header,
+    read_data, write_data_block, write_finish_entry
 )
 
+entry_clone = ffi('entry_clone', [c_archive_entry_p], c_archive_entry_p)
+
+# Media is read this much at a time, and at most WRITEDEPTH blocks may be
+# waiting to be written out
+READBLOCK = 1048576
+WRITEDEPTH = 32
+
 def relax_umask():
     os.umask(0o22)
 
@@ -256,44 +270,137 @@ async def update_boot_linux(profiledir, profile, label):
          '{0}/boot.img'.format(profiledir), profname, preexec_fn=relax_umask)
 
 
+class OrderedWriter(object):
+    """Carry out writes on a thread of their own, in the order submitted
+
+    This lets reading the next block of media overlap with writing out the
+    last one.  A failed write is raised from the next submit or from close.
+    """
+
+    def __init__(self, depth=WRITEDEPTH):
+        self.error = None
+        self._queue = queue.Queue(depth)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            if self.error:
+                continue
+            try:
+                op[0](*op[1:])
+            except Exception as e:
+                self.error = e
+
+    def submit(self, *op):
+        if self.error:
+            raise self.error
+        self._queue.put(op)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error:
+            raise self.error
+
+
+class Progress(object):
+    """Report progress and transfer rate through a callback, twice a second
+    """
+
+    def __init__(self, callback, totalsize, base=0.0, share=1.0):
+        self.callback = callback
+        self.totalsize = totalsize
+        self.base = base
+        self.share = share
+        self.sizedone = 0
+        self.lastsize = 0
+        self.lastreport = time.monotonic()
+        self.reportat = 0
+
+    def report(self):
+        now = time.monotonic()
+        rate = 0
+        if now > self.lastreport:
+            rate = int((self.sizedone - self.lastsize) / (now - self.lastreport))
+        self.lastsize = self.sizedone
+        self.lastreport = now
+        self.reportat = now + 0.5
+        self.callback({'progress': self.fraction, 'rate': rate})
+
+    def update(self, size):
+        self.sizedone += size
+        if self.callback and time.monotonic() > self.reportat:
+            self.report()
+
+    @property
+    def fraction(self):
+        if not self.totalsize:
+            return self.base
+        return self.base + (
+            float(self.sizedone) / float(self.totalsize)) * self.share
+
+
+def _write_entry_header(write_p, entry_p):
+    try:
+        write_header(write_p, entry_p)
+    finally:
+        entry_free(entry_p)
+
+
+def _finish_entry(write_p, name):
+    write_finish_entry(write_p)
+    if os.path.isdir(name):
+        # This directory must be world accessible for web server
+        os.chmod(name, 0o755)  # nosec
+    else:
+        os.chmod(name, 0o644)
+
+
 def extract_entries(entries, flags=0, callback=None, totalsize=None, extractlist=None):
     """Extracts the given archive entries into the current directory.
     """
-    buff, size, offset = c_void_p(), c_size_t(), c_longlong()
-    buff_p, size_p, offset_p = byref(buff), byref(size), byref(offset)
-    sizedone = 0
-    printat = 0
+    progress = Progress(callback, totalsize)
     with libarchive.extract.new_archive_write_disk(flags) as write_p:
-        for entry in entries:
-            if str(entry).endswith('TRANS.TBL'):
-                continue
-            if extractlist:
-                normname = str(entry).lower()
-                for extent in extractlist:
-                    if fnmatch(normname, extent):
-                        break
-                else:
+        writer = OrderedWriter()
+        try:
+            for entry in entries:
+                if str(entry).endswith('TRANS.TBL'):
                     continue
-            write_header(write_p, entry._entry_p)
-            read_p = entry._archive_p
-            while 1:
-                r = read_data_block(read_p, buff_p, size_p, offset_p)
-                sizedone += size.value
-                if callback and time.time() > printat:
-                    callback({'progress': float(sizedone) / float(totalsize)})
-                    printat = time.time() + 0.5
-                if r == ARCHIVE_EOF:
-                    break
-                write_data_block(write_p, buff, size, offset)
-            write_finish_entry(write_p)
-            if os.path.isdir(str(entry)):
-                # This directory must be world accessible for web server
-                os.chmod(str(entry), 0o755)  # nosec
-            else:
-                os.chmod(str(entry), 0o644)
+                if extractlist:
+                    normname = str(entry).lower()
+                    for extent in extractlist:
+                        if fnmatch(normname, extent):
+                            break
+                    else:
+                        continue
+                # The entry is reused by the reader for the next header, so
+                # the writer gets a copy of its own
+                writer.submit(_write_entry_header, write_p,
+                              entry_clone(entry._entry_p))
+                read_p = entry._archive_p
+                # libarchive hands over iso9660 data a sector or so at a
+                # time, so it is gathered into large writes here
+                blocksize = min(READBLOCK, max(entry.size or 0, 4096))
+                offset = 0
+                while 1:
+                    buff = create_string_buffer(blocksize)
+                    size = read_data(read_p, buff, blocksize)
+                    if not size:
+                        break
+                    progress.update(size)
+                    writer.submit(write_data_block, write_p, buff, size,
+                                  offset)
+                    offset += size
+                writer.submit(_finish_entry, write_p, str(entry))
+        finally:
+            writer.close()
     if callback:
-        callback({'progress': float(sizedone) / float(totalsize)})
-    return float(sizedone) / float(totalsize)
+        progress.report()
+    return progress.fraction
 
 
 def extract_udf(archfile, callback=lambda x: None):
@@ -319,20 +426,26 @@ def extract_udf(archfile, callback=lambda x: None):
     return True
 
 
-def extract_file(archfile, flags=0, callback=lambda x: None, imginfo=(), extractlist=None, method=EXTRACT):
-    """Extracts an archive from a file into the current directory."""
-    if EXTRACTUDF & method:
-        return extract_udf(archfile, callback)
+def media_size(imginfo):
+    """Total the size of the files found by fingerprinting"""
     totalsize = 0
-    for img in imginfo:
+    for img in imginfo or ():
         if not imginfo[img]:
             continue
         totalsize += imginfo[img]
+    return totalsize
+
+
+def extract_file(archfile, flags=0, callback=lambda x: None, imginfo=(), extractlist=None, method=EXTRACT):
+    """Extracts an archive from a file into the current directory."""
+    if EXTRACTUDF & method:
+        return extract_udf(archfile, callback)
+    totalsize = media_size(imginfo)
     dfd = os.dup(archfile.fileno())
     os.lseek(dfd, 0, 0)
     pctdone = 0
     try:
-        with libarchive.fd_reader(dfd) as archive:
+        with libarchive.fd_reader(dfd, block_size=READBLOCK) as archive:
             pctdone = extract_entries(archive, flags, callback, totalsize,
                                       extractlist)
     finally:
@@ -932,24 +1045,48 @@ def fingerprint(archive):
         sum = hashlib.sha256(header)
         if sum.digest() in HEADERSUMS:
             archive.seek(32768)
-            chunk = archive.read(32768)
+            chunk = archive.read(READBLOCK)
             while chunk:
                 sum.update(chunk)
-                chunk = archive.read(32768)
+                chunk = archive.read(READBLOCK)
             imginfo = HASHPRINTS.get(sum.hexdigest(), None)
             if imginfo:
                 return imginfo, None, None
 
 
-async def import_image(filename, callback, backend=False, mfd=None, custtargpath=None, custdistpath=None, custname=''):
+def _copy_media(archive, targiso, progress):
+    archive.seek(0, 0)
+    with open(targiso, 'wb') as targ:
+        writer = OrderedWriter()
+        try:
+            buf = archive.read(READBLOCK)
+            while buf:
+                progress.update(len(buf))
+                writer.submit(targ.write, buf)
+                buf = archive.read(READBLOCK)
+        finally:
+            writer.close()
+
+
+async def import_image(filename, callback, backend=False, mfd=None, custtargpath=None, custdistpath=None, custname='', identity=None):
+    """Import media into the distributions directory
+
+    :param identity: The result of fingerprinting, if already done, as a
+                     tuple of the identity, the size to extract and the check
+                     that recognized it
+    """
     if mfd:
         archive = os.fdopen(int(mfd), 'rb')
     else:
         archive = open(filename, 'rb')
-    identity = await asyncio.to_thread(fingerprint, archive)
-    if not identity:
-        return -1
-    identity, imginfo, funname = identity
+    if identity:
+        identity, imgsize, funname = identity
+        imginfo = {'media': imgsize}
+    else:
+        identity = await asyncio.to_thread(fingerprint, archive)
+        if not identity:
+            return -1
+        identity, imginfo, funname = identity
     distpath = custdistpath
     if not distpath:
         targpath = identity['name']
@@ -972,27 +1109,16 @@ async def import_image(filename, callback, backend=False, mfd=None, custtargpath
     callback({'progress': 0.0})
     pct = 0.0
     if EXTRACT & identity['method'] or EXTRACTUDF & identity['method']:
-        pct = extract_file(archive, callback=callback, imginfo=imginfo,
-                           extractlist=identity.get('extractlist', None), method=identity['method'])
+        pct = await asyncio.to_thread(
+            extract_file, archive, callback=callback, imginfo=imginfo,
+            extractlist=identity.get('extractlist', None),
+            method=identity['method'])
     if COPY & identity['method']:
         basename = identity.get('copyto', os.path.basename(filename))
         targiso = os.path.join(targpath, basename)
         archive.seek(0, 2)
-        totalsz = archive.tell()
-        currsz = 0
-        modpct = 1.0 - pct
-        archive.seek(0, 0)
-        printat = 0
-        with open(targiso, 'wb') as targ:
-            buf = archive.read(32768)
-            while buf:
-                currsz += len(buf)
-                pgress = pct + ((float(currsz) / float(totalsz)) * modpct)
-                if time.time() > printat:
-                    callback({'progress': pgress})
-                    printat = time.time() + 0.5
-                targ.write(buf)
-                buf = archive.read(32768)
+        progress = Progress(callback, archive.tell(), pct, 1.0 - pct)
+        await asyncio.to_thread(_copy_media, archive, targiso, progress)
     with open(targpath + '/distinfo.yaml', 'w') as distinfo:
         distinfo.write(yaml.dump(identity, default_flow_style=False))
     if 'subname' in identity:
@@ -1005,7 +1131,10 @@ async def import_image(filename, callback, backend=False, mfd=None, custtargpath
     sys.stdout.write('\n')
 
 def printit(info):
-    sys.stdout.write('     \r{:.2f}%'.format(100 * info['progress']))
+    status = '     \r{:.2f}%'.format(100 * info['progress'])
+    if info.get('rate', None):
+        status += ' {:.1f} MiB/s'.format(info['rate'] / 1048576.0)
+    sys.stdout.write(status)
     sys.stdout.flush()
 
 
@@ -1032,24 +1161,155 @@ importing = {}
 class ManifestMissing(Exception):
     pass
 
+# ioctl to have a file share the blocks of another, on filesystems supporting
+# copy on write
+FICLONE = 0x40049409
+
+
+def clone_file(src, dst):
+    """Copy a file, sharing its blocks with the original where possible
+
+    Profile files are edited in place by administrators, so they are never
+    hardlinked to their source, only cloned if the filesystem can do so
+    safely.
+    """
+    try:
+        with open(src, 'rb') as srcf:
+            with open(dst, 'wb') as dstf:
+                fcntl.ioctl(dstf.fileno(), FICLONE, srcf.fileno())
+    except OSError:
+        return shutil.copy2(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
+
 def copy_file(src, dst):
     newdir = os.path.dirname(dst)
     makedirs(newdir, 0o755)
-    shutil.copy2(src, dst)
+    clone_file(src, dst)
 
-async def get_hash(fname):
+
+def _copy_files(pairs):
+    for src, dst in pairs:
+        copy_file(src, dst)
+
+
+_hashworkercount = min(4, os.cpu_count() or 1)
+_hashworkers = None
+_hashcleaner = None
+_hashcachefile = '/var/cache/confluent/osimage.hashes'
+# Digests by file identity, so an unchanged file is not read again
+_hashcache = None
+_hashcachelock = threading.Lock()
+_hashcachemax = 500000
+
+
+def _get_hashworkers():
+    global _hashworkers
+    global _hashcleaner
+    if _hashworkers is None:
+        _hashworkers = ProcessPoolExecutor(max_workers=_hashworkercount)
+    elif _hashcleaner is not None:
+        _hashcleaner.cancel()
+    _hashcleaner = tasks.spawn_task_after(30, _clean_hashworkers)
+    return _hashworkers
+
+
+def _clean_hashworkers():
+    global _hashworkers
+    global _hashcleaner
+    if _hashworkers is not None:
+        _hashworkers.shutdown(wait=False)
+    _hashworkers = None
+    _hashcleaner = None
+
+
+def _hash_file(fname):
     currhash = hashlib.sha512()
     with open(fname, 'rb') as currf:
         currd = currf.read(1048576)
-        await asyncio.sleep(0)
         while currd:
             currhash.update(currd)
             currd = currf.read(1048576)
-            await asyncio.sleep(0)
-
     return currhash.hexdigest()
 
 
+def _hash_key(st):
+    return '{0}:{1}:{2}:{3}'.format(st.st_dev, st.st_ino, st.st_size,
+                                    st.st_mtime_ns)
+
+
+def _load_hashcache():
+    global _hashcache
+    with _hashcachelock:
+        if _hashcache is not None:
+            return
+        hashcache = {}
+        try:
+            with open(_hashcachefile, 'rb') as cachein:
+                hashcache = msgpack.unpackb(cachein.read(), raw=False)
+        except Exception:
+            pass
+        _hashcache = hashcache
+
+
+def _save_hashcache(hashcache):
+    # Concurrent hashing may save at the same time, each writes its own
+    # temporary file and the last rename wins
+    with _hashcachelock:
+        try:
+            cachedir = os.path.dirname(_hashcachefile)
+            makedirs(cachedir, 0o755)
+            tmpfd, tmpname = tempfile.mkstemp(dir=cachedir,
+                                              prefix='.osimage.hashes.')
+            try:
+                with os.fdopen(tmpfd, 'wb') as cacheout:
+                    cacheout.write(msgpack.packb(hashcache, use_bin_type=True))
+                os.rename(tmpname, _hashcachefile)
+            except Exception:
+                os.unlink(tmpname)
+                raise
+        except OSError:
+            pass
+
+
+async def _hash_files(fnames):
+    """Get the digests of many files, reading only those not seen before
+
+    :param fnames: A list of file names
+    :returns: A list of digests in the same order
+    """
+    cloop = asyncio.get_running_loop()
+    await cloop.run_in_executor(None, _load_hashcache)
+    keys = await cloop.run_in_executor(
+        None, lambda: [_hash_key(os.stat(fname)) for fname in fnames])
+    hashes = {}
+    pending = {}
+    for fname, key in zip(fnames, keys):
+        if key in _hashcache:
+            hashes[key] = _hashcache[key]
+        elif key not in pending:
+            pending[key] = fname
+    if pending:
+        workers = _get_hashworkers()
+        digests = await asyncio.gather(*[
+            cloop.run_in_executor(workers, _hash_file, pending[key])
+            for key in pending])
+        for key, digest in zip(pending, digests):
+            _hashcache[key] = digest
+            hashes[key] = digest
+        while len(_hashcache) > _hashcachemax:
+            # The oldest entries go first
+            del _hashcache[next(iter(_hashcache))]
+        # Saved from a copy, as the cache may change while it is written
+        await cloop.run_in_executor(None, _save_hashcache, dict(_hashcache))
+    return [hashes[key] for key in keys]
+
+
+async def get_hash(fname):
+    return (await _hash_files([fname]))[0]
+
+
 async def rebase_profile(dirname):
     if dirname.startswith('/var/lib/confluent/public'):
         profiledir = dirname
@@ -1062,12 +1322,13 @@ async def rebase_profile(dirname):
     except IOError:
         raise ManifestMissing()
     distdir = manifest['distdir']
-    currhashes = await get_hashes(profiledir, distdir)
-    newdisthashes = await get_hashes(distdir)
+    currhashes, newdisthashes = await asyncio.gather(
+        get_hashes(profiledir, distdir), get_hashes(distdir))
     olddisthashes = manifest['disthashes']
     customized = []
     newmanifest = []
     updated = []
+    tocopy = []
     for updatecandidate in newdisthashes:
         newfilename = os.path.join(profiledir, updatecandidate)
         distfilename = os.path.join(distdir, updatecandidate)
@@ -1075,7 +1336,7 @@ async def rebase_profile(dirname):
         currhash = currhashes.get(updatecandidate, None)
         olddisthash = olddisthashes.get(updatecandidate, None)
         if not currhash:  # file does not exist yet
-            copy_file(distfilename, newfilename)
+            tocopy.append((distfilename, newfilename))
             newmanifest.append(updatecandidate)
             updated.append(updatecandidate)
         elif currhash == newdisthash:
@@ -1083,13 +1344,13 @@ async def rebase_profile(dirname):
         elif currhash != olddisthash:
             customized.append(updatecandidate)
         else:
-            copy_file(distfilename, newfilename)
+            tocopy.append((distfilename, newfilename))
             updated.append(updatecandidate)
             newmanifest.append(updatecandidate)
+    await asyncio.get_running_loop().run_in_executor(None, _copy_files, tocopy)
     for nf in newmanifest:
-        nfname = os.path.join(profiledir, nf)
-        currhash = await get_hash(nfname)
-        manifest['disthashes'][nf] = currhash
+        # Each of these now matches the distribution copy
+        manifest['disthashes'][nf] = newdisthashes[nf]
     with open('{0}/manifest.yaml'.format(profiledir), 'w') as yout:
             yout.write('# This manifest enables rebase to know original source of profile data and if any customizations have been done\n')
             yout.write(yaml.dump(manifest, default_flow_style=False))
@@ -1104,7 +1365,7 @@ async def rebase_profile(dirname):
 
 
 
-async def get_hashes(dirname, filterdir=None):
+def _list_hashable(dirname, filterdir=None):
     filtermap = {}
     if filterdir:
         for dname, _, fnames in os.walk(filterdir):
@@ -1113,7 +1374,7 @@ async def get_hashes(dirname, filterdir=None):
                 subname = fullname.replace(filterdir + '/', '')
                 if os.path.isfile(fullname):
                     filtermap[subname] = True
-    hashmap = {}
+    hashable = []
     for dname, _, fnames in os.walk(dirname):
         for fname in fnames:
             if fname == 'profile.yaml':
@@ -1123,8 +1384,15 @@ async def get_hashes(dirname, filterdir=None):
             if filterdir and subname not in filtermap:
                 continue
             if os.path.isfile(fullname):
-                hashmap[subname] = await get_hash(fullname)
-    return hashmap
+                hashable.append((subname, fullname))
+    return hashable
+
+
+async def get_hashes(dirname, filterdir=None):
+    hashable = await asyncio.get_running_loop().run_in_executor(
+        None, _list_hashable, dirname, filterdir)
+    digests = await _hash_files([x[1] for x in hashable])
+    return dict(zip([x[0] for x in hashable], digests))
 
 
 async def generate_stock_profiles(defprofile, distpath, targpath, osname,
@@ -1141,7 +1409,8 @@ async def generate_stock_profiles(defprofile, distpath, targpath, osname,
         if os.path.exists(dirname):
             continue
         oumask = os.umask(0o22)
-        shutil.copytree(srcname, dirname)
+        await asyncio.to_thread(shutil.copytree, srcname, dirname,
+                                copy_function=clone_file)
         hmap = await get_hashes(dirname, srcname)
         profdata = None
         try:
@@ -1200,6 +1469,7 @@ class MediaImporter(object):
         self.errors = []
         medfile = None
         self.medfile = None
+        self.rate = 0
         if cfm and media in cfm.clientfiles:
             self.medfile = cfm.clientfiles[media]
             medfile = self.medfile
@@ -1213,7 +1483,9 @@ class MediaImporter(object):
         if not identity:
             raise exc.InvalidArgumentException('Unsupported Media')
         self.percent = 0.0
-        identity, _, _ = identity
+        identity, imginfo, funname = identity
+        # Handed to the import worker, so it need not scan the media again
+        self.identity = (identity, media_size(imginfo), funname)
         self.phase = 'copying'
         if not identity:
             raise Exception('Unrecognized OS Media')
@@ -1256,58 +1528,61 @@ class MediaImporter(object):
 
     @property
     def progress(self):
-        return {'phase': self.phase, 'progress': self.percent, 'profiles': self.profiles, 'error': self.error}
+        return {'phase': self.phase, 'progress': self.percent, 'rate': self.rate, 'profiles': self.profiles, 'error': self.error}
+
+    def _parse_status(self, status):
+        """Take in a status update from the import worker
+
+        :returns: False if the worker reported an error
+        """
+        if b'ERROR:' in status:
+            self.error = status.replace(b'ERROR:', b'')
+            if not isinstance(self.error, str):
+                self.error = self.error.decode('utf8')
+            self.phase = 'error'
+            self.percent = 100.0
+            self.rate = 0
+            return False
+        if b'%' in status:
+            val, _, rate = status.partition(b'%')
+            try:
+                self.percent = float(val.strip())
+            except ValueError:
+                pass
+            rate = rate.split()
+            try:
+                self.rate = int(float(rate[0]) * 1048576) if rate else 0
+            except ValueError:
+                pass
+        return True
 
     async def importmedia(self):
+        # Each worker gets its own environment, as other imports may be
+        # starting at the same time
+        env = dict(os.environ)
+        env.pop('CONFLUENT_MEDIAFD', None)
         if self.medfile:
-            os.environ['CONFLUENT_MEDIAFD'] = '{0}'.format(self.medfile.fileno())
+            env['CONFLUENT_MEDIAFD'] = '{0}'.format(self.medfile.fileno())
+        env['CONFLUENT_MEDIAIDENTITY'] = json.dumps(self.identity)
         self.worker = await asyncio.create_subprocess_exec(
             sys.executable, __file__, self.filename, '-b',
             self.targpath, self.distpath, self.customname,
-            stdout=asyncio.subprocess.PIPE, close_fds=False)
+            stdout=asyncio.subprocess.PIPE, close_fds=False, env=env)
         wkr = self.worker
         currline = b''
-        while wkr.returncode is None:
-            try:
-                await asyncio.wait_for(wkr.wait(), 0.001)
-            except asyncio.TimeoutError:
-                pass
-            nb = await wkr.stdout.read(128)
+        while True:
+            nb = await wkr.stdout.read(4096)
+            if not nb:
+                break
             currline += nb
-            if b'\r' in currline:
-                if b'ERROR:' in currline:
-                    self.error = currline.replace(b'ERROR:', b'')
-                    if not isinstance(self.error, str):
-                        self.error = self.error.decode('utf8')
-                    self.phase = 'error'
-                    self.percent = 100.0
-                    return
-                elif b'%' in currline:
-                    val = currline.split(b'%')[0].strip()
-                    try:
-                        self.percent = float(val)
-                    except ValueError:
-                        pass
-                currline = b''
-        a = await wkr.stdout.read(1)
-        while a:
-            currline += a
-            if b'\r' in currline:
-                if b'ERROR:' in currline:
-                    self.error = currline.replace(b'ERROR:', b'')
-                    if not isinstance(self.error, str):
-                        self.error = self.error.decode('utf8')
-                    self.phase = 'error'
-                    self.percent = 100.0
+            while b'\r' in currline:
+                status, currline = currline.split(b'\r', 1)
+                if not self._parse_status(status):
                     return
-                elif b'%' in currline:
-                    val = currline.split(b'%')[0].strip()
-                    try:
-                        self.percent = float(val)
-                    except ValueError:
-                        pass
-                currline = b''
-            a = await wkr.stdout.read(1)
+        if not self._parse_status(currline):
+            return
+        await wkr.wait()
+        self.rate = 0
         if self.oscategory:
             defprofile = '/opt/confluent/lib/osdeploy/{0}'.format(
                 self.oscategory)
@@ -1340,6 +1615,9 @@ if __name__ == '__main__':
     os.umask(0o022)
     if len(sys.argv) > 2:
         mfd = os.environ.get('CONFLUENT_MEDIAFD', None)
-        asyncio.run(import_image(sys.argv[1], callback=printit, backend=True, mfd=mfd, custtargpath=sys.argv[3], custdistpath=sys.argv[4], custname=sys.argv[5]))
+        identity = os.environ.get('CONFLUENT_MEDIAIDENTITY', None)
+        if identity:
+            identity = json.loads(identity)
+        asyncio.run(import_image(sys.argv[1], callback=printit, backend=True, mfd=mfd, custtargpath=sys.argv[3], custdistpath=sys.argv[4], custname=sys.argv[5], identity=identity))
     else:
         asyncio.run(import_image(sys.argv[1], callback=printit))
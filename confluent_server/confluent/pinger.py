@@ -0,0 +1,196 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Check many hosts for an ICMP echo reply at once, rather than running a ping
+# process for each.  All probes of an address family share one socket, an
+# unprivileged ICMP datagram socket where the system allows it and a raw
+# socket otherwise, and replies are matched back to the waiting probe by
+# address and sequence number.
+
+import asyncio
+import confluent.tasks as tasks
+import os
+import random
+import socket
+import struct
+
+ICMP_ECHOREPLY = 0
+ICMP_ECHO = 8
+ICMP6_ECHO = 128
+ICMP6_ECHOREPLY = 129
+# How many probes may be awaiting a reply at once, more than this can overrun
+# the receive buffer when a large noderange answers at once
+MAXINFLIGHT = 1024
+
+_pinger = None
+
+
+def _checksum(packet):
+    if len(packet) % 2:
+        packet += b'\x00'
+    total = sum(struct.unpack('!{0}H'.format(len(packet) // 2), packet))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+class _EchoSocket(object):
+
+    def __init__(self, family, pinger):
+        self.family = family
+        self.pinger = pinger
+        if family == socket.AF_INET:
+            proto = socket.IPPROTO_ICMP
+            self.echotype = ICMP_ECHO
+            self.replytype = ICMP_ECHOREPLY
+        else:
+            proto = socket.IPPROTO_ICMPV6
+            self.echotype = ICMP6_ECHO
+            self.replytype = ICMP6_ECHOREPLY
+        try:
+            self.sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+            # The kernel assigns and checks the identifier itself
+            self.raw = False
+        except OSError:
+            self.sock = socket.socket(family, socket.SOCK_RAW, proto)
+            self.raw = True
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1048576)
+        asyncio.get_running_loop().add_reader(self.sock, self._recv)
+
+    def _recv(self):
+        while True:
+            try:
+                data, peer = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # An error queued against the socket, such as an unreachable
+                # host, is left to the probe to time out
+                continue
+            if self.raw and self.family == socket.AF_INET:
+                data = data[(data[0] & 0xf) * 4:]
+            if len(data) < 8:
+                continue
+            icmptype, _, _, ident, seq = struct.unpack('!BBHHH', data[:8])
+            if icmptype != self.replytype:
+                continue
+            if self.raw and ident != self.pinger.ident:
+                continue
+            self.pinger.answered(self.family, peer[0], seq)
+
+    async def send(self, packet, sockaddr):
+        while True:
+            try:
+                self.sock.sendto(packet, sockaddr)
+                return
+            except BlockingIOError:
+                await asyncio.sleep(0.001)
+
+    def echo_request(self, ident, seq):
+        packet = struct.pack('!BBHHH', self.echotype, 0, 0, ident, seq)
+        packet += b'confluent'
+        if self.family == socket.AF_INET:
+            # ICMPv6 has the kernel fill in the checksum, ICMP does not
+            packet = packet[:2] + struct.pack(
+                '!H', _checksum(packet)) + packet[4:]
+        return packet
+
+
+class Pinger(object):
+    """Send ICMP echo requests and wait on the replies
+
+    Any number of probes may be in flight, each with its own timeout.
+    """
+
+    def __init__(self):
+        self.ident = os.getpid() & 0xffff
+        self._seq = random.randint(0, 0xffff)
+        self._sockets = {}
+        self._waiting = {}
+        self._inflight = asyncio.Semaphore(MAXINFLIGHT)
+
+    def _get_socket(self, family):
+        if family not in self._sockets:
+            self._sockets[family] = _EchoSocket(family, self)
+        return self._sockets[family]
+
+    def answered(self, family, address, seq):
+        reply = self._waiting.pop((family, address, seq), None)
+        if reply is not None and not reply.done():
+            reply.set_result(True)
+
+    async def ping_address(self, family, sockaddr, timeout=1.0):
+        """Check if an address answers an echo request within timeout
+
+        :param family: socket.AF_INET or socket.AF_INET6
+        :param sockaddr: The address, as given by getaddrinfo
+        :returns: True if a reply arrived in time
+        """
+        async with self._inflight:
+            echosock = self._get_socket(family)
+            self._seq = (self._seq + 1) & 0xffff
+            key = (family, sockaddr[0], self._seq)
+            reply = asyncio.get_running_loop().create_future()
+            self._waiting[key] = reply
+            try:
+                try:
+                    await echosock.send(
+                        echosock.echo_request(self.ident, self._seq), sockaddr)
+                except OSError:
+                    return False
+                try:
+                    return await asyncio.wait_for(reply, timeout)
+                except asyncio.TimeoutError:
+                    return False
+            finally:
+                self._waiting.pop(key, None)
+
+    async def ping_host(self, name, timeout=1.0):
+        """Check if a host name or address answers, as ping would
+
+        :returns: A tuple of the name and True if it answered
+        """
+        try:
+            addrs = await asyncio.get_running_loop().getaddrinfo(
+                name, None, type=socket.SOCK_DGRAM)
+        except socket.gaierror:
+            return name, False
+        family, _, _, _, sockaddr = addrs[0]
+        return name, await self.ping_address(family, sockaddr, timeout)
+
+
+def get_pinger():
+    global _pinger
+    if _pinger is None:
+        _pinger = Pinger()
+    return _pinger
+
+
+async def ping_hosts(names, timeout=1.0):
+    """Check a number of hosts, yielding each as its answer comes in
+
+    :param names: Host names or addresses
+    :param timeout: Seconds to wait on each host
+    :returns: Tuples of a name and True if it answered
+    """
+    pinger = get_pinger()
+
+    async def _ping_host(name):
+        return await pinger.ping_host(name, timeout)
+    async for result in tasks.task_imap(_ping_host, names,
+                                        max_concurrent=MAXINFLIGHT):
+        yield result
@@ -188,6 +188,16 @@ class IpmiCommandWrapper(ipmicommand.Command):
             (node,), ('secret.hardwaremanagementuser', 'collective.manager',
                       'secret.hardwaremanagementpassword', 
                       'hardwaremanagement.manager'), self._attribschanged)
+        try:
+            os.makedirs('/var/cache/confluent/redfish/')
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(
+                    '/var/cache/confluent/redfish/'):
+                raise
+        try:
+            self.set_sensor_cachedir('/var/cache/confluent/redfish/')
+        except Exception:
+            pass
         return self
 
     def close_confluent(self):
@@ -200,6 +210,7 @@ class IpmiCommandWrapper(ipmicommand.Command):
             del persistent_ipmicmds[(self.node, configmanager.tenant)]
         except KeyError:
             pass
+        self.close()
 
     async def get_health(self):
         if self._inhealth:
@@ -370,7 +381,7 @@ async def perform_request(operator, node, element,
     finally:
         await results.put('Done')
     if (node, cfg.tenant) in persistent_ipmicmds:
-        del persistent_ipmicmds[(node, cfg.tenant)]
+        persistent_ipmicmds.pop((node, cfg.tenant)).close()
 
 persistent_ipmicmds = {}
 
@@ -0,0 +1,52 @@
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import confluent.exceptions as exc
+import confluent.messages as msg
+import confluent.pinger as pinger
+
+
+async def _ping_targets(targets):
+    nodesbytarget = {}
+    for node in targets:
+        nodesbytarget.setdefault(targets[node], []).append(node)
+    async for target, reachable in pinger.ping_hosts(list(nodesbytarget)):
+        for node in nodesbytarget[target]:
+            yield msg.KeyValueData(
+                {'reachable': reachable, 'target': target}, node)
+
+
+async def retrieve(nodes, element, configmanager, inputdata):
+    async for rsp in _ping_targets(dict((node, node) for node in nodes)):
+        yield rsp
+
+
+async def create(nodes, element, configmanager, inputdata):
+    # Ping something other than the node name, such as '{bmc}'
+    if not nodes:
+        raise exc.InvalidArgumentException(
+            'Specified noderange contains no nodes')
+    expression = inputdata.get_attributes(list(nodes)[0])
+    if type(expression) is dict:
+        expression = expression['expression']
+    targets = {}
+    try:
+        for node, target in configmanager.expand_attrib_expression(
+                nodes, expression):
+            targets[node] = target
+    except (SyntaxError, ValueError) as e:
+        raise exc.InvalidArgumentException(
+            'Bad confluent expression syntax: ' + str(e))
+    async for rsp in _ping_targets(targets):
+        yield rsp
@@ -68,13 +68,8 @@ def principals_to_san(principals):
             san.add('DNS:' + principal)
     return ','.join(san)
 
-async def get_extra_names(nodename, cfg, myip=None, preferadjacent=False, addlocalhost=True):
-    if addlocalhost:
-        names = set(['127.0.0.1', '::1', 'localhost', 'localhost.localdomain'])
-    else:
-        names = set([])
-    dnsinfo = cfg.get_node_attributes(nodename, ('dns.*', 'net.*hostname'))
-    dnsinfo = dnsinfo.get(nodename, {})
+def _dns_names(nodename, dnsinfo):
+    names = set([])
     domain = dnsinfo.get('dns.domain', {}).get('value', None)
     if domain and domain not in nodename:
         names.add('{0}.{1}'.format(nodename, domain))
@@ -87,6 +82,16 @@ async def get_extra_names(nodename, cfg, myip=None, preferadjacent=False, addloc
                     names.add(currname)
                     if domain and domain not in currname:
                         names.add('{0}.{1}'.format(currname, domain))
+    return names
+
+
+async def get_extra_names(nodename, cfg, myip=None, preferadjacent=False, addlocalhost=True):
+    if addlocalhost:
+        names = set(['127.0.0.1', '::1', 'localhost', 'localhost.localdomain'])
+    else:
+        names = set([])
+    dnsinfo = cfg.get_node_attributes(nodename, ('dns.*', 'net.*hostname'))
+    names.update(_dns_names(nodename, dnsinfo.get(nodename, {})))
     if myip:
         ncfgs = [await netutil.get_nic_config(cfg, nodename, serverip=myip)]
         fncfg = await netutil.get_full_net_config(cfg, nodename, serverip=myip)
@@ -438,18 +443,15 @@ async def handle_request(req, make_response, mimetype):
         cert = await sshutil.sign_host_key(reqbody, nodename, pals)
         return await make_response('text/plain', 200, 'OK', body=cert.encode())
     elif reqpath == '/self/nodelist':
-        nodes, _ = await get_cluster_list(nodename, cfg)
+        clusternames = get_cluster_names(cfg)
         if isgeneric:
-            mrsp = await make_response('text/plain', 200, 'OK')
-            for node in util.natural_sort(nodes):
-                await mrsp.write(f'{node}\n'.encode('utf-8'))
-        else:
-            mrsp = await make_response(retype, 200, 'OK')
-            if retype == 'application/yaml':
-                await mrsp.write(listdump(list(util.natural_sort(nodes))))
-            else:
-                await mrsp.write(dumper(list(util.natural_sort(nodes))))
-        return mrsp
+            return await make_response('text/plain', 200, 'OK',
+                body=clusternames.render(nodename, cfg, 'text'))
+        elif retype == 'application/yaml':
+            return await make_response(retype, 200, 'OK',
+                body=clusternames.render(nodename, cfg, 'yaml'))
+        return await make_response(retype, 200, 'OK',
+            body=clusternames.render(nodename, cfg, 'json'))
     elif reqpath == '/self/remoteconfigbmc' and reqbody:
         try:
             reqbody = yamlload(reqbody)
@@ -646,39 +648,154 @@ def get_scriptlist(scriptcat, cfg, nodename, pathtemplate):
     return slist, profile
 
 
-async def get_cluster_list(nodename=None, cfg=None):
-    if cfg is None:
-        cfg = configmanager.ConfigManager(None)
-    nodes = None
-    if nodename is not None:
+class ClusterNames(object):
+    """The names of the nodes of a tenant, kept current by watching them
+
+    A deploying node asks for the cluster host list, and asks again for every
+    node being deployed, so the names of each node are kept as they change
+    and the list is assembled and serialized once until something changes.
+
+    :param cfg: A configmanager for the tenant
+    """
+
+    _watchattribs = ('dns.*', 'net.*hostname', 'ssh.trustnodes', 'groups')
+
+    def __init__(self, cfg):
+        self.names = {}
+        self.domains = {}
+        self.lists = {}
+        self.renders = {}
+        self.listsfor = None
+        nodes = cfg.list_nodes()
+        self.watcher = cfg.watch_attributes(nodes, self._watchattribs,
+                                            self._attribs_changed)
+        cfg.watch_nodecollection(self._nodes_changed)
+        self._update_names(nodes, cfg)
+
+    def _update_names(self, nodes, cfg):
+        dnsinfo = cfg.get_node_attributes(nodes, ('dns.*', 'net.*hostname'))
+        for node in nodes:
+            nodeinfo = dnsinfo.get(node, {})
+            self.domains[node] = nodeinfo.get('dns.domain', {}).get(
+                'value', None)
+            self.names[node] = _dns_names(node, nodeinfo)
+
+    def _invalidate(self):
+        self.lists = {}
+        self.renders = {}
+
+    def _attribs_changed(self, nodeattribs, configmanager):
+        self._update_names(list(nodeattribs), configmanager)
+        # ssh.trustnodes and groups only change which nodes go in a list
+        self._invalidate()
+
+    def _nodes_changed(self, added, deleting, renamed, configmanager):
+        configmanager.remove_watcher(self.watcher)
+        alldeleting = set(deleting) | set(renamed)
+        for node in alldeleting:
+            self.names.pop(node, None)
+            self.domains.pop(node, None)
+        alladding = set(added)
+        for oldname in renamed:
+            alladding.add(renamed[oldname])
+        self.watcher = configmanager.watch_attributes(
+            [x for x in configmanager.list_nodes() if x not in alldeleting],
+            self._watchattribs, self._attribs_changed)
+        self._update_names(list(alladding), configmanager)
+        self._invalidate()
+
+    def get_list(self, nodename, cfg):
+        """Get the names a node should trust, and the dns domain
+
+        The returned set is shared, and must not be modified.
+
+        :param nodename: The node asking, or None for the whole cluster
+        """
+        return self._get_list(self._get_trustnodes(nodename, cfg), cfg)
+
+    def _get_trustnodes(self, nodename, cfg):
+        if nodename is None:
+            return None
         sshpeers = cfg.get_node_attributes(nodename, 'ssh.trustnodes')
-        sshpeers = sshpeers.get(nodename, {}).get('ssh.trustnodes', {}).get(
-            'value', None)
+        return sshpeers.get(nodename, {}).get(
+            'ssh.trustnodes', {}).get('value', None) or None
+
+    def _get_list(self, sshpeers, cfg):
+        # The collective membership is not watched, so a change in it is
+        # noticed here instead
+        collectivenames = (tuple(sorted(configmanager.list_collective())),
+                           collective.get_myname())
+        if collectivenames != self.listsfor:
+            self._invalidate()
+            self.listsfor = collectivenames
+        if sshpeers not in self.lists:
+            self.lists[sshpeers] = self._assemble(sshpeers, cfg)
+        return self.lists[sshpeers]
+
+    def _assemble(self, sshpeers, cfg):
+        nodes = None
         if sshpeers:
             nodes = noderange.NodeRange(sshpeers, cfg).nodes
-    autonodes = False
-    if nodes is None:
-        autonodes = True
-        nodes = set(cfg.list_nodes())
-    domain = None
-    for node in list(util.natural_sort(nodes)):
-        if domain is None:
-            domaininfo = cfg.get_node_attributes(node, 'dns.domain')
-            domain = domaininfo.get(node, {}).get('dns.domain', {}).get(
-                'value', None)
-        for extraname in await get_extra_names(node, cfg):
-            nodes.add(extraname)
-    if autonodes:
-        for mgr in configmanager.list_collective():
-            nodes.add(mgr)
-            if domain and domain not in mgr:
-                nodes.add('{0}.{1}'.format(mgr, domain))
-        myname = collective.get_myname()
-        nodes.add(myname)
-        if domain and domain not in myname:
-            nodes.add('{0}.{1}'.format(myname, domain))
-    nodes.add('::1')
-    nodes.add('127.0.0.1')
-    nodes.add('localhost')
-    nodes.add('localhost.domain')
-    return nodes, domain
+        autonodes = False
+        if nodes is None:
+            autonodes = True
+            nodes = set(cfg.list_nodes())
+        domain = None
+        for node in list(util.natural_sort(nodes)):
+            if node not in self.names:
+                # Not a node, but still named by ssh.trustnodes
+                self._update_names([node], cfg)
+            if domain is None:
+                domain = self.domains[node]
+            nodes.update(self.names[node])
+        if autonodes:
+            for mgr in configmanager.list_collective():
+                nodes.add(mgr)
+                if domain and domain not in mgr:
+                    nodes.add('{0}.{1}'.format(mgr, domain))
+            myname = collective.get_myname()
+            nodes.add(myname)
+            if domain and domain not in myname:
+                nodes.add('{0}.{1}'.format(myname, domain))
+        nodes.add('::1')
+        nodes.add('127.0.0.1')
+        nodes.add('localhost')
+        nodes.add('localhost.domain')
+        nodes.add('localhost.localdomain')
+        return nodes, domain
+
+    def render(self, nodename, cfg, fmt):
+        """Get the names a node should trust, serialized
+
+        :param nodename: The node asking, or None for the whole cluster
+        :param fmt: 'text', 'yaml', or 'json'
+        """
+        sshpeers = self._get_trustnodes(nodename, cfg)
+        nodes, _ = self._get_list(sshpeers, cfg)
+        key = (sshpeers, fmt)
+        if key not in self.renders:
+            nodes = list(util.natural_sort(nodes))
+            if fmt == 'text':
+                rendered = ''.join([f'{node}\n' for node in nodes]).encode('utf-8')
+            elif fmt == 'yaml':
+                rendered = listdump(nodes)
+            else:
+                rendered = jsondump(nodes)
+            self.renders[key] = rendered
+        return self.renders[key]
+
+
+_clusternames = {}
+
+
+def get_cluster_names(cfg):
+    if cfg.tenant not in _clusternames:
+        _clusternames[cfg.tenant] = ClusterNames(cfg)
+    return _clusternames[cfg.tenant]
+
+
+async def get_cluster_list(nodename=None, cfg=None):
+    if cfg is None:
+        cfg = configmanager.ConfigManager(None)
+    nodes, domain = get_cluster_names(cfg).get_list(nodename, cfg)
+    return set(nodes), domain
@@ -24,9 +24,14 @@
 import asyncio
 import confluent.exceptions as exc
 import socket
+import time
 import pysnmp.hlapi.asyncio as snmp
 import pysnmp.smi.rfc1902 as rfc1902
 
+# Bounds on how many rows are requested in each GETBULK of a walk
+MIN_REPETITIONS = 5
+MAX_REPETITIONS = 80
+
 async def _get_transport(name):
     # Annoyingly, pysnmp does not automatically determine ipv6 v ipv4
     res = await asyncio.get_running_loop().getaddrinfo(name, 161, type=socket.SOCK_DGRAM)
@@ -36,6 +41,35 @@ async def _get_transport(name):
         return await snmp.UdpTransportTarget.create(res[0][4], 2)
 
 
+class _Repetitions(object):
+    """Adapt the rows asked for per request to how a device copes
+
+    A device that answers a full request quickly is asked for more at a time,
+    and one that times out or reports the response too big is asked for less.
+    """
+
+    def __init__(self):
+        self.current = 10
+        self.limit = MAX_REPETITIONS
+        # Until the device has answered once, a timeout means it is not
+        # there at all rather than that the requests are too large
+        self.answered = False
+
+    def succeeded(self, elapsed, rows):
+        self.answered = True
+        if rows >= self.current and elapsed < 1:
+            self.current = min(self.current * 2, self.limit)
+
+    def failed(self):
+        """Ask for fewer rows, returning False if there is no going lower"""
+        if not self.answered or self.current <= MIN_REPETITIONS:
+            return False
+        # Stay below what failed from now on
+        self.current = max(self.current // 2, MIN_REPETITIONS)
+        self.limit = self.current
+        return True
+
+
 class Session(object):
 
     def __init__(self, server, secret, username=None, context=None, privacy_protocol=None):
@@ -53,6 +87,9 @@ class Session(object):
         """
         self.server = server
         self.context = context
+        self._secret = secret
+        self._username = username
+        self._privacy_protocol = privacy_protocol
         if username is None:
             # SNMP v2c
             self.authdata = snmp.CommunityData(secret, mpModel=1)
@@ -69,6 +106,35 @@ class Session(object):
                 authProtocol=snmp.usmHMACSHAAuthProtocol,
                 privProtocol=privproto)
         self.eng = snmp.SnmpEngine()
+        self._transport = None
+        self.repetitions = _Repetitions()
+
+    def get_vlan_session(self, vlan):
+        """Get a session for the per VLAN view of the same switch
+
+        The new session shares the engine, transport and adapted request size
+        of this one.  For SNMPv3 the VLAN is selected by context, and for v2c
+        by community string indexing.
+
+        :param vlan: The VLAN to view
+        """
+        if self._username:
+            vsess = Session(self.server, self._secret, self._username,
+                            'vlan-{0}'.format(vlan), self._privacy_protocol)
+        else:
+            secret = self._secret
+            if not isinstance(secret, str):
+                secret = secret.decode('utf8')
+            vsess = Session(self.server, '{0}@{1}'.format(secret, vlan))
+        vsess.eng = self.eng
+        vsess._transport = self._transport
+        vsess.repetitions = self.repetitions
+        return vsess
+
+    async def _get_transport(self):
+        if self._transport is None:
+            self._transport = await _get_transport(self.server)
+        return self._transport
 
     async def walk(self, oid):
         """Walk over children of a given OID
@@ -83,8 +149,8 @@ class Session(object):
         # there may come a time where we add more parameters to override the
         # automatic behavior (e.g. DES is weak, so it's likely to be
         # overriden, but some devices only support DES)
-        tp = await _get_transport(self.server)
-        ctx = snmp.ContextData(self.context)
+        tp = await self._get_transport()
+        ctx = snmp.ContextData(contextName=self.context or b'')
         resolvemib = False
         if '::' in oid:
             resolvemib = True
@@ -93,10 +159,13 @@ class Session(object):
             obj = snmp.ObjectType(snmp.ObjectIdentity(mib, field))
         else:
             obj = rfc1902.ObjectType(rfc1902.ObjectIdentity(oid))
-        walking = snmp.bulk_walk_cmd(self.eng, self.authdata, tp, ctx, 0, 10, obj,
-                                   lexicographicMode=False, lookupMib=resolvemib)
-        async for rsp in walking:
-            errstr, errnum, erridx, answers = rsp
+        nextvar = obj
+        while True:
+            reps = self.repetitions.current
+            start = time.monotonic()
+            errstr, errnum, erridx, answers = await snmp.bulk_cmd(
+                self.eng, self.authdata, tp, ctx, 0, reps, nextvar,
+                lookupMib=resolvemib)
             if errstr:
                 errstr = str(errstr)
                 finerr = errstr + ' while trying to connect to ' \
@@ -104,18 +173,32 @@ class Session(object):
                 if errstr in ('Unknown USM user', 'unknownUserName',
                                 'wrongDigest', 'Wrong SNMP PDU digest'):
                     raise exc.TargetEndpointBadCredentials(finerr)
+                if errstr == 'No SNMP response received before timeout':
+                    # Perhaps the response was too large to make it back
+                    if self.repetitions.failed():
+                        continue
                 # need to do bad credential versus timeout
                 raise exc.TargetEndpointUnreachable(finerr)
             elif errnum:
+                if int(errnum) == 1 and self.repetitions.failed():  # tooBig
+                    continue
+                if int(errnum) == 2:
+                    # noSuchName, an SNMPv1 style end of the walk
+                    return
                 raise exc.ConfluentException(errnum.prettyPrint() +
                                                 ' while trying to connect to '
                                                 '{0}'.format(self.server))
+            self.repetitions.succeeded(time.monotonic() - start, len(answers))
+            if not answers:
+                return
             for ans in answers:
-                if not obj[0].isPrefixOf(ans[0]):
+                if (not obj[0].isPrefixOf(ans[0]) or
+                        isinstance(ans[1], (snmp.Null, snmp.EndOfMibView))):
                     # PySNMP returns leftovers in a bulk command
                     # filter out such leftovers
-                    break
+                    return
                 yield ans
+            nextvar = (answers[-1][0], snmp.Null(''))
         #except snmperr.WrongValueError:
         #    raise exc.TargetEndpointBadCredentials('Invalid SNMPv3 password')
 
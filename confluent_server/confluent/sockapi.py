@@ -127,6 +127,9 @@ async def sessionhdl(connection, authname, skipauth=False, cert=None):
                                                     response['collective'])
             while not configmanager.config_is_ready():
                 await asyncio.sleep(1)
+            if 'dispatchchannel' in response:
+                return await pluginapi.handle_dispatch_channel(
+                    connection, cert, response['dispatchchannel']['name'])
             if 'dispatch' in response:
                 dreq = await tlvdata.recvall(
                     connection, response['dispatch']['length'])
@@ -0,0 +1,119 @@
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import unittest
+
+import confluent.config.configmanager as configmanager
+
+
+class AttributeIndexTestCase(unittest.TestCase):
+
+    def test_reindex_stale_node(self):
+        nodes = {'n1': {'location.rack': {'value': 'r1'}},
+                 'n2': {'location.rack': {'value': 'r2'}}}
+        index = configmanager._AttributeIndex(nodes)
+        index.refresh()
+        self.assertEqual(index.equals('location.rack', 'r1'), set(['n1']))
+        nodes['n2']['location.rack'] = {'value': 'r1'}
+        # Unchanged until the node is marked stale
+        self.assertEqual(index.equals('location.rack', 'r1'), set(['n1']))
+        index.stale.add('n2')
+        index.refresh()
+        self.assertEqual(index.equals('location.rack', 'r1'),
+                         set(['n1', 'n2']))
+        self.assertNotIn('r2', index.byattr['location.rack'])
+
+    def test_removed_node(self):
+        nodes = {'n1': {'location.rack': {'value': 'r1'}}}
+        index = configmanager._AttributeIndex(nodes)
+        index.refresh()
+        del nodes['n1']
+        index.stale.add('n1')
+        index.refresh()
+        self.assertEqual(index.equals('location.rack', 'r1'), set())
+        self.assertEqual(index.byattr, {})
+
+    def test_wildcard_and_search(self):
+        nodes = {'n1': {'net.eth0.hwaddr': {'value': 'aa'},
+                        'net.eth1.hwaddr': {'value': 'bb'},
+                        'groups': {'value': ['everything']}},
+                 'n2': {'net.eth0.hwaddr': {'value': 'bc'}}}
+        index = configmanager._AttributeIndex(nodes)
+        index.refresh()
+        self.assertEqual(index.equals('net.*.hwaddr', 'bb'), set(['n1']))
+        self.assertEqual(index.search('net.*.hwaddr', re.compile('^b')),
+                         set(['n1', 'n2']))
+        # Only string values are indexed
+        self.assertNotIn('groups', index.byattr)
+
+
+class FilterNodeAttributesTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        configmanager.init(stateless=True)
+        configmanager._attribindexes.clear()
+        self.cfg = configmanager.ConfigManager(None)
+        await self.cfg.add_group_attributes({'rack1': {}})
+        await self.cfg.add_node_attributes({
+            'n1': {'groups': ['rack1'], 'location.room': 'a'},
+            'n2': {'groups': [], 'location.room': 'a'},
+            'n3': {'groups': [], 'location.room': 'b'}})
+
+    def filtered(self, expression):
+        return set(self.cfg.filter_node_attributes(expression))
+
+    async def test_attribute_change(self):
+        self.assertEqual(self.filtered('location.room=a'), set(['n1', 'n2']))
+        await self.cfg.set_node_attributes({'n2': {'location.room': 'b'}})
+        self.assertEqual(self.filtered('location.room=a'), set(['n1']))
+        self.assertEqual(self.filtered('location.room=b'), set(['n2', 'n3']))
+        await self.cfg.clear_node_attributes(['n3'], ['location.room'])
+        self.assertEqual(self.filtered('location.room=b'), set(['n2']))
+        self.assertEqual(self.filtered('location.room=~^[ab]$'),
+                         set(['n1', 'n2']))
+
+    async def test_group_change(self):
+        self.assertEqual(self.filtered('location.rack=r7'), set())
+        await self.cfg.set_group_attributes({'rack1': {'location.rack': 'r7'}})
+        self.assertEqual(self.filtered('location.rack=r7'), set(['n1']))
+        await self.cfg.set_node_attributes({'n3': {'groups': ['rack1']}})
+        self.assertEqual(self.filtered('location.rack=r7'), set(['n1', 'n3']))
+        await self.cfg.set_node_attributes({'n1': {'groups': []}})
+        self.assertEqual(self.filtered('location.rack=r7'), set(['n3']))
+
+    async def test_expression_recalculated(self):
+        await self.cfg.set_group_attributes(
+            {'rack1': {'hardwaremanagement.manager': {
+                'expression': '{location.room}-bmc'}}})
+        self.assertEqual(self.filtered('hardwaremanagement.manager=a-bmc'),
+                         set(['n1']))
+        await self.cfg.set_node_attributes({'n1': {'location.room': 'c'}})
+        self.assertEqual(self.filtered('hardwaremanagement.manager=a-bmc'),
+                         set())
+        self.assertEqual(self.filtered('hardwaremanagement.manager=c-bmc'),
+                         set(['n1']))
+
+    async def test_node_changes(self):
+        self.assertEqual(self.filtered('location.room=a'), set(['n1', 'n2']))
+        await self.cfg.del_nodes(['n1'])
+        self.assertEqual(self.filtered('location.room=a'), set(['n2']))
+        await self.cfg.rename_nodes({'n2': 'n4'})
+        self.assertEqual(self.filtered('location.room=a'), set(['n4']))
+        await self.cfg.add_node_attributes({'n5': {'location.room': 'a'}})
+        self.assertEqual(self.filtered('location.room=a'), set(['n4', 'n5']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import confluent.config.journal as journal
+
+
+def _nodes(cfgstore):
+    return cfgstore['main']['nodes']
+
+
+class ConfigJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cfgdir = tempfile.mkdtemp()
+        self.journal = journal.ConfigJournal(self.cfgdir)
+        self.journal.write_snapshot(
+            {'main': {'nodes': {'n1': {'groups': {'value': ['a']}}}}}, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.cfgdir)
+
+    def reload(self):
+        return journal.ConfigJournal(self.cfgdir).load()
+
+    def append_node(self, node, value, txcount):
+        container = {node: value}
+        self.journal.append(
+            [journal.make_record(None, 'nodes', node, container)], txcount)
+
+    def test_replay(self):
+        self.append_node('n2', {'id.uuid': {'value': 'u2'}}, 6)
+        self.journal.append(
+            [journal.make_record(None, 'nodes', 'n1', {})], 7)
+        self.journal.append([journal.make_record(
+            None, 'globals', 'x', {'x': 1})], 8)
+        cfgstore, txcount = self.reload()
+        self.assertEqual(txcount, 8)
+        self.assertEqual(_nodes(cfgstore),
+                         {'n2': {'id.uuid': {'value': 'u2'}}})
+        self.assertEqual(cfgstore['globals'], {'x': 1})
+
+    def test_truncated_final_record(self):
+        self.append_node('n2', {'id.uuid': {'value': 'u2'}}, 6)
+        self.append_node('n3', {'id.uuid': {'value': 'u3'}}, 7)
+        jname = self.journal.journalname()
+        fullsize = os.path.getsize(jname)
+        with open(jname, 'r+b') as journalf:
+            journalf.truncate(fullsize - 3)
+        cfgstore, txcount = self.reload()
+        self.assertEqual(txcount, 6)
+        self.assertEqual(sorted(_nodes(cfgstore)), ['n1', 'n2'])
+        # The torn remnant is removed, so later batches can be read back
+        self.assertLess(os.path.getsize(jname), fullsize - 3)
+        self.append_node('n4', {}, 8)
+        cfgstore, txcount = self.reload()
+        self.assertEqual(txcount, 8)
+        self.assertEqual(sorted(_nodes(cfgstore)), ['n1', 'n2', 'n4'])
+
+    def test_corrupt_final_record(self):
+        self.append_node('n2', {}, 6)
+        self.append_node('n3', {}, 7)
+        jname = self.journal.journalname()
+        with open(jname, 'r+b') as journalf:
+            journalf.seek(-1, os.SEEK_END)
+            last = journalf.read(1)
+            journalf.seek(-1, os.SEEK_END)
+            journalf.write(bytes([last[0] ^ 0xff]))
+        cfgstore, txcount = self.reload()
+        self.assertEqual(txcount, 6)
+        self.assertEqual(sorted(_nodes(cfgstore)), ['n1', 'n2'])
+
+    def test_compaction(self):
+        self.append_node('n2', {}, 6)
+        oldjournal = self.journal.journalname()
+        cfgstore, txcount = self.reload()
+        self.journal.write_snapshot(cfgstore, txcount)
+        self.assertFalse(os.path.exists(oldjournal))
+        self.assertNotEqual(self.journal.journalname(), oldjournal)
+        self.append_node('n3', {}, 7)
+        cfgstore, txcount = self.reload()
+        self.assertEqual(txcount, 7)
+        self.assertEqual(sorted(_nodes(cfgstore)), ['n1', 'n2', 'n3'])
+
+    def test_stale_journal_ignored(self):
+        # A journal of the previous generation, as left by a crash between
+        # the snapshot rename and its removal, is not replayed
+        self.append_node('n2', {}, 6)
+        stale = self.journal.journalname()
+        with open(stale, 'rb') as journalf:
+            data = journalf.read()
+        self.journal.write_snapshot({'main': {'nodes': {}}}, 6)
+        with open(stale, 'wb') as journalf:
+            journalf.write(data)
+        cfgstore, txcount = self.reload()
+        self.assertEqual(_nodes(cfgstore), {})
+        self.assertEqual(txcount, 6)
+
+    def test_compact_threshold(self):
+        self.assertFalse(self.journal.needsnapshot)
+        self.addCleanup(setattr, journal, 'COMPACT_THRESHOLD',
+                        journal.COMPACT_THRESHOLD)
+        journal.COMPACT_THRESHOLD = 1
+        self.append_node('n2', {}, 6)
+        self.assertTrue(self.journal.needsnapshot)
+
+    def test_types_preserved(self):
+        value = {'s': set(['a']), 't': ('b', 1), 'f': frozenset(['c']),
+                 'raw': b'\x00\xff', 'n': None}
+        self.append_node('n2', value, 6)
+        cfgstore, _ = self.reload()
+        restored = _nodes(cfgstore)['n2']
+        self.assertEqual(restored, value)
+        self.assertIsInstance(restored['t'], tuple)
+        self.assertIsInstance(restored['s'], set)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright 2026 Lenovo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import confluent.config.configmanager as configmanager
+import confluent.noderange as noderange
+
+
+class ExpansionCacheTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        configmanager.init(stateless=True)
+        noderange._expansioncache.clear()
+        self.cfg = configmanager.ConfigManager(None)
+        await self.cfg.add_group_attributes({'compute': {}})
+        await self.cfg.add_node_attributes({
+            'n1': {'groups': ['compute'], 'location.room': 'a'},
+            'n2': {'groups': ['compute'], 'location.room': 'b'},
+            'n3': {'groups': [], 'location.room': 'a'}})
+
+    def expand(self, nr):
+        return noderange.NodeRange(nr, self.cfg).nodes
+
+    async def test_reused_while_unchanged(self):
+        self.assertEqual(self.expand('compute'), set(['n1', 'n2']))
+        key = (None, 'compute', False)
+        cached = noderange._expansioncache[key]
+        self.assertEqual(self.expand('compute'), set(['n1', 'n2']))
+        self.assertIs(noderange._expansioncache[key], cached)
+
+    async def test_attribute_change(self):
+        self.assertEqual(self.expand('location.room=a'), set(['n1', 'n3']))
+        await self.cfg.set_node_attributes({'n2': {'location.room': 'a'}})
+        self.assertEqual(self.expand('location.room=a'),
+                         set(['n1', 'n2', 'n3']))
+
+    async def test_group_change(self):
+        self.assertEqual(self.expand('compute'), set(['n1', 'n2']))
+        await self.cfg.set_node_attributes({'n3': {'groups': ['compute']}})
+        self.assertEqual(self.expand('compute'), set(['n1', 'n2', 'n3']))
+        await self.cfg.set_group_attributes({'compute': {'nodes': ['n1']}})
+        self.assertEqual(self.expand('compute'), set(['n1']))
+        await self.cfg.del_groups(['compute'])
+        with self.assertRaisesRegex(Exception, 'not a recognized node'):
+            self.expand('compute')
+
+    async def test_node_changes(self):
+        self.assertEqual(self.expand('everything'), set(['n1', 'n2', 'n3']))
+        await self.cfg.add_node_attributes({'n4': {'groups': []}})
+        self.assertEqual(self.expand('everything'),
+                         set(['n1', 'n2', 'n3', 'n4']))
+        await self.cfg.del_nodes(['n1'])
+        self.assertEqual(self.expand('everything'), set(['n2', 'n3', 'n4']))
+        await self.cfg.rename_nodes({'n2': 'n5'})
+        self.assertEqual(self.expand('everything'), set(['n3', 'n4', 'n5']))
+        self.assertEqual(self.expand('n3-n5'), set(['n3', 'n4', 'n5']))
+
+    async def test_configuration_replaced(self):
+        self.assertEqual(self.expand('compute'), set(['n1', 'n2']))
+        configmanager.init(stateless=True)
+        cfg = configmanager.ConfigManager(None)
+        await cfg.add_group_attributes({'compute': {}})
+        await cfg.add_node_attributes({'n9': {'groups': ['compute']}})
+        self.assertEqual(noderange.NodeRange('compute', cfg).nodes,
+                         set(['n9']))
+
+
+if __name__ == '__main__':
+    unittest.main()
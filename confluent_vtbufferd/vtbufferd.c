@@ -1,5 +1,6 @@
 #include <asm-generic/socket.h>
 #define _GNU_SOURCE
+#include <errno.h>
 #include <stdio.h>
 #include <string.h>
 #include <stdlib.h>
@@ -24,7 +25,16 @@ struct terment {
 #define WRITE 2
 #define READBUFF 0
 #define CLOSECONN 3
+// Data for the node named in the frame itself, so one connection may
+// interleave output for any number of nodes.  The payload is a byte giving
+// the length of the name, the name, and then the data
+#define NODEWRITE 4
+// Answered with PROTOVERSION, which an older daemon would not have done
+#define HELLO 5
+#define PROTOVERSION "\x01"
 #define MAXEVTS 16
+// Frames to handle from one connection before checking on the others
+#define MAXBATCH 64
 static struct terment *buffers[HASHSIZE];
 static char* nodenames[HASHSIZE];
 
@@ -51,9 +61,6 @@ TMT *set_termentbyname(char *name, int fd) {
     struct terment *ret;
     int idx;
 
-    if (nodenames[fd] == NULL) {
-        nodenames[fd] = strdup(name);
-    }
     idx = hash(name);
     for (ret = buffers[idx]; ret != NULL; ret = ret->next)
         if (strcmp(name, ret->name) == 0)
@@ -180,45 +187,86 @@ void dump_vt(TMT* outvt, int outfd) {
     //fflush(stdout);
 }
 
+int readfull(int fd, void *buf, size_t len) {
+    size_t done = 0;
+    ssize_t rc;
+
+    while (done < len) {
+        rc = read(fd, (char *)buf + done, len - done);
+        if (rc < 0 && errno == EINTR)
+            continue;
+        if (rc <= 0)
+            return -1;
+        done += rc;
+    }
+    return 0;
+}
+
+int feed_vt(int fd, TMT *vt, size_t length) {
+    char cmdbuf[MAXDATALEN];
+    size_t chunk;
+
+    while (length > 0) {
+        chunk = length < MAXDATALEN ? length : MAXDATALEN;
+        if (readfull(fd, cmdbuf, chunk) < 0)
+            return -1;
+        tmt_write(vt, cmdbuf, chunk);
+        length -= chunk;
+    }
+    return 0;
+}
+
 int handle_traffic(int fd) {
-    int cmd, length;
+    unsigned int cmd, length;
+    unsigned char namelen;
     char currnode[MAXNAMELEN];
     char cmdbuf[MAXDATALEN];
-    char *nodename;
     TMT *currvt = NULL;
     TMT *outvt = NULL;
-    length = read(fd, &cmd, 4);
-    if (length <= 0) {
+    if (readfull(fd, &cmd, 4) < 0) {
         return 0;
     }
     length = cmd & 536870911;
     cmd = cmd >> 29;
     if (cmd == SETNODE) {
-        cmd = read(fd, currnode, length);
+        if (length >= MAXNAMELEN || readfull(fd, currnode, length) < 0)
+            return 0;
         currnode[length] = 0;
-        if (cmd < 0)
+        if (nodenames[fd] != NULL)
+            free(nodenames[fd]);
+        nodenames[fd] = strdup(currnode);
+        set_termentbyname(currnode, fd);
+    } else if (cmd == WRITE) {
+        if (nodenames[fd] == NULL)
+            return 0;
+        currvt = set_termentbyname(nodenames[fd], fd);
+        if (feed_vt(fd, currvt, length) < 0)
+            return 0;
+    } else if (cmd == NODEWRITE) {
+        if (length < 1 || readfull(fd, &namelen, 1) < 0)
             return 0;
+        length -= 1;
+        if (namelen >= MAXNAMELEN || namelen > length ||
+                readfull(fd, currnode, namelen) < 0)
+            return 0;
+        currnode[namelen] = 0;
+        length -= namelen;
         currvt = set_termentbyname(currnode, fd);
-    } else if (cmd == WRITE) {
-        if (currvt == NULL) {
-            nodename = nodenames[fd];
-            currvt = set_termentbyname(nodename, fd);
-        }
-        cmd = read(fd, cmdbuf, length);
-        cmdbuf[length] = 0;
-        if (cmd < 0)
+        if (feed_vt(fd, currvt, length) < 0)
             return 0;
-        tmt_write(currvt, cmdbuf, length);
     } else if (cmd == READBUFF) {
-        cmd = read(fd, cmdbuf, length);
-        cmdbuf[length] = 0;
-        if (cmd < 0)
+        if (length >= MAXDATALEN || readfull(fd, cmdbuf, length) < 0)
             return 0;
+        cmdbuf[length] = 0;
         outvt = get_termentbyname(cmdbuf);
         if (outvt != NULL)
             dump_vt(outvt, fd);
-        length = write(fd, "\x00", 1);
-        if (length < 0)
+        if (write(fd, "\x00", 1) < 0)
+            return 0;
+    } else if (cmd == HELLO) {
+        if (length != 0)
+            return 0;
+        if (write(fd, PROTOVERSION, 1) < 0)
             return 0;
     } else if (cmd == CLOSECONN) {
         return 0;
@@ -232,7 +280,8 @@ int main(int argc, char* argv[]) {
     int numevts;
     int status;
     int poller;
-    int n, rt;
+    int n, rt, frames;
+    char peek;
     socklen_t len;
     int ctlsock = 0;
     int currsock = 0;
@@ -270,6 +319,8 @@ int main(int argc, char* argv[]) {
     while (1) {
         numevts = epoll_wait(poller, evts, MAXEVTS, -1);
         if (numevts < 0) {
+            if (errno == EINTR)
+                continue;
             perror("Failed wait");
             exit(1);
         }
@@ -291,13 +342,20 @@ int main(int argc, char* argv[]) {
                 epvt.data.fd = currsock;
                 epoll_ctl(poller, EPOLL_CTL_ADD, currsock, &epvt);
             } else {
-                if (!handle_traffic(evts[n].data.fd)) {
-                    epoll_ctl(poller, EPOLL_CTL_DEL, evts[n].data.fd, NULL);
-                    close(evts[n].data.fd);
-                    if (nodenames[evts[n].data.fd] != NULL) {
-                        free(nodenames[evts[n].data.fd]);
-                        nodenames[evts[n].data.fd] = NULL;
+                // A long lived connection pipelines its frames, so take
+                // what is already waiting rather than one per wakeup
+                for (frames = 0; frames < MAXBATCH; ++frames) {
+                    if (!handle_traffic(evts[n].data.fd)) {
+                        epoll_ctl(poller, EPOLL_CTL_DEL, evts[n].data.fd, NULL);
+                        close(evts[n].data.fd);
+                        if (nodenames[evts[n].data.fd] != NULL) {
+                            free(nodenames[evts[n].data.fd]);
+                            nodenames[evts[n].data.fd] = NULL;
+                        }
+                        break;
                     }
+                    if (recv(evts[n].data.fd, &peek, 1, MSG_PEEK | MSG_DONTWAIT) <= 0)
+                        break;
                 }
             }
         }